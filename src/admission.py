@@ -0,0 +1,94 @@
+'''
+Batch admission of requests. Given the candidate paths of all requests, with the link instances
+each one needs, chooses at most one candidate per request so that the sum of utilities of
+admitted requests is maximum and link capacities are not exceeded.
+'''
+
+#Maximum number of combinations of candidates solved with the exact method
+BATCH_EXACT_LIMIT = 100000
+
+def plan_admission(options, utilities, capacity):
+    '''
+    Chooses the candidate path of each request. Small problems are solved exactly (branch and bound)
+    and large problems with a greedy heuristic.
+    Input:
+        - options: list with, for each request, the list of candidates. Each candidate is a dictionary
+            with the instances needed of each link
+        - utilities: list with the utility of each request
+        - capacity: dictionary with the available instances of each link
+    Output:
+        - list with, for each request, the index of the chosen candidate or None if not admitted
+    '''
+    combinations = 1
+    for request_options in options:
+        combinations *= len(request_options) + 1
+        if combinations > BATCH_EXACT_LIMIT:
+            return(_greedy_plan(options, utilities, capacity))
+    return(_exact_plan(options, utilities, capacity))
+
+def _fits(links, capacity):
+    '''
+    Checks if the link instances needed by a candidate are available
+    '''
+    for link, instances in links.items():
+        if capacity.get(link, 0) < instances:
+            return(False)
+    return(True)
+
+def _exact_plan(options, utilities, capacity):
+    '''
+    Branch and bound over all combinations of candidates. Among plans with the same utility,
+    the one using fewer link instances is chosen, and then the one found first (candidates in order)
+    '''
+    capacity = dict(capacity)
+    #Maximum utility that can be added from each request on
+    remaining = [0] * (len(options) + 1)
+    for position in range(len(options) - 1, -1, -1):
+        remaining[position] = remaining[position + 1] + (utilities[position] if len(options[position]) > 0 else 0)
+
+    best = {'utility': -1, 'instances': 0, 'plan': [None] * len(options)}
+    plan = []
+
+    def search(position, utility, instances):
+        if utility + remaining[position] < best['utility']:
+            return
+        if position == len(options):
+            if utility > best['utility'] or (utility == best['utility'] and instances < best['instances']):
+                best['utility'] = utility
+                best['instances'] = instances
+                best['plan'] = list(plan)
+            return
+
+        for index, links in enumerate(options[position]):
+            if _fits(links, capacity):
+                for link, needed in links.items():
+                    capacity[link] -= needed
+                plan.append(index)
+                search(position + 1, utility + utilities[position], instances + sum(links.values()))
+                plan.pop()
+                for link, needed in links.items():
+                    capacity[link] += needed
+        #Request not admitted
+        plan.append(None)
+        search(position + 1, utility, instances)
+        plan.pop()
+
+    search(0, 0, 0)
+    return(best['plan'])
+
+def _greedy_plan(options, utilities, capacity):
+    '''
+    Admits requests by decreasing utility (configuration order for the same utility), each one with
+    its first candidate that fits in the remaining capacity
+    '''
+    capacity = dict(capacity)
+    plan = [None] * len(options)
+    order = sorted(range(len(options)), key=lambda position: -utilities[position])
+    for position in order:
+        for index, links in enumerate(options[position]):
+            if _fits(links, capacity):
+                for link, needed in links.items():
+                    capacity[link] -= needed
+                plan[position] = index
+                break
+    return(plan)
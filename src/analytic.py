@@ -0,0 +1,283 @@
+import numpy as np
+
+'''
+Analytic models used by the network hypervisor in order to speed up routing calculations.
+Bell diagonal states are represented by the vector of coefficients [I, X, Y, Z], that is,
+the probability of the target EPR being affected by each Pauli error.
+'''
+
+#Maximum number of purification rounds evaluated by the planner
+MAX_PLANNED_PURIF_ROUNDS = 20
+#Fidelity margin below minfidelity before considering a request hopeless
+PLANNER_FIDELITY_MARGIN = 0.01
+#Factor over maxtime of the predicted time before considering a request hopeless
+PLANNER_TIME_MARGIN = 2
+
+def werner_state(fidelity):
+    '''
+    Bell diagonal coefficients of a Werner state
+    Input:
+        - fidelity: fidelity of the state with the target EPR
+    Output:
+        - numpy array with coefficients [I, X, Y, Z]
+    '''
+    return(np.array([fidelity, (1 - fidelity)/3, (1 - fidelity)/3, (1 - fidelity)/3]))
+
+def source_state(fidelity):
+    '''
+    Bell diagonal coefficients of the pairs emitted by link sources: the target EPR with probability
+    fidelity (source_fidelity_sq) and otherwise one of the four computational basis states, whose 
+    uniform mixture is the maximally mixed state
+    Input:
+        - fidelity: probability of emitting the target EPR
+    Output:
+        - numpy array with coefficients [I, X, Y, Z]
+    '''
+    return(np.array([(1 + 3*fidelity)/4, (1 - fidelity)/4, (1 - fidelity)/4, (1 - fidelity)/4]))
+
+def dejmps_step(kept, fresh):
+    '''
+    DEJMPS purification of two Bell diagonal states, as done by DistilProtocol
+    Input:
+        - kept: coefficients [I, X, Y, Z] of the pair that is kept
+        - fresh: coefficients [I, X, Y, Z] of the pair that is measured
+    Output:
+        - coefficients of the kept pair if purification succeeds
+        - probability of success
+    '''
+    i1, x1, y1, z1 = kept
+    i2, x2, y2, z2 = fresh
+    success = (i1 + y1)*(i2 + y2) + (x1 + z1)*(x2 + z2)
+    state = np.array([i1*i2 + y1*y2,
+                      x1*x2 + z1*z2,
+                      x1*z2 + z1*x2,
+                      i1*y2 + y1*i2]) / success
+    return(state, success)
+
+def purification_predictions(fidelity, time, max_rounds=MAX_PLANNED_PURIF_ROUNDS):
+    '''
+    Predicts fidelity and time of the path for each number of purification rounds.
+    RouteProtocol purifies by pumping: with n purification rounds, n+1 DEJMPS steps are
+    executed, the first one with two new pairs and the rest with a new pair each.
+    If any step fails purification starts again.
+    Index n of the result corresponds to n purification rounds (n+1 DEJMPS steps for n > 0)
+    Input:
+        - fidelity: measured fidelity without purification (assumed Werner state)
+        - time: measured mean time to generate a pair without purification
+        - max_rounds: maximum number of purification rounds to predict
+    Output:
+        - list with [fidelity, time] for 0 to max_rounds purification rounds
+    '''
+    predictions = [[fidelity, time]]
+    pair = werner_state(fidelity)
+    #First step, with two pairs generated in parallel
+    state, success = dejmps_step(pair, pair)
+    expected_time = time / success
+    for purif_rounds in range(1, max_rounds + 1):
+        #Pumping step with a new pair. Expected time of k consecutive successful steps,
+        # restarting from the beginning when a step fails: E_k = (E_k-1 + time) / success_k
+        state, success = dejmps_step(state, pair)
+        expected_time = (expected_time + time) / success
+        predictions.append([state[0], expected_time])
+    return(predictions)
+
+def swapped_fidelity(fidelities):
+    '''
+    Fidelity of the end to end pair obtained by entanglement swapping of Werner states
+    Input:
+        - fidelities: list with the fidelity of each link
+    Output:
+        - estimated end to end fidelity
+    '''
+    werner_parameter = np.prod([(4*fidelity - 1)/3 for fidelity in fidelities])
+    return((1 + 3*werner_parameter)/4)
+
+def reachable_fidelity(fidelity, max_rounds=MAX_PLANNED_PURIF_ROUNDS):
+    '''
+    Maximum fidelity that can be reached purifying pairs of the given fidelity (assumed Werner states)
+    Input:
+        - fidelity: fidelity without purification
+        - max_rounds: maximum number of purification rounds to consider
+    Output:
+        - maximum predicted fidelity with 0 to max_rounds purification rounds
+    '''
+    predictions = purification_predictions(fidelity, 1, max_rounds)
+    return(max([prediction[0] for prediction in predictions]))
+
+def link_success_probability(p_loss_init, p_loss_length, distance):
+    '''
+    Probability that a qubit is not lost in a link with FibreLossModel
+    Input:
+        - p_loss_init: probability of loss when entering the fibre
+        - p_loss_length: attenuation of the fibre (dB/km)
+        - distance: length of the link (km)
+    Output:
+        - probability of success
+    '''
+    return((1 - p_loss_init) * 10**(-p_loss_length * distance / 10))
+
+def plan_purification(fidelity, time, minfidelity, maxtime, max_rounds=MAX_PLANNED_PURIF_ROUNDS):
+    '''
+    Predicts the minimum number of purification rounds that fulfills minfidelity.
+    Input:
+        - fidelity, time: measured fidelity and mean time without purification
+        - minfidelity, maxtime: request requirements
+        - max_rounds: maximum number of purification rounds to consider
+    Output:
+        - number of purification rounds (at least 1) or None if the request is clearly hopeless:
+            fidelity cannot be reached or time is clearly above maxtime
+    '''
+    predictions = purification_predictions(fidelity, time, max_rounds)
+    for purif_rounds in range(1, max_rounds + 1):
+        pred_fidelity, pred_time = predictions[purif_rounds]
+        if pred_fidelity >= minfidelity:
+            return(purif_rounds if pred_time <= PLANNER_TIME_MARGIN * maxtime else None)
+
+    #Fidelity is not reached. Simulate the best case if it is close enough
+    best_rounds = max(range(1, max_rounds + 1), key=lambda rounds: predictions[rounds][0])
+    if predictions[best_rounds][0] >= minfidelity - PLANNER_FIDELITY_MARGIN and \
+        predictions[best_rounds][1] <= PLANNER_TIME_MARGIN * maxtime:
+        return(best_rounds)
+    return(None)
+
+def noise_probability(noise, duration=0):
+    '''
+    Probability of error of a noise applied to a qubit
+    Input:
+        - noise: tuple (kind, value). Kinds: 'depolar' or 'dephase' with value the rate (Hz), applied 
+            during duration as in NetSquid time dependent models, or 'depolar_prob' with value the probability
+        - duration: time (nanoseconds) the noise is applied
+    Output:
+        - probability of error
+    '''
+    kind, value = noise
+    if kind == 'depolar_prob':
+        return(value)
+    return(1 - np.exp(-duration * 1e-9 * value))
+
+def apply_noise(state, noise, duration=0):
+    '''
+    Applies noise to one qubit of a Bell diagonal pair.
+    Depolarizing one qubit with probability p gives (1-p)state + p I/4. Dephasing one qubit 
+    with probability p applies Z with probability p, which exchanges I with Z and X with Y
+    Input:
+        - state: coefficients [I, X, Y, Z]
+        - noise: tuple (kind, value), see noise_probability. If None, no noise is applied
+        - duration: time (nanoseconds) the noise is applied
+    Output:
+        - coefficients of the pair after the noise
+    '''
+    if noise is None:
+        return(state)
+    prob = noise_probability(noise, duration)
+    if noise[0] == 'dephase':
+        return((1 - prob) * state + prob * state[[3, 2, 1, 0]])
+    return((1 - prob) * state + prob / 4)
+
+def swap_states(state1, state2):
+    '''
+    Entanglement swapping with perfect Bell measurement and corrections: Pauli errors of both
+    pairs are composed.
+    Input:
+        - state1, state2: coefficients [I, X, Y, Z] of the pairs
+    Output:
+        - coefficients of the resulting pair
+    '''
+    #Pauli errors as (x, z) bits: I=(0,0), X=(1,0), Y=(1,1), Z=(0,1)
+    bits = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    state = np.zeros(4)
+    for i, (x1, z1) in enumerate(bits):
+        for j, (x2, z2) in enumerate(bits):
+            state[bits.index((x1 ^ x2, z1 ^ z2))] += state1[i] * state2[j]
+    return(state)
+
+def _generate_pair(model, rng):
+    '''
+    Samples the end to end pair generation in a path without purification
+    Output:
+        - coefficients of the pair and generation time
+    '''
+    attempts = rng.geometric(model['success']) if model['success'] < 1 else 1
+    time = (attempts - 1) * model['timeout'] + model['delay']
+    state = None
+    for link in model['links']:
+        pair = source_state(link['source_fidelity'])
+        for noise in link['channel']:
+            pair = apply_noise(pair, noise, link['delay'])
+        #Qubits wait in memory until the end to end pair is ready
+        wait = model['delay'] - link['delay']
+        pair = apply_noise(pair, link['memory'][0], wait)
+        pair = apply_noise(pair, link['memory'][1], wait)
+        state = pair if state is None else swap_states(state, pair)
+    for noise, duration in model['swaps']:
+        #Noise in both measured qubits, transferred to the resulting pair
+        state = apply_noise(apply_noise(state, noise, duration), noise, duration)
+    state = apply_noise(state, model['correction'][0], model['correction'][1])
+    return(state, time)
+
+def _wait_pair(state, model, duration):
+    '''
+    Applies memory noise of the end nodes to a pair during a time
+    '''
+    return(apply_noise(apply_noise(state, model['end_memory'][0], duration), model['end_memory'][1], duration))
+
+def _distil(kept, fresh, model):
+    '''
+    DEJMPS step including gate noise in the end nodes
+    '''
+    for noise, duration in model['distil']:
+        kept = apply_noise(kept, noise, duration)
+        fresh = apply_noise(fresh, noise, duration)
+    return(dejmps_step(kept, fresh))
+
+def sample_path(model, purif_rounds, num_runs, rng, stop_rule=None):
+    '''
+    Estimates fidelity and generation time of a path propagating Bell diagonal states, as an
+    alternative to the simulation of the path. Each round samples the number of generation attempts
+    (photon losses) and the result of each purification step.
+    With purification, as done by RouteProtocol, purif_rounds + 1 DEJMPS steps are executed: the first
+    one with two pairs generated in parallel and the rest with a new pair each. If a step fails 
+    purification starts again.
+    Input:
+        - model: dictionary with the Bell diagonal description of the path (see NetworkManager)
+        - purif_rounds: number of purification rounds
+        - num_runs: number of rounds
+        - rng: numpy random generator
+        - stop_rule: if defined, object with method add(fidelity, time) returning True when no more
+            rounds are needed
+    Output:
+        - dictionary with lists of fidelity and time of each round
+    '''
+    fidelities = []
+    times = []
+    for run in range(num_runs):
+        if purif_rounds == 0:
+            state, time = _generate_pair(model, rng)
+        else:
+            time = 0
+            purified = False
+            while not purified:
+                kept, time_kept = _generate_pair(model, rng)
+                fresh, time_fresh = _generate_pair(model, rng)
+                #First pair waits for the second one
+                if time_kept < time_fresh:
+                    kept = _wait_pair(kept, model, time_fresh - time_kept)
+                else:
+                    fresh = _wait_pair(fresh, model, time_kept - time_fresh)
+                time += max(time_kept, time_fresh) + model['distil_delay']
+                kept, success = _distil(kept, fresh, model)
+                purified = rng.random() < success
+                step = 1
+                while purified and step <= purif_rounds:
+                    fresh, time_fresh = _generate_pair(model, rng)
+                    kept = _wait_pair(kept, model, time_fresh + model['distil_delay'])
+                    time += time_fresh + model['distil_delay']
+                    kept, success = _distil(kept, fresh, model)
+                    purified = rng.random() < success
+                    step += 1
+            state = kept
+        fidelities.append(state[0])
+        times.append(time)
+        if stop_rule is not None and stop_rule.add(state[0], time):
+            break
+    return({'Fidelity': fidelities, 'time': times})
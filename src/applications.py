@@ -11,7 +11,9 @@ from protocols import RouteProtocol
 from netsquid.qubits import set_qstate_formalism, QFormalism
 from netsquid.components.instructions import INSTR_MEASURE_BELL, INSTR_CNOT, INSTR_CCX, INSTR_H
 from netsquid.components import QuantumProgram
-from protocols import SwapCorrectProgram
+from pydynaa import EventExpression
+from protocols import SwapCorrectProgram, forward_message
+from functools import partial
 from network import ClassicalConnection
 from netsquid.components.models.delaymodels import FixedDelayModel, FibreDelayModel, GaussianDelayModel
 import cmath
@@ -82,17 +84,22 @@ class CapacityApplication(GeneralApplication):
         mem_posA_1 = self._networkmanager.get_mem_position(self._path['nodes'][0],first_link.split('-')[0],first_link.split('-')[1])
         mem_posB_1 = self._networkmanager.get_mem_position(self._path['nodes'][-1],last_link.split('-')[0],last_link.split('-')[1])
 
+        #Expressions awaited in every round are built once
+        evexpr_route = self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
+
         while True:
             start_time = sim_time()
             #Send signal for entanglement generation
             self.send_signal(self._ent_request)
 
             #Wait for  entanglement to be generated on both ends
-            yield self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
+            yield evexpr_route
 
             #Measure fidelity and send metrics to datacollector
             #if self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory.busy:
             #    yield self.await_program(self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory)
+            self._networkmanager.network.get_node(self._path['nodes'][0]).apply_pauli_frame(mem_posA_1)
+            self._networkmanager.network.get_node(self._path['nodes'][-1]).apply_pauli_frame(mem_posB_1)
             qa, = self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory.pop(positions=[mem_posA_1])
             qb, = self._networkmanager.network.get_node(self._path['nodes'][-1]).qmemory.pop(positions=[mem_posB_1])
             
@@ -126,7 +133,8 @@ class TeleportationApplication(GeneralApplication):
 
         mem_posB_1 = self._networkmanager.get_mem_position(self._path['nodes'][-1],self._path['comms'][-1]['links'][0].split('-')[0],0)
         #mem_posB_1=0
-        self.add_subprotocol(TeleportCorrectProtocol(networkmanager.network.get_node(path['nodes'][-1]),mem_posB_1,f"TeleportCorrectProtocol_{path['request']}",path['request'],epr_pair))
+        self.add_subprotocol(TeleportCorrectProtocol(networkmanager.network.get_node(path['nodes'][-1]),mem_posB_1,f"TeleportCorrectProtocol_{path['request']}",path['request'],epr_pair,
+                                                      pauli_frame=networkmanager.get_config('correction_mode','correction_mode') == 'pauli_frame'))
 
         self._build_teleport_classic()
 
@@ -143,8 +151,8 @@ class TeleportationApplication(GeneralApplication):
 
             #Get classical channel delay model
             classical_delay_model = None
-            fibre_delay_model = self._networkmanager.get_config('links',link, 'classical_delay_model')
-            if fibre_delay_model == 'NOT_FOUND' or fibre_delay_model == 'FibreDelayModel':
+            fibre_delay_model = self._networkmanager.get_config('links',link,'classical_delay_model')
+            if fibre_delay_model == 'FibreDelayModel':
                 classical_delay_model = FibreDelayModel(c=float(self._networkmanager.get_config('links',link,'photon_speed_fibre')))
             elif fibre_delay_model == 'GaussianDelayModel':
                 classical_delay_model = GaussianDelayModel(delay_mean=float(self._networkmanager.get_config('links',link,'gaussian_delay_mean')),
@@ -166,7 +174,12 @@ class TeleportationApplication(GeneralApplication):
 
             #Forward cconn to right most node
             if f"ccon_L_{self._path['nodes'][nodepos]}_{self._path['request']}_teleport" in self._networkmanager.network.get_node(self._path['nodes'][nodepos]).ports:
-                self._networkmanager.network.get_node(self._path['nodes'][nodepos]).ports[f"ccon_L_{self._path['nodes'][nodepos]}_{self._path['request']}_teleport"].bind_input_handler(self._handle_message,tag_meta=True)    
+                if self._networkmanager.get_config('classical_forwarding','classical_forwarding') == 'table':
+                    #Output port is resolved once, messages are not parsed in each hop
+                    self._networkmanager.network.get_node(self._path['nodes'][nodepos]).ports[f"ccon_L_{self._path['nodes'][nodepos]}_{self._path['request']}_teleport"].bind_input_handler(
+                        partial(forward_message, port=self._networkmanager.network.get_node(self._path['nodes'][nodepos]).ports[port_name]))
+                else:
+                    self._networkmanager.network.get_node(self._path['nodes'][nodepos]).ports[f"ccon_L_{self._path['nodes'][nodepos]}_{self._path['request']}_teleport"].bind_input_handler(self._handle_message,tag_meta=True)    
 
     def _handle_message(self,msg):
         input_port = msg.meta['rx_port_name']
@@ -213,7 +226,20 @@ class TeleportationApplication(GeneralApplication):
         if self._app == 'TeleportationWithDemand':
             teleport_strategy = self._networkmanager.get_config('nodes',self._path['nodes'][0],'teleport_strategy')
 
+        #Expressions awaited in every round are built once
+        evexpr_route = self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
+        evexpr_teleported = self.await_signal(self.subprotocols[f"TeleportCorrectProtocol_{self._path['request']}"],Signals.SUCCESS)
+        if self._app == 'TeleportationWithDemand':
+            evexpr_enqueued = EventExpression(source=first_node, event_type=first_node.state_enqueued())
+
         while True:
+            #Qubit to teleport is stored in position 2, which is freed by the Bell measurement of the
+            # previous teleportation. Wait for that program before taking a new state
+            while mem_posTeleport not in first_node.qmemory.unused_positions:
+                if not first_node.qmemory.busy:
+                    #No program will free the position
+                    raise ValueError(f"{first_node.name}: memory position {mem_posTeleport} is occupied and no program is running")
+                yield self.await_program(first_node.qmemory)
         
             if self._app in ['Teleportation','QBER']:
                 #No demand, we'll request as soon as the is a slot
@@ -236,10 +262,9 @@ class TeleportationApplication(GeneralApplication):
                     # but also qubit is updated with the retrieved qubit
                     [state, qubit[0]] = first_node.retrieve_teleport(teleport_strategy)
 
-                    #If no qubit to transmit, wait 1000 nanoseconds
                     if state is None:
-                        #Wait for a qubit to be ready for teleportation
-                        yield self.await_timer(1000)
+                        #Wait for the demand generator to enqueue a state
+                        yield evexpr_enqueued
                     else:
                         #We have a qubit ready for teleportation
                         waiting_state = False
@@ -283,97 +308,94 @@ class TeleportationApplication(GeneralApplication):
             #Start time measurement
             start_time = sim_time()
 
-            #If position is not being used, we can store the qubit
-            if 2 in self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory.unused_positions:
-                #store qubit un memory position
-                first_node.qmemory.put(qubit, 2, replace = False)
+            #store qubit un memory position
+            first_node.qmemory.put(qubit, mem_posTeleport, replace = False)
  
-                #Request entanglement to RouteProtocol
-                self.send_signal(self._ent_request)
-                
-                #Wait for  entanglement to be generated on both ends
-                yield self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
-                
-                #Measure in Bell basis positions 0 and 2
-                yield first_node.qmemory.execute_program(self._program, qubit_mapping=[mem_posTeleport,mem_posA_1])
-                m, = self._program.output["m"]
+            #Request entanglement to RouteProtocol
+            self.send_signal(self._ent_request)
+            
+            #Wait for  entanglement to be generated on both ends
+            yield evexpr_route
+            
+            #Measure in Bell basis positions 0 and 2
+            yield first_node.qmemory.execute_program(self._program, qubit_mapping=[mem_posTeleport,mem_posA_1])
+            m, = self._program.output["m"]
+            
+            # Send result to right node on end
+            first_node.ports[f"ccon_R_{self._path['nodes'][0]}_{self._path['request']}_teleport"].tx_output(Message(m))
+
+            #Wait for Teleportation to complete
+            yield evexpr_teleported
+
+            last_node.apply_pauli_frame(0)
+            result_qubit, = last_node.qmemory.pop(0)
+
+            if self._app in ['Teleportation']:
+                fid = qapi.fidelity(result_qubit, state, squared = True)
+                qapi.discard(result_qubit)
+                result = {
+                    'posA': mem_posA_1,
+                    'posB': mem_posB_1,
+                    'Fidelity': fid,
+                    'time': sim_time() - start_time
+                }
+
+            elif self._app in ['TeleportationWithDemand']:
+                fid = qapi.fidelity(result_qubit, state, squared = True)
+                qapi.discard(result_qubit)
+                result = {
+                    'posA': mem_posA_1,
+                    'posB': mem_posB_1,
+                    'Fidelity': fid,
+                    'time': sim_time() - start_time,
+                    'queue_size': first_node.get_queue_size(),
+                    'discarded_qubits': first_node.get_discarded()
+                }
+
+            elif self._app == 'QBER':
+                #In result_qubit the teleported one
+                assign_qstate(original_qubit, state)
+
+                #Measure original qubit and teleported one in Z basis and compare
+                m_origin,prob_or = qapi.measure(original_qubit[0])
+                m_res,prob_res = qapi.measure(result_qubit)
+                error = 1 if m_origin != m_res else 0
+
+                qapi.discard(result_qubit)
+                result = {
+                    'error': error,
+                    'time': sim_time() - start_time
+                }
                 
-                # Send result to right node on end
-                first_node.ports[f"ccon_R_{self._path['nodes'][0]}_{self._path['request']}_teleport"].tx_output(Message(m))
-
-                #Wait for Teleportation to complete
-                yield self.await_signal(self.subprotocols[f"TeleportCorrectProtocol_{self._path['request']}"],Signals.SUCCESS)
-
-                result_qubit, = last_node.qmemory.pop(0)
-
-                if self._app in ['Teleportation']:
-                    fid = qapi.fidelity(result_qubit, state, squared = True)
-                    qapi.discard(result_qubit)
-                    result = {
-                        'posA': mem_posA_1,
-                        'posB': mem_posB_1,
-                        'Fidelity': fid,
-                        'time': sim_time() - start_time
-                    }
-
-                elif self._app in ['TeleportationWithDemand']:
+            elif self._app == 'LogicalTeleportation':
+                if logical_qubit_pos == 9:
+                    #Get last teleported qubit
+                    last_node.qmemory.put(result_qubit, logical_qubit_pos+3, replace = True)
+                    
+                    #Apply decoding circuit
+                    yield last_node.qmemory.execute_program(decodingprogram, qubit_mapping=[4,5,6,7,8,9,10,11,12])
+                    
+                    #Get qubit in position 4, whith decoded state
+                    result_qubit, = last_node.qmemory.pop(4)
+                    
+                    #Measure fidelity with respect to original state
                     fid = qapi.fidelity(result_qubit, state, squared = True)
                     qapi.discard(result_qubit)
                     result = {
                         'posA': mem_posA_1,
                         'posB': mem_posB_1,
                         'Fidelity': fid,
-                        'time': sim_time() - start_time,
-                        'queue_size': first_node.get_queue_size(),
-                        'discarded_qubits': first_node.get_discarded()
+                        'time': sim_time() - logical_start_time
                     }
-    
-                elif self._app == 'QBER':
-                    #In result_qubit the teleported one
-                    assign_qstate(original_qubit, state)
+                    #Prepare for next logical qubit
+                    coded_qubit = False
+                else: #Nothing to do, must teleport next physical qubit
+                    #get qubit in position 0 an move it to memory position for decoding
+                    last_node.qmemory.put(result_qubit, logical_qubit_pos+3, replace = True)
+                    continue #do not execute send_signal to datacollector yet
 
-                    #Measure original qubit and teleported one in Z basis and compare
-                    m_origin,prob_or = qapi.measure(original_qubit[0])
-                    m_res,prob_res = qapi.measure(result_qubit)
-                    error = 1 if m_origin != m_res else 0
-
-                    qapi.discard(result_qubit)
-                    result = {
-                        'error': error,
-                        'time': sim_time() - start_time
-                    }
-                    
-                elif self._app == 'LogicalTeleportation':
-                    if logical_qubit_pos == 9:
-                        #Get last teleported qubit
-                        last_node.qmemory.put(result_qubit, logical_qubit_pos+3, replace = True)
-                        
-                        #Apply decoding circuit
-                        yield last_node.qmemory.execute_program(decodingprogram, qubit_mapping=[4,5,6,7,8,9,10,11,12])
-                        
-                        #Get qubit in position 4, whith decoded state
-                        result_qubit, = last_node.qmemory.pop(4)
-                        
-                        #Measure fidelity with respect to original state
-                        fid = qapi.fidelity(result_qubit, state, squared = True)
-                        qapi.discard(result_qubit)
-                        result = {
-                            'posA': mem_posA_1,
-                            'posB': mem_posB_1,
-                            'Fidelity': fid,
-                            'time': sim_time() - logical_start_time
-                        }
-                        #Prepare for next logical qubit
-                        coded_qubit = False
-                    else: #Nothing to do, must teleport next physical qubit
-                        #get qubit in position 0 an move it to memory position for decoding
-                        last_node.qmemory.put(result_qubit, logical_qubit_pos+3, replace = True)
-                        continue #do not execute send_signal to datacollector yet
-
-                #send result to datacollector
-                self.send_signal(Signals.SUCCESS, result) 
-            else:
-                self.await_timer(1000)
+            #send result to datacollector
+            self.send_signal(Signals.SUCCESS, result) 
 
 class DemandGeneratorProtocol(NodeProtocol):
     '''
@@ -423,13 +445,17 @@ class TeleportCorrectProtocol(NodeProtocol):
         Node this protocol runs on.
     num_nodes : int
         Number of nodes in the repeater chain network.
+    pauli_frame : bool
+        If True, corrections are added to the ones recorded in the node for the qubit instead of
+        being applied with a quantum program
 
     """
-    def __init__(self, node, mempos, name, request,epr_state):
+    def __init__(self, node, mempos, name, request,epr_state,pauli_frame=False):
         super().__init__(node, name)
         self._mempos = mempos
         self._request = request
         self._epr_state = epr_state
+        self._pauli_frame = pauli_frame
 
         self._x_corr = 0
         self._z_corr = 0
@@ -440,15 +466,16 @@ class TeleportCorrectProtocol(NodeProtocol):
     def run(self):
         qubit_ready = False
         corrections = 0
+        port = self.node.ports[f"ccon_L_{self.node.name}_{self._request}_teleport"]
+        evexpr_input = self.await_port_input(port) | self.await_port_input(self.node.qmemory.ports[f"qin{self._mempos}"])
         
         while True:
             message = None
             #Wait for a classical signal to arrive and a qubit at the destination memory
-            expr = yield self.await_port_input(self.node.ports[f"ccon_L_{self.node.name}_{self._request}_teleport"]) | \
-                self.await_port_input(self.node.qmemory.ports[f"qin{self._mempos}"])
+            expr = yield evexpr_input
                 
             if expr.first_term.value:
-                message = self.node.ports[f"ccon_L_{self.node.name}_{self._request}_teleport"].rx_input()
+                message = port.rx_input()
             else:
                 qubit_ready = True
 
@@ -467,7 +494,10 @@ class TeleportCorrectProtocol(NodeProtocol):
                 corrections += 1
                         
             if corrections and qubit_ready:
-                if self._x_corr or self._z_corr:
+                if self._pauli_frame:
+                    #Qubit keeps the corrections of the entanglement swapping
+                    self.node.add_pauli_frame(self._mempos, self._x_corr, self._z_corr)
+                elif self._x_corr or self._z_corr:
                     self._program.set_corrections(self._x_corr, self._z_corr)
                     if self.node.qmemory.busy:
                         yield self.await_program(self.node.qmemory)
@@ -521,18 +551,23 @@ class CHSHApplication(GeneralApplication):
             B0 = (1/np.sqrt(2))*(I-Z+X)
             B1 = (1/np.sqrt(2))*(I-Z-X)
 
+        #Expressions awaited in every round are built once
+        evexpr_route = self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
+
         while True:
             start_time = sim_time()
             #Send signal for entanglement generation
             self.send_signal(self._ent_request)
 
             #Wait for  entanglement to be generated on both ends
-            yield self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
+            yield evexpr_route
 
             #Generate x and y, which will be use for Alice and Bob measurements
             x = randint(0,1)
             y = randint(0,1)
 
+            self._networkmanager.network.get_node(self._path['nodes'][0]).apply_pauli_frame(mem_posA_1)
+            self._networkmanager.network.get_node(self._path['nodes'][-1]).apply_pauli_frame(mem_posB_1)
             qa, = self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory.pop(positions=[mem_posA_1])
             qb, = self._networkmanager.network.get_node(self._path['nodes'][-1]).qmemory.pop(positions=[mem_posB_1])
             
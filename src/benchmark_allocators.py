@@ -0,0 +1,60 @@
+import sys
+import time
+from network import NetworkManager
+
+'''
+Scaling benchmark of the allocation of memory positions and link instances. On synthetic chain
+topologies of increasing size, every instance of every link is allocated with its memory positions
+in both ends, as done when paths are calculated, and then released.
+Time per allocation should not grow with the number of links:
+    python benchmark_allocators.py [number of links ...]
+'''
+
+def chain_config(num_links, instances=2):
+    '''
+    Configuration of a chain of switches with an end node at each side
+    Input:
+        - num_links: number of links of the chain
+        - instances: number of instances of each link
+    Output:
+        - configuration dictionary
+    '''
+    nodes = [f"node{position}" for position in range(num_links + 1)]
+    config = {'name': f"chain{num_links}", 'epr_pair': 'PHI_PLUS', 'simulation_duration': 0,
+              'link_fidel_rounds': 0, 'path_fidel_rounds': 0, 'requests': []}
+    config['nodes'] = [{node: {'type': 'endNode' if position in [0, num_links] else 'switch'}}
+                       for position, node in enumerate(nodes)]
+    config['links'] = [{f"link{position}": {'end1': nodes[position], 'end2': nodes[position + 1], 'number_links': instances}}
+                       for position in range(num_links)]
+    return(config)
+
+def run_benchmark(num_links, instances=2):
+    '''
+    Allocates and releases all link instances and memory positions of a chain
+    Input:
+        - num_links: number of links of the chain
+        - instances: number of instances of each link
+    Output:
+        - mean time (microseconds) per allocated instance
+    '''
+    config = chain_config(num_links, instances)
+    manager = NetworkManager(config, detached=True)
+    manager._init_resources()
+    nodes = [list(node.keys())[0] for node in config['nodes']]
+
+    start = time.perf_counter()
+    allocated = []
+    for position in range(num_links):
+        for instance in range(instances):
+            link_name, index = manager.get_link(nodes[position], nodes[position + 1], next_index=True)
+            manager.get_mem_position(nodes[position], link_name, index)
+            manager.get_mem_position(nodes[position + 1], link_name, index)
+            allocated.append((link_name, index))
+    for link_name, index in allocated:
+        manager.release_link(link_name, index)
+    return(1e6 * (time.perf_counter() - start) / len(allocated))
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] if len(sys.argv) > 1 else [50, 100, 200, 500, 1000]
+    for num_links in sizes:
+        print(f"{num_links} links: {run_benchmark(num_links):.2f} us per link instance")
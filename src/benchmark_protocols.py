@@ -0,0 +1,122 @@
+import sys
+import time
+import copy
+import inspect
+import types
+import yaml
+import netsquid as ns
+from netsquid.protocols import Protocol
+from network import NetworkManager
+from utils import validate_conf
+import protocols
+import routing_protocols
+import applications
+from applications import CapacityApplication
+
+'''
+Microbenchmark of the protocol hot loops. Builds the network of a configuration file, runs a
+Capacity application in every admitted path and reports the wall time spent in routing and in
+the simulation, with the events handled by the protocols in the simulation and the end to end
+pairs generated per second of wall time.
+Run it in the same configuration before and after a change in the protocols to compare them:
+    python benchmark_protocols.py ../examples/network_config.yaml.1Switch1Request [repetitions]
+'''
+
+#Events handled by the protocols while counting is enabled
+_counter = {'enabled': False, 'events': 0}
+
+def _counted(generator):
+    '''
+    Runs the generator of a protocol counting each time it is resumed by the event expression it waits for
+    '''
+    try:
+        expression = next(generator)
+    except StopIteration:
+        return
+    while True:
+        try:
+            result = yield expression
+        except GeneratorExit:
+            #Protocol stopped
+            generator.close()
+            raise
+        if _counter['enabled']:
+            _counter['events'] += 1
+        try:
+            expression = generator.send(result)
+        except StopIteration:
+            return
+
+def count_protocol_events():
+    '''
+    Instruments the run method of the protocols of the hypervisor, so that every event that resumes
+    a protocol is counted. Counting is done only between start_count and stop_count
+    '''
+    for module in [protocols, routing_protocols, applications]:
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, Protocol) and cls.__module__ == module.__name__ and 'run' in cls.__dict__:
+                def run(self, original=cls.__dict__['run']):
+                    result = original(self)
+                    return(_counted(result) if isinstance(result, types.GeneratorType) else result)
+                cls.run = run
+
+def start_count():
+    _counter['events'] = 0
+    _counter['enabled'] = True
+
+def stop_count():
+    '''
+    Returns the number of events counted since start_count
+    '''
+    _counter['enabled'] = False
+    return(_counter['events'])
+
+def run_benchmark(config, repetitions=1):
+    '''
+    Simulates the configuration with Capacity applications
+    Input:
+        - config: dictionary with parsed yaml file
+        - repetitions: number of times the simulation is run
+    Output:
+        - list with, for each repetition, a dictionary with routing and simulation wall times (seconds),
+            number of events handled by the protocols in the simulation and number of generated pairs
+    '''
+    results = []
+    for repetition in range(repetitions):
+        ns.sim_stop()
+        ns.sim_reset()
+
+        start = time.perf_counter()
+        net = NetworkManager(copy.deepcopy(config))
+        routing_time = time.perf_counter() - start
+
+        applications = []
+        for path in net.get_paths():
+            app = CapacityApplication(path, net, f"CapacityApplication_{path['request']}")
+            app.start()
+            applications.append(app)
+
+        #Only events of the application phase are counted, not those of routing simulations
+        start_count()
+        start = time.perf_counter()
+        ns.sim_run(duration=net.get_config('simulation_duration','simulation_duration'))
+        simulation_time = time.perf_counter() - start
+        events = stop_count()
+
+        results.append({'routing_time': routing_time, 'simulation_time': simulation_time, 'events': events,
+                        'pairs': sum([len(app.dc.dataframe) for app in applications])})
+    return(results)
+
+if __name__ == '__main__':
+    file = sys.argv[1] if len(sys.argv) > 1 else './network_config.yaml'
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with open(file,'r') as config_file:
+        config = yaml.safe_load(config_file)
+    validate_conf(config)
+
+    count_protocol_events()
+    for repetition, result in enumerate(run_benchmark(config, repetitions)):
+        print(f"Run {repetition}: routing {result['routing_time']:.3f} s, simulation {result['simulation_time']:.3f} s, "
+              f"{result['events']} events, {result['events']/result['simulation_time']:.1f} events/s, "
+              f"{result['pairs']} pairs, {result['pairs']/result['simulation_time']:.1f} pairs/s")
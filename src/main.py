@@ -6,7 +6,7 @@ import logging
 import os
 import netsquid as ns
 from netsquid.util import simlog
-from utils import generate_report, validate_conf, check_parameter, load_config, create_plot
+from utils import generate_report, validate_conf, check_parameter, load_config, create_plot, wait_topology_render
 import yaml
 import datetime
 from applications import CapacityApplication, TeleportationApplication, CHSHApplication
@@ -312,10 +312,20 @@ with open(routing_file, 'a') as route_file:
         for link, fids in value['link_fidelities'].items():
             route_file.write(f"{key};{link};{fids[0]};{fids[1]};{fids[2]}\n")
     route_file.write('----------Requests status-----------\n')
-    route_file.write('param_value;request;fidelity;purif_rounds;time;result;reason;shortest_path\n')
+    route_file.write('param_value;request;fidelity;purif_rounds;time;result;reason;shortest_path;samples\n')
     for key, value in report_info.items():
         for data in value['requests_status']:
-            route_file.write(f"{key};{data['request']};{data['fidelity']};{data['purif_rounds']};{data['time']};{data['result']};{data['reason']};{data['shortest_path']}\n")    
+            route_file.write(f"{key};{data['request']};{data['fidelity']};{data['purif_rounds']};{data['time']};{data['result']};{data['reason']};{data['shortest_path']};{data['samples']}\n")    
+    route_file.write('----------Path cache-----------\n')
+    route_file.write('param_value;hits;misses\n')
+    for key, value in report_info.items():
+        route_file.write(f"{key};{value['path_cache']['hits']};{value['path_cache']['misses']}\n")
+    route_file.write('----------Swap queue waits-----------\n')
+    route_file.write('param_value;switch;request;swaps;mean_wait;max_wait\n')
+    for key, value in report_info.items():
+        for switch, waits in value['swap_waits'].items():
+            for request, data in waits.items():
+                route_file.write(f"{key};{switch};{request};{data['swaps']};{data['mean']};{data['max']}\n")
 
 with open(results_file,'a') as resultsfile:
     resultsfile.write('\n---------Column values-------\n')
@@ -325,6 +335,9 @@ with open(results_file,'a') as resultsfile:
     resultsfile.write('TeleportationWithDemand;Request;Element$Parameter;Value;Teleported states;Mean fidelity;STD fidelity;Mean time;STD time;Queue size at end of simulation;Discarded qubits;\n')
     resultsfile.write('Teleportation;Request;Element$Parameter;Value;Measurements;Mean time;STD time;Wins;\n')
 
+#Network image must be available before finishing
+wait_topology_render()
+
 if print_report: 
     simul_environ = {
         'mode': mode,
@@ -2,6 +2,7 @@ from icecream import ic
 import netsquid as ns
 import networkx as nx
 import numpy as np
+import pandas as pd
 from netsquid.nodes import Node, Connection, Network
 from netsquid.components import Message, QuantumProcessor, QuantumProgram, PhysicalInstruction
 from netsquid.qubits.state_sampler import StateSampler
@@ -10,53 +11,121 @@ from netsquid.components.models.delaymodels import FixedDelayModel, FibreDelayMo
 from netsquid.components.models.qerrormodels import DepolarNoiseModel, DephaseNoiseModel, T1T2NoiseModel, QuantumErrorModel, FibreLossModel
 from netsquid.components import ClassicalChannel, QuantumChannel
 from netsquid.nodes.connections import DirectConnection
-from routing_protocols import LinkFidelityProtocol, PathFidelityProtocol
+from pydynaa import EventType
+from routing_protocols import LinkFidelityProtocol, PathFidelityProtocol, SequentialTest, LOST_QUBIT_FIDELITY
 from netsquid.qubits import ketstates as ks
 from netsquid.qubits.operators import Operator
 from netsquid.components.instructions import INSTR_MEASURE_BELL, INSTR_MEASURE, INSTR_X, INSTR_Z,  INSTR_CNOT, IGate, INSTR_Y, INSTR_ROT_X, INSTR_ROT_Y, INSTR_ROT_Z, INSTR_H, INSTR_SWAP, INSTR_INIT, INSTR_CXDIR, INSTR_EMIT, INSTR_CCX
 import netsquid.qubits.operators as ops
 from netsquid.qubits import assign_qstate, create_qubits
 from netsquid.qubits import qubitapi as qapi
-from utils import dc_setup
+from utils import dc_setup, render_topology
+from analytic import plan_purification, swapped_fidelity, reachable_fidelity, link_success_probability, sample_path, PLANNER_FIDELITY_MARGIN
+from protocols import generation_delay, generation_lower_bound, forward_message
+from path_cache import PathResultCache, parameters_hash
+from admission import plan_admission
+from swap_scheduling import create_scheduler
 from random import gauss
+from functools import partial
+from itertools import islice
+from statistics import NormalDist
+import multiprocessing
+import heapq
+
+#Optional global properties that select a protocol mode, with their default value
+OPTIONAL_GLOBAL_PROPERTIES = {'restart_policy': 'end_to_end', 'classical_forwarding': 'per_hop',
+                              'correction_messages': 'per_switch', 'correction_mode': 'physical'}
+#Optional properties of the elements of each type and the value used when an element does not define them.
+# Defaults that depend on the global configuration are added when the configuration is indexed
+OPTIONAL_ELEMENT_PROPERTIES = {'nodes': {'gate_duration': 0},
+                               'links': {'source_delay': 0, 'classical_delay_model': 'FibreDelayModel'},
+                               'requests': {}}
+#Minimum number of rounds per worker process for a path estimation to be split among workers.
+# With fewer rounds, process communication costs more than the simulation saved
+MIN_SHARD_ROUNDS = 20
 
 class Switch(Node):
-    def __init__(self,name,qmemory):
-        self._swap_queue = []
+    def __init__(self,name,qmemory,scheduler='fifo',requests=None,lanes=None):
+        #Operations waiting for a processing unit, ordered by the scheduling policy
+        self._swap_queue = create_scheduler(scheduler, requests if requests is not None else {})
+        #Processing unit used by each operation in service
+        self._swap_current = {}
+        self._swap_arrivals = {}
+        #Time waited in queue by the operations of each request
+        self.swap_waits = {}
+        #Event types used to signal a protocol that its swap can be executed
+        self._swap_turns = {}
         super().__init__(name,qmemory=qmemory)
 
-    def add_request(self,request):
+        #Processing units executing swaps. With only one, swaps are executed in the node memory
+        self._free_lanes = [qmemory] if lanes is None else list(lanes)
+        for lane in self._free_lanes:
+            if lane is not qmemory: self.add_subcomponent(lane)
+
+    def swap_turn(self,request):
+        '''
+        Event type that the switch schedules when the request gets the quantum processor,
+        so that the requestor protocol can wait for its turn without polling
+        Input:
+            - request: name of th requestor protocol (string)
+        Output:
+            - instance of EventType
+        '''
+        if request not in self._swap_turns:
+            self._swap_turns[request] = EventType(f"SWAP_TURN_{request}", f"Swap of {request} can be executed")
+        return(self._swap_turns[request])
+
+    def add_request(self,request,demand=None):
         '''
-        Receives the protocol that wants to perform the swapping operation
+        Receives the protocol that wants to perform the swapping operation.
+        If a processing unit is free, the operation is serviced immediately
         Input:
             - request: name of th requestor protocol (string)
+            - demand: name of the request the operation belongs to, used by the scheduling policy
         Output:
             No output
         '''
-        self._swap_queue.append(request)
+        self._swap_arrivals[request] = (demand, ns.sim_time())
+        self._swap_queue.push(request, demand, ns.sim_time())
+        self._dispatch_requests()
 
-    def get_request(self,strategy):
+    def get_lane(self,request):
         '''
-        Retrieve an operation to execute from the queue.
-        Can be the first one or the last one
+        Retrieve the processing unit assigned to an operation
         Input:
-            - strategy: if first in queue should be returned or last (first|last)
+            - request: name of th requestor protocol (string)
         Output:
-            - protocol_name: name of the protocol for which the entanglement will be executed
+            - quantum processor where the swap must be executed or None if the operation is waiting
         '''
-        protocol_name = self._swap_queue[0] if strategy == 'first' else self._swap_queue[-1]
-        return(protocol_name)
+        return(self._swap_current.get(request))
 
-    def remove_request(self,strategy):
+    def remove_request(self,request):
         '''
-        Delete an operation from the queue.
-        Can be the first one or the last one
+        Delete a serviced operation, releasing its processing unit for the next ones in the queue
         Input:
-            - strategy: if first in queue should be deleted or last (first|last)
+            - request: name of th requestor protocol (string)
         Output:
             No output
         '''
-        self._swap_queue.pop(0) if strategy == 'first' else self._swap_queue.pop()  
+        self._free_lanes.append(self._swap_current.pop(request))
+        for serviced in self._dispatch_requests():
+            #Wake up next request
+            self._schedule_now(self.swap_turn(serviced))
+
+    def _dispatch_requests(self):
+        '''
+        Assigns free processing units to the next operations in the queue and records their waiting time
+        Output:
+            - list with the name of the operations that start to be serviced
+        '''
+        serviced = []
+        while len(self._free_lanes) > 0 and len(self._swap_queue) > 0:
+            request = self._swap_queue.pop()
+            self._swap_current[request] = self._free_lanes.pop(0)
+            demand, arrival = self._swap_arrivals.pop(request)
+            self.swap_waits.setdefault(demand, []).append(ns.sim_time() - arrival)
+            serviced.append(request)
+        return(serviced)
 
 class EndNode(Node):
     def __init__(self, name, queue_size, qmemory):
@@ -65,6 +134,42 @@ class EndNode(Node):
         self._queue_size = queue_size
         super().__init__(name, qmemory=qmemory)
         self._discarded_states = 0
+        #Pending X and Z corrections of the qubit in each memory position (Pauli frame)
+        self._pauli_frames = {}
+        self._state_enqueued = EventType("STATE_ENQUEUED", f"State waiting for teleportation in {name}")
+
+    def state_enqueued(self):
+        '''
+        Event type that the node schedules when a state is inserted in the teleportation queue,
+        so that the application can wait for states without polling
+        Output:
+            - instance of EventType
+        '''
+        return(self._state_enqueued)
+
+    def add_pauli_frame(self, mempos, x_corr, z_corr, reset=False):
+        '''
+        Records corrections of a qubit in memory that are not physically applied
+        Input:
+            - mempos: memory position of the qubit
+            - x_corr, z_corr: number of X and Z corrections
+            - reset: if True, previous corrections of the position are discarded (new qubit)
+        '''
+        frame = [0, 0] if reset else self._pauli_frames.get(mempos, [0, 0])
+        self._pauli_frames[mempos] = [(frame[0] + x_corr) % 2, (frame[1] + z_corr) % 2]
+
+    def apply_pauli_frame(self, mempos):
+        '''
+        Applies the pending corrections to the qubit in a memory position, without duration or noise.
+        Must be called before the qubit is evaluated or used by a quantum program
+        Input:
+            - mempos: memory position of the qubit
+        '''
+        x_corr, z_corr = self._pauli_frames.pop(mempos, [0, 0])
+        if (x_corr or z_corr) and not self.qmemory.get_position_empty(mempos):
+            qubit, = self.qmemory.peek([mempos])
+            if x_corr: qapi.operate(qubit, ops.X)
+            if z_corr: qapi.operate(qubit, ops.Z)
 
 
     def request_teleport(self, state, strategy):
@@ -96,6 +201,7 @@ class EndNode(Node):
                     self._mem_transmit_queue.append(mempos)
 
                 self._discarded_states += 1
+                self._schedule_now(self._state_enqueued)
         else:
             self._state_transmit_queue.append(state)
             if self.qmemory.num_positions > 4: #We are using quantum memory for storage
@@ -105,6 +211,8 @@ class EndNode(Node):
 
                 self.qmemory.put(qubit, mempos, replace = True)
                 self._mem_transmit_queue.append(mempos)
+            #Wake up the application if it is waiting for a state
+            self._schedule_now(self._state_enqueued)
 
     def retrieve_teleport(self, strategy):
         '''
@@ -156,21 +264,45 @@ class EndNode(Node):
 class NetworkManager():
     '''
     The only initiallization parameter is the name of the file 
-    storing all the network definition
+    storing all the network definition.
+    A detached manager (detached=True) does not create the network nor calculate paths. It is
+    used by worker processes that evaluate requests.
     '''
 
-    def __init__(self, config):
+    def __init__(self, config, detached=False):
         self.network=""
         self._paths = []
         self._link_fidelities = {}
         self._memory_assignment = {}
+        self._memory_positions = {}
         self._available_links = {}
         self._requests_status = []
         self._config = config
+        self._index_config()
+        self._graph = None
+        self._sp_paths = {}
+        self._detached = detached
+        #Worker processes of path estimations, shared by all requests while paths are calculated
+        self._pool = None
+
+        #Cache of path estimations
+        #Detached managers do not store results, they are returned to the calling manager
+        cache_backend = self._config.get('path_cache','none')
+        self._path_cache = PathResultCache(cache_backend, self._config.get('path_cache_file','./output/path_cache'), deferred=detached) \
+            if cache_backend != 'none' else None
+
+        if detached:
+            #Resources are set by the manager that uses the worker
+            return
 
         self._create_network()
         self._measure_link_fidelity()
         self._calculate_paths()
+        self._render_topology()
+
+        #Swap queue waits are measured in the application phase
+        for node in self.network.nodes.values():
+            if isinstance(node, Switch): node.swap_waits = {}
 
     def get_info_report(self):
         '''
@@ -179,40 +311,70 @@ class NetworkManager():
         report_info = {}
         report_info['link_fidelities'] = self._link_fidelities
         report_info['requests_status'] = self._requests_status
+        report_info['path_cache'] = {
+            'hits': self._path_cache.hits if self._path_cache else 0,
+            'misses': self._path_cache.misses if self._path_cache else 0}
+        report_info['swap_waits'] = {}
+        for node in self.network.nodes.values():
+            if isinstance(node, Switch):
+                report_info['swap_waits'][node.name] = {request: {'swaps': len(waits), 'mean': np.mean(waits), 'max': np.max(waits)} 
+                    for request, waits in node.swap_waits.items()}
         return(report_info)
 
-    def get_config(self, mode, name, property=None):
+    def get_config(self, mode, name, property=None, default=None):
         '''
         Enables configuration queries
         Input:
             - mode: ['nodes'|'links|'requests']
             - name: name of the element to query
             - property: attribute to query. If None (default), all attributes are returned
+            - default: value returned if the element or the attribute are not defined (None by default).
+                Optional global properties and optional element properties return their own default
         Output:
             - value of required attribute
         '''
-        if mode not in ['name','simulation_duration','epr_pair','link_fidel_rounds','path_fidel_rounds','nodes','links','requests']:
-            raise ValueError('Unsupported mode')
-        else:
-            elements = self._config[mode] 
-            #Querying for a global property
-            if mode in ['name','epr_pair','simulation_duration','link_fidel_rounds','path_fidel_rounds']: 
-                return (elements)
-            
+        if mode in self._config_index:
             #Querying for an element type
-            found = False
-            for element in elements:
-                if list(element.keys())[0] == name:
-                    if property:
-                        try:  
-                            return(list(element.values())[0][property])
-                        except:
-                            return('NOT_FOUND')
-                    else:
-                        return(list(element.values())[0])
-            
-            #name not found
-            return('NOT_FOUND')
+            if name not in self._config_index[mode]:
+                return(default)
+            properties = self._config_index[mode][name]
+            if property:
+                if not isinstance(properties, dict): return(default)
+                return(properties.get(property, self._element_defaults[mode].get(property, default)))
+            return(properties)
+        elif mode in OPTIONAL_GLOBAL_PROPERTIES:
+            return(self._config.get(mode, OPTIONAL_GLOBAL_PROPERTIES[mode]))
+        elif mode in ['name','simulation_duration','epr_pair','link_fidel_rounds','path_fidel_rounds']:
+            #Querying for a global property
+            return(self._config[mode])
+        else:
+            raise ValueError('Unsupported mode')
+
+    def _index_config(self):
+        '''
+        Builds, for each element type, a dictionary with the properties of each element by name,
+        so that configuration queries do not scan the lists of the configuration file.
+        Properties are shared with the configuration, not copied. Defaults of optional properties
+        are kept apart, so that the configuration is not modified
+        '''
+        self._element_defaults = {mode: dict(defaults) for mode, defaults in OPTIONAL_ELEMENT_PROPERTIES.items()}
+        self._element_defaults['requests']['multiplexing'] = self._config.get('multiplexing', 1)
+
+        self._config_index = {}
+        for mode in ['nodes','links','requests']:
+            self._config_index[mode] = {}
+            for element in self._config.get(mode) or []:
+                name = list(element.keys())[0]
+                #As in the configuration file scan, first element with the name is used
+                if name not in self._config_index[mode]:
+                    self._config_index[mode][name] = element[name]
+
+        #Links between each pair of nodes, in configuration order
+        self._node_links = {}
+        for link_name, props in self._config_index['links'].items():
+            self._node_links.setdefault((props['end1'], props['end2']), []).append(link_name)
+            if props['end1'] != props['end2']:
+                self._node_links.setdefault((props['end2'], props['end1']), []).append(link_name)
 
     def get_mem_position(self, node, link, serial):
         '''
@@ -227,37 +389,16 @@ class NetworkManager():
             -integer: memory position in the specified node to be used
         ''' 
         serial = str(serial)
-        values_list = []
-
-        if node in list(self._memory_assignment.keys()):
-            node_links = self._memory_assignment[node]
-            #get maximum assigned position
-            for node_link in list(node_links.keys()):
-                for link_serial in list(self._memory_assignment[node][node_link].keys()):
-                    values_list.append(self._memory_assignment[node][node_link][link_serial])
-            position = max(values_list) if len(values_list) > 0 else -1
-
-            if link in list(node_links.keys()):
-                link_serials = self._memory_assignment[node][link]
-                if serial in list(link_serials.keys()):
-                    position = link_serials[serial] #This is the assigned position
-                else: #serial does not exists
-                    #create serial with memory position the maximum for that link plus one
-                    position += 1
-                    self._memory_assignment[node][link][serial] = position
-            else: #link does not exist
-                #create link and serial. Position will be 0
-                self._memory_assignment[node][link] = {}
-                position += 1
-                self._memory_assignment[node][link][serial] = position
-        else: #node does not exist
-            #create node, link, serial and position. Position will be 0
-            self._memory_assignment[node] = {}
-            self._memory_assignment[node][link] = {}
-            self._memory_assignment[node][link][serial] = 0
-            position = 0
-
-        return(position)
+        node_links = self._memory_assignment.setdefault(node, {})
+        link_serials = node_links.setdefault(link, {})
+        if serial not in link_serials:
+            #Positions of a node are assigned consecutively from 0. The counter is rebuilt from 
+            # the assignment when it has been set externally (worker processes)
+            if node not in self._memory_positions:
+                self._memory_positions[node] = sum([len(serials) for serials in node_links.values()])
+            link_serials[serial] = self._memory_positions[node]
+            self._memory_positions[node] += 1
+        return(link_serials[serial])
 
     def get_paths(self):
         return self._paths
@@ -270,21 +411,20 @@ class NetworkManager():
             - next_index: if True returns also the next available index in the link. False by default
         '''
         
-        links = self._config['links']
-        for link in links:
-            link_name = list(link.keys())[0]
-            link_props = self.get_config('links',link_name)
-            if (link_props['end1'] == node1 and link_props['end2'] == node2) or (link_props['end1'] == node2 and link_props['end2'] == node1):
-                if not next_index:
-                    return(link_name)
-                else:
-                    next_index = max(self._available_links[link_name]['occupied']) + 1 \
-                        if len(self._available_links[link_name]['occupied']) != 0 else 0
-                    #We return the next instance if there are available
-                    if self._available_links[link_name]['avail'] > 0:
-                        self._available_links[link_name]['occupied'].append(next_index)
-                        self._available_links[link_name]['avail'] -= 1
-                        return([link_name,next_index])
+        for link_name in self._node_links.get((node1, node2), []):
+            if not next_index:
+                return(link_name)
+            else:
+                #We return the lowest free instance if there are available
+                link = self._available_links[link_name]
+                if link['avail'] > 0:
+                    index = heapq.heappop(link['free'])
+                    link['occupied'].add(index)
+                    link['avail'] -= 1
+                    if link['avail'] == 0:
+                        #Link exhausted, it is no longer usable for routing
+                        self._sp_paths = {}
+                    return([link_name,index])
                     
         #If we haven't returned no direct link between both ends
         return('NOLINK')
@@ -296,8 +436,78 @@ class NetworkManager():
             - link_name: link. string
             - index: index in the link to be released. Can be string or integer
         '''
-        self._available_links[link_name]['avail'] += 1
-        self._available_links[link_name]['occupied'].remove(int(index))
+        link = self._available_links[link_name]
+        link['avail'] += 1
+        link['occupied'].remove(int(index))
+        heapq.heappush(link['free'], int(index))
+        if link['avail'] == 1:
+            #Link is usable again for routing
+            self._sp_paths = {}
+
+    def _build_graph(self):
+        '''
+        Creates the routing graph with all nodes and links of the network.
+        Graph is built once per run. Availability of links is not stored in the graph,
+        it is applied through _available_graph, so edges are hidden when the link runs out
+        of instances and shown again when instances are released.
+        '''
+        self._graph = nx.Graph()
+        for node in self._config['nodes']:
+            node_name = list(node.keys())[0]
+            node_props = list(node.values())[0]
+            if node_props['type'] =='switch':
+                self._graph.add_node(node_name,color='#CF9239',style='filled',fillcolor='#CF9239')
+            else:
+                self._graph.add_node(node_name,color='#5DABAB',style='filled',fillcolor='#5DABAB',shape='square')
+
+        for link in self._config['links']:
+            link_name = list(link.keys())[0]
+            link_props = list(link.values())[0]
+            self._graph.add_edge(link_props['end1'],link_props['end2'],weight=self._link_fidelities[link_name][0],link=link_name)
+
+        #Shortest paths must be recalculated
+        self._sp_paths = {}
+
+    def _available_graph(self):
+        '''
+        Returns a read only view of the routing graph with only the links that have available instances
+        '''
+        return(nx.subgraph_view(self._graph, 
+                filter_edge=lambda node1, node2: self._available_links[self._graph[node1][node2]['link']]['avail'] > 0))
+
+    def _shortest_path(self, origin, destination):
+        '''
+        Calculates shortest path between two nodes using available links.
+        Path is calculated with nx.shortest_path, so that ties between paths of equal cost are broken
+        as when the graph was rebuilt for every request. It is cached per pair of nodes and reused
+        until availability of a link changes.
+        Input:
+            - origin, destination: names of the nodes
+        Output:
+            - list with the names of the nodes in the path
+        '''
+        if (origin, destination) not in self._sp_paths:
+            try:
+                self._sp_paths[(origin, destination)] = nx.shortest_path(self._available_graph(), source=origin, target=destination, weight='weight')
+            except nx.exception.NetworkXNoPath:
+                self._sp_paths[(origin, destination)] = None
+        if self._sp_paths[(origin, destination)] is None:
+            raise nx.exception.NetworkXNoPath(f"No path between {origin} and {destination}")
+        return(list(self._sp_paths[(origin, destination)]))
+
+    def _render_topology(self):
+        '''
+        Network graph generation, to include in report.
+        Rendering mode is set in global parameter render_topology: background (default), foreground or none
+        '''
+        mode = self._config.get('render_topology','background')
+        if mode == 'none':
+            return
+        #Only styling attributes are kept for the image
+        graph = nx.Graph()
+        graph.add_nodes_from(self._graph.nodes(data=True))
+        graph.add_edges_from((node1, node2, {'weight': props['weight']}) for node1, node2, props in self._graph.edges(data=True))
+        render_topology(graph, './output/graf.png', background = mode == 'background')
 
     def _create_network(self):
         '''
@@ -306,8 +516,7 @@ class NetworkManager():
         Output: -
         '''
         self.network = Network(self._config['name'])
-        self._memory_assignment = {}
-        self._available_links = {}
+        self._init_resources()
 
         #nodes creation
         switches = [] #List with all switches
@@ -316,18 +525,9 @@ class NetworkManager():
             name = list(node.keys())[0]
             props = list(node.values())[0]
             if props['type'] == 'switch':
-                switch = Switch(name, qmemory=self._create_qprocessor(f"qproc_{name}",props['num_memories'], nodename=name))
-                switches.append(switch)
+                switches.append(self._create_node(name, props))
             elif props['type'] == 'endNode':
-                if 'teleport_queue_technology' in props.keys() and props['teleport_queue_technology'] == 'Quantum':
-                    #If teleportation queue in node is implemented with quantum memories
-                    num_memories = 4 + props['teleport_queue_size']
-                else: #Queue is implemented with classical memories
-                    num_memories = 4
-                queue_size = props['teleport_queue_size'] if 'teleport_queue_technology' in props.keys() else 0
-                
-                endnode = EndNode(name, queue_size, qmemory=self._create_qprocessor(f"qproc_{name}",num_memories, nodename=name))
-                end_nodes.append(endnode)
+                end_nodes.append(self._create_node(name, props))
             else:
                 raise ValueError('Undefined network element found')
 
@@ -338,76 +538,235 @@ class NetworkManager():
         for link in self._config['links']:
             link_name = list(link.keys())[0]
             props = list(link.values())[0]
-            #store available resources per link
-            self._available_links[link_name] = {}
-            self._available_links[link_name]['avail'] = props['number_links'] if 'number_links' in props.keys() else 2
-            self._available_links[link_name]['occupied'] = []
 
-            nodeA = self.network.get_node(props['end1'])
-            nodeB = self.network.get_node(props['end2'])
             # Add Quantum Sources to nodes
             num_qsource = props['number_links'] if 'number_links' in props.keys() else 2
-            epr_state = ks.b00 if self._config['epr_pair'] == 'PHI_PLUS' else ks.b01
-
-            state_sampler = StateSampler(
-                [epr_state, ks.s00, ks.s01, ks.s10, ks.s11],
-                [props['source_fidelity_sq'], (1 - props['source_fidelity_sq'])/4, (1 - props['source_fidelity_sq'])/4,
-                 (1 - props['source_fidelity_sq'])/4, (1 - props['source_fidelity_sq'])/4])
             for index_qsource in range(num_qsource):
-                if self.get_config('nodes',props['end1'],'type') == 'switch':
-                    qsource_origin = nodeA 
-                    qsource_dest = nodeB
-                else:
-                    qsource_origin = nodeB
-                    qsource_dest = nodeA
-                #Setup QSource
-                source_delay = 0 if 'source_delay' not in props.keys() else float(props['source_delay'])
-                source = QSource(
-                        f"qsource_{qsource_origin.name}_{link_name}_{index_qsource}", state_sampler=state_sampler, num_ports=2, status=SourceStatus.EXTERNAL,
-                        models={"emission_delay_model": FixedDelayModel(delay=source_delay)})
-                qsource_origin.add_subcomponent(source)
-                # Setup Quantum Channels
-                #get channel noise model from config
-                if self.get_config('links',link_name,'qchannel_noise_model') == 'FibreDepolarizeModel':
-                    qchannel_noise_model = FibreDepolarizeModel(p_depol_init=float(self.get_config('links',link_name,'p_depol_init')),
-                                                                p_depol_length=float(self.get_config('links',link_name,'p_depol_length')))
-                elif self.get_config('links',link_name,'qchannel_noise_model') == 'DephaseNoiseModel':
-                    qchannel_noise_model = DephaseNoiseModel(float(self.get_config('links',link_name,'dephase_qchannel_rate')))
-                elif self.get_config('links',link_name,'qchannel_noise_model') == 'DepolarNoiseModel':
-                    qchannel_noise_model = DepolarNoiseModel(float(self.get_config('links',link_name,'depolar_qchannel_rate')))
-                elif self.get_config('links',link_name,'qchannel_noise_model') == 'T1T2NoiseModel':
-                    qchannel_noise_model = T1T2NoiseModel(T1=float(self.get_config('links',link_name,'t1_qchannel_time')),
-                                              T2=float(self.get_config('links',link_name,'t2_qchannel_time')))
-                elif self.get_config('links',link_name,'qchannel_noise_model') == 'FibreDepolGaussModel':
-                    qchannel_noise_model = FibreDepolGaussModel()
-                else:
-                    qchannel_noise_model = None
-                
-                if self.get_config('links',link_name,'qchannel_loss_model') == 'FibreLossModel':
-                    qchannel_loss_model = FibreLossModel(p_loss_init=float(self.get_config('links',link_name,'p_loss_init')),
-                                                           p_loss_length=float(self.get_config('links',link_name,'p_loss_length')))
-                else:
-                    qchannel_loss_model = None
-
-                qchannel = QuantumChannel(f"qchannel_{qsource_origin.name}_{qsource_dest.name}_{link_name}_{index_qsource}", 
-                        length = props['distance'],
-                        models={"quantum_noise_model": qchannel_noise_model, 
-                                "quantum_loss_model": qchannel_loss_model,
-                                "delay_model": FibreDelayModel(c=float(props['photon_speed_fibre']))})
-                port_name_a, port_name_b = self.network.add_connection(
-                        qsource_origin, qsource_dest, channel_to=qchannel, 
-                        label=f"qconn_{qsource_origin.name}_{qsource_dest.name}_{link_name}_{index_qsource}")
-
-                #Setup quantum ports
-                qsource_origin.subcomponents[f"qsource_{qsource_origin.name}_{link_name}_{index_qsource}"].ports["qout1"].forward_output(
-                    qsource_origin.ports[port_name_a])
-                qsource_origin.subcomponents[f"qsource_{qsource_origin.name}_{link_name}_{index_qsource}"].ports["qout0"].connect(
-                    qsource_origin.qmemory.ports[f"qin{self.get_mem_position(qsource_origin.name,link_name,index_qsource)}"])
-                qsource_dest.ports[port_name_b].forward_input(
-                    qsource_dest.qmemory.ports[f"qin{self.get_mem_position(qsource_dest.name,link_name,index_qsource)}"])
+                self._create_link_instance(self.network, link_name, index_qsource)
                 
                 # Setup Classical connections: To be done in routing preparation, depends on paths
 
+    def _init_resources(self):
+        '''
+        Sets all memory positions and link instances as free. For each link, available instances
+        are counted and the free ones are kept in a heap, so that the lowest one is assigned first
+        '''
+        self._memory_assignment = {}
+        self._memory_positions = {}
+        self._available_links = {}
+        for link_name, props in self._config_index['links'].items():
+            instances = props['number_links'] if 'number_links' in props.keys() else 2
+            self._available_links[link_name] = {'avail': instances, 'occupied': set(), 'free': list(range(instances))}
+
+    def _link_source(self, link_name):
+        '''
+        Returns the node of a link where its quantum sources are placed: the switch end,
+        or end2 if both ends are switches
+        '''
+        props = self.get_config('links',link_name)
+        return(props['end1'] if self.get_config('nodes',props['end1'],'type') == 'switch' else props['end2'])
+
+    def _create_node(self, name, props):
+        '''
+        Creates a node (switch or end node) with its quantum processor
+        Input:
+            - name: name of the node
+            - props: dictionary with node parameters
+        Output:
+            - instance of Switch or EndNode
+        '''
+        if props['type'] == 'switch':
+            requests = self._config_index['requests']
+            #Additional processing units only hold the two qubits of a swap
+            lanes = None if props.get('processing_units',1) == 1 else \
+                [self._create_qprocessor(f"qproc_{name}_{lane}", 2, nodename=name) for lane in range(props['processing_units'])]
+            return(Switch(name, qmemory=self._create_qprocessor(f"qproc_{name}",props['num_memories'], nodename=name),
+                          scheduler=props.get('swap_scheduler','fifo'), requests=requests, lanes=lanes))
+
+        if 'teleport_queue_technology' in props.keys() and props['teleport_queue_technology'] == 'Quantum':
+            #If teleportation queue in node is implemented with quantum memories
+            num_memories = 4 + props['teleport_queue_size']
+        else: #Queue is implemented with classical memories
+            num_memories = 4
+        queue_size = props['teleport_queue_size'] if 'teleport_queue_technology' in props.keys() else 0
+        
+        return(EndNode(name, queue_size, qmemory=self._create_qprocessor(f"qproc_{name}",num_memories, nodename=name)))
+
+    def _create_link_instance(self, network, link_name, index_qsource):
+        '''
+        Creates an instance of a link in the network: quantum source, quantum channel and connection
+        to memory positions in both ends
+        Input:
+            - network: network where the nodes of the link are
+            - link_name: name of the link
+            - index_qsource: index of the instance
+        '''
+        props = self.get_config('links',link_name)
+        nodeA = network.get_node(props['end1'])
+        nodeB = network.get_node(props['end2'])
+        epr_state = ks.b00 if self._config['epr_pair'] == 'PHI_PLUS' else ks.b01
+
+        state_sampler = StateSampler(
+            [epr_state, ks.s00, ks.s01, ks.s10, ks.s11],
+            [props['source_fidelity_sq'], (1 - props['source_fidelity_sq'])/4, (1 - props['source_fidelity_sq'])/4,
+             (1 - props['source_fidelity_sq'])/4, (1 - props['source_fidelity_sq'])/4])
+        if self._link_source(link_name) == props['end1']:
+            qsource_origin = nodeA 
+            qsource_dest = nodeB
+        else:
+            qsource_origin = nodeB
+            qsource_dest = nodeA
+        #Setup QSource
+        source_delay = 0 if 'source_delay' not in props.keys() else float(props['source_delay'])
+        source = QSource(
+                f"qsource_{qsource_origin.name}_{link_name}_{index_qsource}", state_sampler=state_sampler, num_ports=2, status=SourceStatus.EXTERNAL,
+                models={"emission_delay_model": FixedDelayModel(delay=source_delay)})
+        qsource_origin.add_subcomponent(source)
+        # Setup Quantum Channels
+        #get channel noise model from config
+        if self.get_config('links',link_name,'qchannel_noise_model') == 'FibreDepolarizeModel':
+            qchannel_noise_model = FibreDepolarizeModel(p_depol_init=float(self.get_config('links',link_name,'p_depol_init')),
+                                                        p_depol_length=float(self.get_config('links',link_name,'p_depol_length')))
+        elif self.get_config('links',link_name,'qchannel_noise_model') == 'DephaseNoiseModel':
+            qchannel_noise_model = DephaseNoiseModel(float(self.get_config('links',link_name,'dephase_qchannel_rate')))
+        elif self.get_config('links',link_name,'qchannel_noise_model') == 'DepolarNoiseModel':
+            qchannel_noise_model = DepolarNoiseModel(float(self.get_config('links',link_name,'depolar_qchannel_rate')))
+        elif self.get_config('links',link_name,'qchannel_noise_model') == 'T1T2NoiseModel':
+            qchannel_noise_model = T1T2NoiseModel(T1=float(self.get_config('links',link_name,'t1_qchannel_time')),
+                                      T2=float(self.get_config('links',link_name,'t2_qchannel_time')))
+        elif self.get_config('links',link_name,'qchannel_noise_model') == 'FibreDepolGaussModel':
+            qchannel_noise_model = FibreDepolGaussModel()
+        else:
+            qchannel_noise_model = None
+        
+        if self.get_config('links',link_name,'qchannel_loss_model') == 'FibreLossModel':
+            qchannel_loss_model = FibreLossModel(p_loss_init=float(self.get_config('links',link_name,'p_loss_init')),
+                                                   p_loss_length=float(self.get_config('links',link_name,'p_loss_length')))
+        else:
+            qchannel_loss_model = None
+
+        qchannel = QuantumChannel(f"qchannel_{qsource_origin.name}_{qsource_dest.name}_{link_name}_{index_qsource}", 
+                length = props['distance'],
+                models={"quantum_noise_model": qchannel_noise_model, 
+                        "quantum_loss_model": qchannel_loss_model,
+                        "delay_model": FibreDelayModel(c=float(props['photon_speed_fibre']))})
+        port_name_a, port_name_b = network.add_connection(
+                qsource_origin, qsource_dest, channel_to=qchannel, 
+                label=f"qconn_{qsource_origin.name}_{qsource_dest.name}_{link_name}_{index_qsource}")
+
+        #Setup quantum ports
+        qsource_origin.subcomponents[f"qsource_{qsource_origin.name}_{link_name}_{index_qsource}"].ports["qout1"].forward_output(
+            qsource_origin.ports[port_name_a])
+        qsource_origin.subcomponents[f"qsource_{qsource_origin.name}_{link_name}_{index_qsource}"].ports["qout0"].connect(
+            qsource_origin.qmemory.ports[f"qin{self.get_mem_position(qsource_origin.name,link_name,index_qsource)}"])
+        qsource_dest.ports[port_name_b].forward_input(
+            qsource_dest.qmemory.ports[f"qin{self.get_mem_position(qsource_dest.name,link_name,index_qsource)}"])
+
+    def build_path_network(self, path):
+        '''
+        Creates a network with only the elements used by a path: its nodes, the link instances
+        assigned to the path and its classical channels. Used to simulate a path independently
+        of the size of the network.
+        Input:
+            - path: dictionary describing the path
+        Output:
+            - instance of Network
+        '''
+        network = Network(f"{self._config['name']}_{path['request']}")
+        network.add_nodes([self._create_node(node, self.get_config('nodes',node)) for node in path['nodes']])
+        self.add_path_link_instances(network, path)
+        self._create_path_classical(network, path)
+        return(network)
+
+    def add_path_link_instances(self, network, path):
+        '''
+        Creates in a path network the link instances of the path that have not been created yet.
+        Needed when new link instances are assigned to the path (purification)
+        Input:
+            - network: network created with build_path_network
+            - path: dictionary describing the path
+        '''
+        for comm in path['comms']:
+            source = network.get_node(comm['source'])
+            for link_instance in comm['links']:
+                link_name, index = link_instance.split('-')
+                if f"qsource_{source.name}_{link_name}_{index}" not in dict(source.subcomponents).keys():
+                    self._create_link_instance(network, link_name, int(index))
+
+    def _create_path_classical(self, network, path):
+        '''
+        Creates the classical connections of a path: two connections per hop (one per link instance)
+        and the end to end connection used by purification
+        Input:
+            - network: network where the nodes of the path are
+            - path: dictionary describing the path
+        '''
+        request_name = path['request']
+        nodes = path['nodes']
+        for nodepos in range(len(nodes)-1):
+            link_name = path['comms'][nodepos]['links'][0].split('-')[0]
+
+            #Get classical channel delay model
+            classical_delay_model = None
+            fibre_delay_model = self.get_config('links',link_name,'classical_delay_model')
+            if fibre_delay_model == 'FibreDelayModel':
+                classical_delay_model = FibreDelayModel(c=float(self.get_config('links',link_name,'photon_speed_fibre')))
+            elif fibre_delay_model == 'GaussianDelayModel':
+                classical_delay_model = GaussianDelayModel(delay_mean=float(self.get_config('links',link_name,'gaussian_delay_mean')),
+                                                                delay_std = float(self.get_config('links',link_name,'gaussian_delay_std')))
+            else: # In case other, we assume FibreDelayModel
+                classical_delay_model = FibreDelayModel(c=float(self.get_config('links',link_name,'photon_speed_fibre')))
+
+            #Create classical connection. We create channels even if purification is not needed
+            for i in [1,2]:
+                cconn = ClassicalConnection(name=f"cconn_{nodes[nodepos]}_{nodes[nodepos+1]}_{request_name}_{i}", 
+                                            length=self.get_config('links',link_name,'distance'))
+                cconn.subcomponents['Channel_A2B'].models['delay_model'] = classical_delay_model
+
+                port_name, port_r_name = network.add_connection(
+                    network.get_node(nodes[nodepos]), 
+                    network.get_node(nodes[nodepos+1]), 
+                    connection=cconn, label=f"cconn_{nodes[nodepos]}_{nodes[nodepos+1]}_{request_name}_{i}",
+                    port_name_node1=f"ccon_R_{nodes[nodepos]}_{request_name}_{i}", 
+                    port_name_node2=f"ccon_L_{nodes[nodepos+1]}_{request_name}_{i}")
+
+                #Forward cconn to right most node
+                if f"ccon_L_{nodes[nodepos]}_{request_name}_{i}" in network.get_node(nodes[nodepos]).ports:
+                    if self.get_config('classical_forwarding','classical_forwarding') == 'table':
+                        #Output port is resolved once, messages are not parsed in each hop
+                        network.get_node(nodes[nodepos]).ports[f"ccon_L_{nodes[nodepos]}_{request_name}_{i}"].bind_input_handler(
+                            partial(forward_message, port=network.get_node(nodes[nodepos]).ports[port_name]))
+                    else:
+                        network.get_node(nodes[nodepos]).ports[f"ccon_L_{nodes[nodepos]}_{request_name}_{i}"].bind_input_handler(
+                            partial(self._handle_message, network=network),tag_meta=True)
+
+        #Setup classical channel for purification
+        #calculate distance from first to last node
+        total_distance = 0
+        average_photon_speed = 0
+        for comm in path['comms']:
+            link_distance = self.get_config('links',comm['links'][0].split('-')[0],'distance')
+            link_photon_speed = float(self.get_config('links',comm['links'][0].split('-')[0],'photon_speed_fibre'))
+            total_distance += link_distance
+            average_photon_speed += link_photon_speed * link_distance
+        average_photon_speed = average_photon_speed / total_distance
+
+
+        conn_purif = DirectConnection(
+            f"cconn_distil_{request_name}",
+            ClassicalChannel(f"cconn_distil_{nodes[0]}_{nodes[-1]}_{request_name}", 
+                             length=total_distance,
+                             models={'delay_model': FibreDelayModel(c=average_photon_speed)}),
+            ClassicalChannel(f"cconn_distil_{nodes[-1]}_{nodes[0]}_{request_name}", 
+                             length=total_distance,
+                             models={'delay_model': FibreDelayModel(c=average_photon_speed)})
+        )
+        network.add_connection(network.get_node(nodes[0]), 
+                               network.get_node(nodes[-1]), connection=conn_purif,
+                               label=f"cconn_distil_{nodes[0]}_{nodes[-1]}_{request_name}",
+                               port_name_node1=f"ccon_distil_{nodes[0]}_{request_name}",
+                               port_name_node2=f"ccon_distil_{nodes[-1]}_{request_name}")
+
     def _measure_link_fidelity(self):
         '''
         Performs a simulation in order to estimate fidelity of each link.
@@ -416,7 +775,8 @@ class NetworkManager():
         Input: 
             - will work with self._config
         Output: 
-            - will store links with fidelities in self._link_fidelities
+            - will store links with fidelities in self._link_fidelities: cost, mean fidelity (lost qubits
+                count as fidelity 0), number of rounds and mean fidelity of the pairs that were not lost
         '''
         fidelity_values = []
         for link in self._config['links']:
@@ -433,241 +793,886 @@ class NetworkManager():
             #We want to minimize the product of the costs, not the sum. log(ab)=log(a)+log(b)
             #so we will work with logarithm
             self._link_fidelities[list(link.keys())[0]]= [-np.log(np.mean(protocol.fidelities)),np.mean(protocol.fidelities),len(protocol.fidelities)]
+            #Quality of the delivered pairs, losses are accounted for in generation time
+            received = [fidelity for fidelity in protocol.fidelities if fidelity > LOST_QUBIT_FIDELITY]
+            self._link_fidelities[list(link.keys())[0]].append(np.mean(received) if len(received) > 0 else np.mean(protocol.fidelities))
             ns.sim_stop()
             ns.sim_reset()
             self._create_network() # Network must be recreated for the simulations to work
     
+    def _second_links_available(self, path):
+        '''
+        Checks if all links of a path have an available instance for purification
+        '''
+        for comm in path['comms']:
+            link_name = comm['links'][0].split('-')[0]
+            if self._available_links[link_name]['avail'] == 0:
+                return(False)
+        return(True)
+
+    def _add_second_links(self, path):
+        '''
+        Assigns a second instance of each link to the path, needed for purification
+        '''
+        new_comms = []
+        for nodepos in range(len(path['nodes'])-1):
+            link = self.get_link(path['nodes'][nodepos],path['nodes'][nodepos+1],next_index=True)
+            for comm in path['comms']:
+                if comm['links'][0].split('-')[0] == link[0]:
+                    comm['links'].append(link[0] + '-' + str(link[1]))
+                    new_comms.append(comm)
+        path['comms'] = new_comms
+
+    def _remove_second_links(self, path):
+        '''
+        Releases the second instance of each link of the path
+        '''
+        for comm in path['comms']:
+            link_name, index = comm['links'].pop(1).split('-')
+            self.release_link(link_name, index)
+
     def _release_path_resources(self, path):
         '''
         Removes classical connections used by a path and releases quantum links for that path
         Input:
             - path: dict. Path dictionary describing calculated path from origin to destination
         '''
-        for nodepos in range(len(path['nodes'])-1):
-            nodeA = self.network.get_node(path['nodes'][nodepos])
-            nodeB = self.network.get_node(path['nodes'][nodepos+1])
-            #Delete classical connections
-            for i in [1,2]:
-                conn = self.network.get_connection(nodeA, nodeB,f"cconn_{nodeA.name}_{nodeB.name}_{path['request']}_{i}")
-                self.network.remove_connection(conn)
-                #Unable to delete ports. Will remain unconnected
-
-        #remove classical purification connection
-        connA = self.network.get_connection(self.network.get_node(path['nodes'][0]), 
-                self.network.get_node(path['nodes'][-1]),
-                f"cconn_distil_{path['nodes'][0]}_{path['nodes'][-1]}_{path['request']}")
-        #Even though classical is bidirectional, only one has to be deleted
-        self.network.remove_connection(connA)
+        #Detached managers (worker processes) have no classical connections in a complete network
+        if not self._detached:
+            for nodepos in range(len(path['nodes'])-1):
+                nodeA = self.network.get_node(path['nodes'][nodepos])
+                nodeB = self.network.get_node(path['nodes'][nodepos+1])
+                #Delete classical connections
+                for i in [1,2]:
+                    conn = self.network.get_connection(nodeA, nodeB,f"cconn_{nodeA.name}_{nodeB.name}_{path['request']}_{i}")
+                    self.network.remove_connection(conn)
+                    #Unable to delete ports. Will remain unconnected
+
+            #remove classical purification connection
+            connA = self.network.get_connection(self.network.get_node(path['nodes'][0]), 
+                    self.network.get_node(path['nodes'][-1]),
+                    f"cconn_distil_{path['nodes'][0]}_{path['nodes'][-1]}_{path['request']}")
+            #Even though classical is bidirectional, only one has to be deleted
+            self.network.remove_connection(connA)
 
         #release quantum channels used by this path
         for link in path['comms']:
-            for link_instance in link['links']:
+            for link_instance in link['links'] + [spare for spares in link.get('spares',{}).values() for spare in spares]:
                 self.release_link(link_instance.split('-')[0],link_instance.split('-')[1])       
 
     def _calculate_paths(self):
-        first = 1
-        for request in self._config['requests']:
-            request_name = list(request.keys())[0]
-            request_props = list(request.values())[0]
-
-            # Create network graph using available links
-            self._graph = nx.Graph()
-            for node in self._config['nodes']:
-                node_name = list(node.keys())[0]
-                node_props = list(node.values())[0]
-                if node_props['type'] =='switch':
-                    self._graph.add_node(node_name,color='#CF9239',style='filled',fillcolor='#CF9239')
-                else:
-                    self._graph.add_node(node_name,color='#5DABAB',style='filled',fillcolor='#5DABAB',shape='square')
-
-            for link in self._config['links']:
-                link_name = list(link.keys())[0]
-                link_props = list(link.values())[0]
-                if self._available_links[link_name]['avail']>0:
-                    self._graph.add_edge(link_props['end1'],link_props['end2'],weight=self._link_fidelities[link_name][0])
-
-            #Network graph generation, to include in report. Only generated in first iteration
-            if first:               
-                gr = nx.nx_agraph.to_agraph(self._graph)
-                gr.draw('./output/graf.png', prog='fdp')
-                first = 0
-            
+        # Create network graph. Link availability is tracked as links are assigned and released
+        self._build_graph()
+
+        requests = [(list(request.keys())[0], list(request.values())[0]) for request in self._config['requests']]
+        workers = self._config.get('admission_workers', 1)
+        try:
+            if self._config.get('admission','greedy') == 'batch':
+                self._calculate_paths_batch(requests)
+            elif workers > 1:
+                self._calculate_paths_parallel(requests, workers)
+            else:
+                for request_name, request_props in requests:
+                    self._admit_request(request_name, request_props)
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+        self._assign_spare_links()
+
+    def _worker_pool(self):
+        '''
+        Returns the pool of worker processes used by path estimations (sharded rounds and speculative
+        purification levels). It is created the first time it is needed and reused until paths are calculated
+        '''
+        if self._pool is None:
+            processes = max(self._config.get('path_fidel_workers', 1), 
+                            min(self._config.get('purification_speculation', 0) + 1, multiprocessing.cpu_count()))
+            self._pool = multiprocessing.Pool(processes=processes)
+        return(self._pool)
+
+    def _assign_spare_links(self):
+        '''
+        Multiplexing: once requests are admitted, link instances that remain available are assigned
+        to accepted paths as spares. A path can use up to multiplexing instances (global parameter
+        or request parameter) for each instance of the links it uses. Spares are assigned one by one
+        to each path in turn, so that they are shared among requests.
+        Spare instances are stored in path['comms'][hop]['spares'], by assigned instance
+        '''
+        pending = []
+        for path in self._paths:
+            multiplexing = self.get_config('requests',path['request'],'multiplexing')
+            for hop, comm in enumerate(path['comms']):
+                comm['spares'] = {link_instance: [] for link_instance in comm['links']}
+                if multiplexing > 1:
+                    pending += [(path, hop, link_instance, multiplexing - 1) for link_instance in comm['links']]
+
+        while len(pending) > 0:
+            remaining = []
+            for path, hop, link_instance, spares in pending:
+                link = self.get_link(path['nodes'][hop], path['nodes'][hop+1], next_index=True)
+                if link == 'NOLINK':
+                    #No more available instances in the link
+                    continue
+                path['comms'][hop]['spares'][link_instance].append(link[0] + '-' + str(link[1]))
+                if spares > 1:
+                    remaining.append((path, hop, link_instance, spares - 1))
+            pending = remaining
+
+    def _calculate_paths_batch(self, requests):
+        '''
+        Admission of all requests at once. Candidate paths of each request are estimated analytically
+        (needed link instances) and the set of requests and paths that maximizes utility within link
+        capacities is chosen. Chosen paths are simulated in order. Then, requests not chosen are
+        evaluated as usual with the remaining resources.
+        Input:
+            - requests: list of tuples (request name, request parameters) in configuration order
+        '''
+        candidates = []
+        options = []
+        for request_name, request_props in requests:
+            request_candidates = []
+            request_options = []
+            try:
+                for candidate in self._candidate_paths(request_props['origin'],request_props['destination']):
+                    links = self._path_links(candidate)
+                    instances = self._analytic_instances(links, request_props)
+                    if instances is not None and self._min_generation_time(candidate) <= request_props['maxtime']:
+                        request_candidates.append(candidate)
+                        request_options.append({link: instances for link in links})
+            except nx.exception.NetworkXNoPath:
+                pass
+            candidates.append(request_candidates)
+            options.append(request_options)
+
+        utilities = [float(request_props.get('utility', 1)) for request_name, request_props in requests]
+        capacity = {link_name: self._available_links[link_name]['avail'] for link_name in self._available_links.keys()}
+        plan = plan_admission(options, utilities, capacity)
+
+        for (request_name, request_props), request_candidates, choice in zip(requests, candidates, plan):
+            if choice is not None:
+                self._admit_request(request_name, request_props, [request_candidates[choice]])
+        for (request_name, request_props), choice in zip(requests, plan):
+            if choice is None:
+                self._admit_request(request_name, request_props)
+
+        #Decisions and paths are kept in configuration order, as in the other admission modes
+        order = {request_name: position for position, (request_name, request_props) in enumerate(requests)}
+        self._requests_status.sort(key=lambda status: order[status['request']])
+        self._paths.sort(key=lambda path: order[path['request']])
+
+    def _calculate_paths_parallel(self, requests, workers):
+        '''
+        Admission of requests evaluating in worker processes groups of consecutive requests whose
+        candidate paths do not share links. Results are committed in configuration order.
+        Each request of a group is simulated in a network with only its path elements, with a seed drawn
+        from the random stream of this process in configuration order. Results are reproducible between
+        parallel runs, for any number of workers, but not against serial admission, whose estimations
+        use the complete network and the random state left by previous requests
+        Input:
+            - requests: list of tuples (request name, request parameters) in configuration order
+            - workers: number of worker processes
+        '''
+        print(f"Admission evaluated in {workers} processes. Results can differ from serial admission (admission_workers 1)")
+        pending = list(requests)
+        with multiprocessing.Pool(processes=workers) as pool:
+            while len(pending) > 0:
+                group = self._disjoint_requests(pending)
+                if len(group) < 2:
+                    #Nothing to parallelize
+                    request_name, request_props = pending.pop(0)
+                    self._admit_request(request_name, request_props)
+                    continue
+
+                tasks = [(self._config, self._memory_assignment, self._available_links, self._link_fidelities,
+                          request_name, request_props, candidates, ns.get_random_state().randint(2**31)) 
+                         for request_name, request_props, candidates, links_state in group]
+                results = pool.map(_admit_request_worker, tasks)
+                for (request_name, request_props, candidates, links_state), result in zip(group, results):
+                    pending.pop(0)
+                    self._commit_admission(request_name, request_props, candidates, links_state, result)
+
+    def _disjoint_requests(self, pending):
+        '''
+        Gets the longest group of consecutive pending requests whose candidate paths do not share links
+        Input:
+            - pending: list of tuples (request name, request parameters) in configuration order
+        Output:
+            - list of tuples (request name, request parameters, candidate paths, state of their links)
+        '''
+        group = []
+        used_links = set()
+        for request_name, request_props in pending:
             try:
-                shortest_path = nx.shortest_path(self._graph,source=request_props['origin'],target=request_props['destination'], weight='weight')
-                purif_rounds = 0
-                path = {
+                candidates = self._screen_candidates(
+                    self._candidate_paths(request_props['origin'],request_props['destination']), request_props)
+            except nx.exception.NetworkXNoPath:
+                break
+            links = set([self._graph.edges[candidate[nodepos],candidate[nodepos+1]]['link'] 
+                         for candidate in candidates for nodepos in range(len(candidate)-1)])
+            if used_links.intersection(links):
+                break
+            used_links.update(links)
+            group.append((request_name, request_props, candidates, self._links_state(links)))
+        return(group)
+
+    def _links_state(self, links):
+        '''
+        Returns the available and occupied instances of the specified links
+        '''
+        return({link: (self._available_links[link]['avail'], sorted(self._available_links[link]['occupied'])) 
+                for link in links})
+
+    def _commit_admission(self, request_name, request_props, candidates, links_state, result):
+        '''
+        Stores the admission decision of a request evaluated in a worker process.
+        If the candidate paths of the request or the state of their links have changed since the evaluation, 
+        because of previous requests, the request is evaluated again in this process. This way 
+        decisions are taken on the same resources as in serial admission, although with estimations
+        of a different simulation (see _calculate_paths_parallel).
+        Input:
+            - request_name: name of the request
+            - request_props: dictionary with the request parameters
+            - candidates: candidate paths evaluated by the worker
+            - links_state: state of the links of the candidates when the request was evaluated
+            - result: dictionary returned by the worker
+        '''
+        #Estimations are valid even if the request has to be evaluated again
+        self._merge_worker_cache(result)
+
+        try:
+            current_candidates = self._screen_candidates(
+                self._candidate_paths(request_props['origin'],request_props['destination']), request_props)
+        except nx.exception.NetworkXNoPath:
+            current_candidates = None
+        if current_candidates != candidates or self._links_state(list(links_state.keys())) != links_state:
+            #Conflict, evaluate serially
+            self._admit_request(request_name, request_props)
+            return
+
+        path = result['path']
+        if path is not None:
+            #Reserve link instances. As links state has not changed, indexes are the ones assigned by the worker
+            for nodepos in range(len(path['nodes'])-1):
+                for link_instance in path['comms'][nodepos]['links']:
+                    self.get_link(path['nodes'][nodepos],path['nodes'][nodepos+1],next_index=True)
+            self._create_path_classical(self.network, path)
+            self._paths.append(path)
+        self._requests_status.append(result['status'])
+
+    def _admit_request(self, request_name, request_props, candidates=None):
+        '''
+        Calculates the path of a request and decides if it is accepted, rejected or needs purification,
+        simulating the path. Accepted paths are stored in _paths and the decision in _requests_status.
+        If several candidate paths are considered (global parameter routing_candidates), promising ones
+        are tried in order until one is accepted.
+        Input:
+            - request_name: name of the request
+            - request_props: dictionary with the request parameters
+            - candidates: list of candidate paths (lists of nodes) already screened. If None (default),
+                they are calculated
+        '''
+        try:
+            if candidates is None:
+                candidates = self._screen_candidates(
+                    self._candidate_paths(request_props['origin'],request_props['destination']), request_props)
+        except nx.exception.NetworkXNoPath:
+            shortest_path = 'NOPATH'
+            self._requests_status.append({
+                        'request': request_name, 
+                        'shortest_path': shortest_path,
+                        'result': 'rejected', 
+                        'reason': 'no available resources',
+                        'purif_rounds': '-',
+                        'fidelity': 0,
+                        'time': 0,
+                        'samples': 0})
+            return
+
+        samples = 0
+        for attempt, candidate in enumerate(candidates):
+            accepted = self._admit_path(request_name, request_props, candidate)
+            samples += self._requests_status[-1]['samples']
+            if accepted or attempt == len(candidates) - 1:
+                break
+            #Only the decision for the last tried path is stored
+            self._requests_status.pop()
+        self._requests_status[-1]['samples'] = samples
+
+    def _candidate_paths(self, origin, destination):
+        '''
+        Calculates candidate paths between two nodes using available links: the shortest path or, 
+        if global parameter routing_candidates is greater than 1, up to that number of shortest
+        simple paths (Yen's algorithm) ordered by cost
+        Input:
+            - origin, destination: names of the nodes
+        Output:
+            - list of paths (lists of node names)
+        '''
+        num_candidates = self._config.get('routing_candidates', 1)
+        if num_candidates == 1:
+            return([self._shortest_path(origin, destination)])
+        if origin not in self._graph or destination not in self._graph:
+            raise nx.exception.NetworkXNoPath(f"No path between {origin} and {destination}")
+        return(list(islice(nx.shortest_simple_paths(self._available_graph(), origin, destination, weight='weight'), num_candidates)))
+
+    def _screen_candidates(self, candidates, request_props):
+        '''
+        Discards candidate paths that analytically cannot fulfill the request: those whose minimum
+        generation time is above maxtime and those whose estimated fidelity is below minfidelity and 
+        cannot be purified, because purification does not reach minfidelity or because there are no
+        link instances for it.
+        If no candidate is promising, the first one is kept so that the request is evaluated by simulation.
+        Input:
+            - candidates: list of paths (lists of node names)
+            - request_props: dictionary with the request parameters
+        Output:
+            - list of candidate paths to simulate, in the same order
+        '''
+        if len(candidates) == 1:
+            return(candidates)
+
+        promising = []
+        for candidate in candidates:
+            if self._min_generation_time(candidate) > request_props['maxtime']:
+                continue
+            links = self._path_links(candidate)
+            instances = self._analytic_instances(links, request_props)
+            if instances == 1 or \
+                (instances == 2 and all([self._available_links[link]['avail'] >= 2 for link in links])):
+                promising.append(candidate)
+        return(promising if len(promising) > 0 else candidates[:1])
+
+    def _min_generation_time(self, nodes):
+        '''
+        Lower bound of the expected time to generate an end to end pair in a path without purification:
+        lower bound of a generation attempt in which no qubit is lost plus the expected time of failed
+        attempts, which last until the lost qubit timer is over, given the probability that no qubit
+        is lost in any link (links with FibreLossModel). With per link restart, only the attempts
+        of each link are repeated, so the bound is the time of an attempt without losses plus
+        the expected time of the failed attempts of the worst link
+        Input:
+            - nodes: list of node names of the path
+        Output:
+            - time in nanoseconds
+        '''
+        links = [self.get_link(nodes[nodepos],nodes[nodepos+1]) for nodepos in range(len(nodes)-1)]
+        success = 1
+        retries_time = 0
+        for link in links:
+            if self.get_config('links',link,'qchannel_loss_model') == 'FibreLossModel':
+                link_success = link_success_probability(float(self.get_config('links',link,'p_loss_init')),
+                                                    float(self.get_config('links',link,'p_loss_length')),
+                                                    float(self.get_config('links',link,'distance')))
+                if link_success == 0:
+                    return(float('inf'))
+                success *= link_success
+                #Failed attempts of the link last at least its transmission time
+                link_delay = 1e9 * float(self.get_config('links',link,'distance')) / float(self.get_config('links',link,'photon_speed_fibre'))
+                retries_time = max(retries_time, (1 / link_success - 1) * link_delay)
+        if success == 0:
+            return(float('inf'))
+        if self.get_config('restart_policy','restart_policy') == 'per_link':
+            return(generation_lower_bound(self, nodes, links) + retries_time)
+        #Timer of failed attempts as set by RouteProtocol
+        return(generation_lower_bound(self, nodes, links) + (1 / success - 1) * (generation_delay(self, nodes, links) + 100))
+
+    def _path_links(self, nodes):
+        '''
+        Returns the names of the links of a path given by its nodes
+        '''
+        return([self._graph.edges[nodes[nodepos],nodes[nodepos+1]]['link'] for nodepos in range(len(nodes)-1)])
+
+    def _analytic_instances(self, links, request_props):
+        '''
+        Estimates, from the measured fidelities of the pairs delivered by each link, the instances of each
+        link that a path needs in order to fulfill the minimum fidelity of a request. Lost qubits are not
+        taken into account, as they only delay generation
+        Input:
+            - links: list of link names of the path
+            - request_props: dictionary with the request parameters
+        Output:
+            - 1 if no purification is needed, 2 if purification is needed or None if minfidelity 
+                cannot be reached
+        '''
+        fidelity = swapped_fidelity([self._link_fidelities[link][3] for link in links])
+        if fidelity >= request_props['minfidelity']:
+            return(1)
+        if reachable_fidelity(fidelity) >= request_props['minfidelity'] - PLANNER_FIDELITY_MARGIN:
+            return(2)
+        return(None)
+
+    def _admit_path(self, request_name, request_props, shortest_path):
+        '''
+        Decides if a request is accepted, rejected or needs purification using a path, simulating it.
+        Input:
+            - request_name: name of the request
+            - request_props: dictionary with the request parameters
+            - shortest_path: list of nodes of the path
+        Output:
+            - True if the request is accepted
+        '''
+        #Lower bound of generation time. If it is above maxtime, there is no need to simulate
+        min_time = self._min_generation_time(shortest_path)
+        if min_time > request_props['maxtime']:
+            self._requests_status.append({
+                'request': request_name, 
+                'shortest_path': shortest_path,
+                'result': 'rejected', 
+                'reason': 'maxtime infeasible (analytic)',
+                'purif_rounds': 0,
+                'fidelity': 0,
+                'time': min_time,
+                'samples': 0})
+            return(False)
+
+        purif_rounds = 0
+        path = {
+            'request': request_name, 
+            'nodes': shortest_path, 
+            'purif_rounds': purif_rounds,
+            'comms': []}
+        for nodepos in range(len(shortest_path)-1):
+            #Get link connecting nodes
+            link = self.get_link(shortest_path[nodepos],shortest_path[nodepos+1],next_index=True)
+            #Determine which of the 2 nodes connected by the link is the source
+            source = self._link_source(link[0])
+            #Add quantum link to path
+            path['comms'].append({'links': [link[0] + '-' + str(link[1])], 'source': source})
+
+        #Create classical channels of the path
+        if not self._detached:
+            self._create_path_classical(self.network, path)
+        #If configured, path is simulated in a network with only its elements.
+        #Detached managers (worker processes) have no complete network
+        path_network = self.build_path_network(path) \
+            if self._detached or self._config.get('path_subnetwork', False) else None
+        end_simul = False
+
+        #get measurements to do for average fidelity
+        fidel_rounds = request_props['path_fidel_rounds'] \
+            if 'path_fidel_rounds' in request_props.keys() else self._config['path_fidel_rounds']
+ 
+        #Initially no purification
+        protocol = PathFidelityProtocol(self,path,fidel_rounds, purif_rounds, network=path_network) #We measure E2E fidelity accordingly to config file times
+        
+        samples = 0 #Total number of simulated rounds for the request
+        estimations = {} #Results for each simulated number of purification rounds
+        planner = self._config.get('purification_planner','none') == 'analytic'
+
+        #Speculative evaluation: second link instances are reserved and several purification
+        #levels are simulated at once in worker processes
+        speculation = 0 if self._detached else self._config.get('purification_speculation', 0)
+        speculative_links = speculation > 0 and self._second_links_available(path)
+        if speculative_links:
+            self._add_second_links(path)
+            if path_network is not None:
+                self.add_path_link_instances(path_network, path)
+            estimations = self._estimate_levels(path, request_props, fidel_rounds, speculation)
+            samples = sum([estimation['samples'] for estimation in estimations.values()])
+
+        while end_simul == False:
+            if purif_rounds not in estimations and purif_rounds * min_time > request_props['maxtime']:
+                #Each purification round needs at least a new pair, so time cannot be fulfilled
+                self._requests_status.append({
                     'request': request_name, 
-                    'nodes': shortest_path, 
+                    'shortest_path': shortest_path,
+                    'result': 'rejected', 
+                    'reason': 'maxtime infeasible (analytic)',
                     'purif_rounds': purif_rounds,
-                    'comms': []}
-                for nodepos in range(len(shortest_path)-1):
-                    #Get link connecting nodes
-                    link = self.get_link(shortest_path[nodepos],shortest_path[nodepos+1],next_index=True)
-                    #Determine which of the 2 nodes connected by the link is the source
-                    source = shortest_path[nodepos] \
-                        if f"qsource_{shortest_path[nodepos]}_{link[0]}_{link[1]}" \
-                            in (dict(self.network.get_node(shortest_path[nodepos]).subcomponents)).keys() \
-                                else shortest_path[nodepos+1]
-                    #Add quantum link to path
-                    path['comms'].append({'links': [link[0] + '-' + str(link[1])], 'source': source})
-
-                    #Get classical channel delay model
-                    classical_delay_model = None
-                    fibre_delay_model = self.get_config('links',link[0], 'classical_delay_model')
-                    if fibre_delay_model == 'NOT_FOUND' or fibre_delay_model == 'FibreDelayModel':
-                        classical_delay_model = FibreDelayModel(c=float(self.get_config('links',link[0],'photon_speed_fibre')))
-                    elif fibre_delay_model == 'GaussianDelayModel':
-                        classical_delay_model = GaussianDelayModel(delay_mean=float(self.get_config('links',link[0],'gaussian_delay_mean')),
-                                                                        delay_std = float(self.get_config('links',link[0],'gaussian_delay_std')))
-                    else: # In case other, we assume FibreDelayModel
-                        classical_delay_model = FibreDelayModel(c=float(self.get_config('links',link[0],'photon_speed_fibre')))
-
-                    #Create classical connection. We create channels even if purification is not needed
-                    for i in [1,2]:
-                        cconn = ClassicalConnection(name=f"cconn_{shortest_path[nodepos]}_{shortest_path[nodepos+1]}_{request_name}_{i}", 
-                                                    length=self.get_config('links',link[0],'distance'))
-                        cconn.subcomponents['Channel_A2B'].models['delay_model'] = classical_delay_model
-
-                        port_name, port_r_name = self.network.add_connection(
-                            self.network.get_node(shortest_path[nodepos]), 
-                            self.network.get_node(shortest_path[nodepos+1]), 
-                            connection=cconn, label=f"cconn_{shortest_path[nodepos]}_{shortest_path[nodepos+1]}_{request_name}_{i}",
-                            port_name_node1=f"ccon_R_{shortest_path[nodepos]}_{request_name}_{i}", 
-                            port_name_node2=f"ccon_L_{shortest_path[nodepos+1]}_{request_name}_{i}")
-
-                        #Forward cconn to right most node
-                        if f"ccon_L_{path['nodes'][nodepos]}_{request_name}_{i}" in self.network.get_node(path['nodes'][nodepos]).ports:
-                            self.network.get_node(path['nodes'][nodepos]).ports[f"ccon_L_{path['nodes'][nodepos]}_{request_name}_{i}"].bind_input_handler(self._handle_message,tag_meta=True)
-
-                #Setup classical channel for purification
-                #calculate distance from first to last node
-                total_distance = 0
-                average_photon_speed = 0
-                for comm in path['comms']:
-                    link_distance = self.get_config('links',comm['links'][0].split('-')[0],'distance')
-                    link_photon_speed = float(self.get_config('links',comm['links'][0].split('-')[0],'photon_speed_fibre'))
-                    total_distance += link_distance
-                    average_photon_speed += link_photon_speed * link_distance
-                average_photon_speed = average_photon_speed / total_distance
-
-
-                conn_purif = DirectConnection(
-                    f"cconn_distil_{request_name}",
-                    ClassicalChannel(f"cconn_distil_{shortest_path[0]}_{shortest_path[-1]}_{request_name}", 
-                                     length=total_distance,
-                                     models={'delay_model': FibreDelayModel(c=average_photon_speed)}),
-                    ClassicalChannel(f"cconn_distil_{shortest_path[-1]}_{shortest_path[0]}_{request_name}", 
-                                     length=total_distance,
-                                     models={'delay_model': FibreDelayModel(c=average_photon_speed)})
-                )
-                self.network.add_connection(self.network.get_node(shortest_path[0]), 
-                                           self.network.get_node(shortest_path[-1]), connection=conn_purif,
-                                           label=f"cconn_distil_{shortest_path[0]}_{shortest_path[-1]}_{request_name}",
-                                           port_name_node1=f"ccon_distil_{shortest_path[0]}_{request_name}",
-                                           port_name_node2=f"ccon_distil_{shortest_path[-1]}_{request_name}")
-                end_simul = False
-
-                #get measurements to do for average fidelity
-                fidel_rounds = request_props['path_fidel_rounds'] \
-                    if 'path_fidel_rounds' in request_props.keys() else self._config['path_fidel_rounds']
- 
-                #Initially no purification
-                protocol = PathFidelityProtocol(self,path,fidel_rounds, purif_rounds) #We measure E2E fidelity accordingly to config file times
+                    'fidelity': 0,
+                    'time': purif_rounds * min_time,
+                    'samples': samples})
+                self._release_path_resources(path)
+                end_simul = True
+                continue
+            if purif_rounds not in estimations:
+                estimations[purif_rounds] = self._estimate_path(protocol, path, request_props, purif_rounds, fidel_rounds)
+                samples += estimations[purif_rounds]['samples']
+            estimation = estimations[purif_rounds]
+            fidelity_ok = estimation['fidelity'] >= request_props['minfidelity']
+
+            if fidelity_ok and purif_rounds > 1 and purif_rounds - 1 not in estimations:
+                #Purification rounds were predicted, check that one round less is not enough
+                purif_rounds -= 1
+                protocol.set_purif_rounds(purif_rounds)
+                continue
+            if not fidelity_ok and purif_rounds + 1 in estimations:
+                #One more round was already simulated and is enough
+                purif_rounds += 1
+                estimation = estimations[purif_rounds]
+                fidelity_ok = True
+
+            if estimation['time'] > request_props['maxtime']:
+                #request cannot be fulfilled. Mark as rejected and continue
+                self._requests_status.append({
+                    'request': request_name, 
+                    'shortest_path': shortest_path,
+                    'result': 'rejected', 
+                    'reason': 'cannot fulfill time',
+                    'purif_rounds': purif_rounds,
+                    'fidelity': estimation['fidelity'],
+                    'time': estimation['time'],
+                    'samples': samples})
                 
-                while end_simul == False:
-                    dc = dc_setup(protocol)
-                    protocol.start()
-                    ns.sim_run()
-                    protocol.stop()
-                    
-                    print(f"Request {request_name} purification rounds {purif_rounds} fidelity {dc.dataframe['Fidelity'].mean()}/{request_props['minfidelity']} in {dc.dataframe['time'].mean()}/{request_props['maxtime']} nanoseconds, data points: {len(dc.dataframe)}")
-                    if dc.dataframe["time"].mean() > request_props['maxtime']:
-                        #request cannot be fulfilled. Mark as rejected and continue
+                #release classical and quantum channels
+                self._release_path_resources(path)
+
+                end_simul = True
+            elif fidelity_ok:
+                #request can be fulfilled
+                if purif_rounds == 0 and speculative_links:
+                    #Second link instances are not needed
+                    self._remove_second_links(path)
+                self._requests_status.append({
+                    'request': request_name, 
+                    'shortest_path': shortest_path,
+                    'result': 'accepted', 
+                    'reason': '-',
+                    'purif_rounds': purif_rounds,
+                    'fidelity': estimation['fidelity'],
+                    'time': estimation['time'],
+                    'samples': samples})
+                path['purif_rounds'] = purif_rounds
+                self._paths.append(path)
+                end_simul=True
+            else: #purification is needed
+                next_purif_rounds = purif_rounds + 1
+                if purif_rounds == 0 and planner:
+                    #Predict needed purification rounds from the fidelity without purification
+                    next_purif_rounds = plan_purification(estimation['fidelity'], estimation['time'],
+                                                          request_props['minfidelity'], request_props['maxtime'])
+                    if next_purif_rounds is None:
+                        #Request cannot be fulfilled with purification
                         self._requests_status.append({
                             'request': request_name, 
                             'shortest_path': shortest_path,
                             'result': 'rejected', 
-                            'reason': 'cannot fulfill time',
+                            'reason': 'purification infeasible (analytic)',
                             'purif_rounds': purif_rounds,
-                            'fidelity': dc.dataframe["Fidelity"].mean(),
-                            'time': dc.dataframe["time"].mean()})
-                        
-                        #release classical and quantum channels
+                            'fidelity': estimation['fidelity'],
+                            'time': estimation['time'],
+                            'samples': samples})
                         self._release_path_resources(path)
-
                         end_simul = True
-                    elif dc.dataframe["Fidelity"].mean() >= request_props['minfidelity']:
-                        #request can be fulfilled
-                        self._requests_status.append({
-                            'request': request_name, 
-                            'shortest_path': shortest_path,
-                            'result': 'accepted', 
-                            'reason': '-',
-                            'purif_rounds': purif_rounds,
-                            'fidelity': dc.dataframe["Fidelity"].mean(),
-                            'time': dc.dataframe["time"].mean()})
-                        path['purif_rounds'] = purif_rounds
-                        self._paths.append(path)
-                        end_simul=True
-                    else: #purification is needed
-                        purif_rounds += 1
-                        #if first time with purification add second quantum link in path
-                        if purif_rounds == 1:
-                            #check if we have available link resources for second path
-                            available_resources = True
-                            for comm in path['comms']:
-                                link_name = comm['links'][0].split('-')[0]
-                                if self._available_links[link_name]['avail'] == 0:
-                                    available_resources = False
-                                    break
-
-                            if not available_resources:
-                                #No available resources for second link instance, must free path resources
-                                self._release_path_resources(path)
-
-                                #return no path
-                                shortest_path = 'NOPATH'
-                                self._requests_status.append({
-                                    'request': request_name, 
-                                    'shortest_path': shortest_path,
-                                    'result': 'rejected', 
-                                    'reason': 'no available resources',
-                                    'purif_rounds': 'na',
-                                    'fidelity': 0,
-                                    'time': 0})
-                                
-                                end_simul = True
-
-                            else:
-                                new_comms = []
-                                for nodepos in range(len(shortest_path)-1):
-                                    link = self.get_link(shortest_path[nodepos],shortest_path[nodepos+1],next_index=True)
-                                    for comm in path['comms']:
-                                        if comm['links'][0].split('-')[0] == link[0]:
-                                            comm['links'].append(link[0] + '-' + str(link[1]))
-                                            new_comms.append(comm)
-                                path['comms'] = new_comms   
-                                protocol.set_purif_rounds(purif_rounds)
-
-                        else:
-                            protocol.set_purif_rounds(purif_rounds)
+                        continue
 
-            except nx.exception.NetworkXNoPath:
-                shortest_path = 'NOPATH'
-                self._requests_status.append({
+                #if first time with purification add second quantum link in path
+                if purif_rounds == 0 and not speculative_links:
+                    #check if we have available link resources for second path
+                    if not self._second_links_available(path):
+                        #No available resources for second link instance, must free path resources
+                        self._release_path_resources(path)
+
+                        #return no path
+                        shortest_path = 'NOPATH'
+                        self._requests_status.append({
                             'request': request_name, 
                             'shortest_path': shortest_path,
                             'result': 'rejected', 
                             'reason': 'no available resources',
-                            'purif_rounds': '-',
+                            'purif_rounds': 'na',
                             'fidelity': 0,
-                            'time': 0})
+                            'time': 0,
+                            'samples': samples})
+                        
+                        end_simul = True
+                        continue
+
+                    self._add_second_links(path)
+                    if path_network is not None:
+                        self.add_path_link_instances(path_network, path)
 
-    def _handle_message(self,msg):
+                purif_rounds = next_purif_rounds
+                protocol.set_purif_rounds(purif_rounds)
+
+        return(self._requests_status[-1]['result'] == 'accepted')
+
+    def _path_signature(self, path, request_props, purif_rounds, fidel_rounds):
+        '''
+        Calculates the signature of a path estimation, used as key in the path cache.
+        Includes the parameters of the links and nodes in the path (in order), the purification rounds,
+        the EPR pair, the restart policy, the correction mode and the estimation parameters.
+        Input:
+            - path: dictionary describing the path
+            - request_props: dictionary with the request parameters
+            - purif_rounds: purification rounds being simulated
+            - fidel_rounds: maximum number of rounds to simulate
+        Output:
+            - string with signature
+        '''
+        signature = []
+        for nodepos, comm in enumerate(path['comms']):
+            link_name = comm['links'][0].split('-')[0]
+            #Number of instances does not change the result of the simulation
+            link_props = {key: value for key, value in self.get_config('links',link_name).items() if key != 'number_links'}
+            signature.append(parameters_hash(link_props))
+            signature.append(comm['source'] == path['nodes'][nodepos])
+        for node in path['nodes']:
+            signature.append(parameters_hash(self.get_config('nodes',node)))
+        signature += [purif_rounds, self._config['epr_pair'], fidel_rounds]
+        if self._config.get('path_engine','netsquid') == 'analytic':
+            signature.append('analytic')
+        if self.get_config('restart_policy','restart_policy') != 'end_to_end':
+            signature.append(self.get_config('restart_policy','restart_policy'))
+        if self.get_config('correction_mode','correction_mode') != 'physical':
+            signature.append(self.get_config('correction_mode','correction_mode'))
+        if self._config.get('path_fidel_test','fixed') == 'sequential':
+            #Number of simulated rounds depends on request requirements
+            signature += [self._config.get('path_fidel_error_rate',0.05), self._config.get('path_fidel_min_rounds',30),
+                          request_props['minfidelity'], request_props['maxtime']]
+        return(parameters_hash({'path': signature}))
+
+    def _estimate_path(self, protocol, path, request_props, purif_rounds, fidel_rounds):
+        '''
+        Simulates the path of a request in order to estimate end to end fidelity and generation time.
+        If global parameter path_fidel_test is sequential, simulation stops as soon as the decision
+        (accept, reject or purify) is statistically determined.
+        If path cache is enabled, results are reused for paths with the same signature.
+        Input:
+            - protocol: instance of PathFidelityProtocol for the path
+            - path: dictionary describing the path
+            - request_props: dictionary with the request parameters
+            - purif_rounds: purification rounds being simulated
+            - fidel_rounds: maximum number of rounds to simulate
+        Output:
+            - dictionary with mean fidelity, mean time and number of simulated rounds (samples)
+        '''
+        if self._path_cache is not None:
+            signature = self._path_signature(path, request_props, purif_rounds, fidel_rounds)
+            estimation = self._path_cache.get(signature)
+            if estimation is not None:
+                print(f"Request {path['request']} purification rounds {purif_rounds} fidelity {estimation['fidelity']}/{request_props['minfidelity']} in {estimation['time']}/{request_props['maxtime']} nanoseconds, cached data points: {estimation['samples']}")
+                #No simulation was needed
+                estimation['samples'] = 0
+                return(estimation)
+
+        #Worker processes cannot start other workers
+        workers = 1 if self._detached else self._config.get('path_fidel_workers', 1)
+        model = self._bell_diagonal_model(path) if self._config.get('path_engine','netsquid') == 'analytic' else None
+        if model is not None:
+            #Analytic engine: Bell diagonal states are propagated along the path
+            stop_rule = self._stop_rule(request_props, fidel_rounds) \
+                if self._config.get('path_fidel_test','fixed') == 'sequential' else None
+            rng = np.random.default_rng(ns.get_random_state().randint(2**31))
+            rounds = pd.DataFrame(sample_path(model, purif_rounds, fidel_rounds, rng, stop_rule))
+        elif workers > 1 and fidel_rounds / workers >= MIN_SHARD_ROUNDS:
+            rounds = self._estimate_path_sharded(path, request_props, purif_rounds, fidel_rounds, workers)
+        else:
+            if self._config.get('path_fidel_test','fixed') == 'sequential':
+                protocol.set_stop_rule(self._stop_rule(request_props, fidel_rounds))
+            dc = dc_setup(protocol)
+            protocol.start()
+            ns.sim_run()
+            protocol.stop()
+            rounds = dc.dataframe
+
+        estimation = {
+            'fidelity': rounds['Fidelity'].mean(),
+            'fidelity_std': rounds['Fidelity'].std(),
+            'time': rounds['time'].mean(),
+            'time_std': rounds['time'].std(),
+            'samples': len(rounds)}
+        print(f"Request {path['request']} purification rounds {purif_rounds} fidelity {estimation['fidelity']}/{request_props['minfidelity']} in {estimation['time']}/{request_props['maxtime']} nanoseconds, data points: {estimation['samples']}")
+
+        if self._path_cache is not None:
+            self._path_cache.put(signature, estimation)
+        return(estimation)
+
+    def _estimate_levels(self, path, request_props, fidel_rounds, max_purif_rounds):
+        '''
+        Simulates in parallel, in worker processes, the path with 0 to max_purif_rounds purification rounds
+        Input:
+            - path: dictionary describing the path, with two instances of each link
+            - request_props: dictionary with the request parameters
+            - fidel_rounds: maximum number of rounds to simulate
+            - max_purif_rounds: maximum number of purification rounds to simulate
+        Output:
+            - dictionary with the estimation for each number of purification rounds
+        '''
+        tasks = [(self._config, self._memory_assignment, path, request_props, purif_rounds, fidel_rounds, 
+                  ns.get_random_state().randint(2**31)) for purif_rounds in range(max_purif_rounds + 1)]
+        results = self._worker_pool().map(_estimate_level_worker, tasks)
+
+        estimations = {}
+        for purif_rounds, result in enumerate(results):
+            self._merge_worker_cache(result)
+            estimations[purif_rounds] = result['estimation']
+        return(estimations)
+
+    def _worker_cache(self):
+        '''
+        Returns path cache counters and results not stored yet of a detached manager
+        '''
+        return({
+            'cache_hits': self._path_cache.hits if self._path_cache else 0,
+            'cache_misses': self._path_cache.misses if self._path_cache else 0,
+            'cache_pending': self._path_cache.pending if self._path_cache else {}})
+
+    def _merge_worker_cache(self, result):
+        '''
+        Adds path cache counters of a worker and stores the results it calculated
+        '''
+        if self._path_cache is not None:
+            self._path_cache.hits += result['cache_hits']
+            self._path_cache.misses += result['cache_misses']
+            for signature, estimation in result['cache_pending'].items():
+                self._path_cache.put(signature, estimation)
+
+    def _bell_diagonal_model(self, path):
+        '''
+        Describes a path for the analytic engine (see analytic.sample_path): noise of links, memories
+        and gates as depolarizing or dephasing noise, link losses and delays.
+        Input:
+            - path: dictionary describing the path
+        Output:
+            - dictionary with the model or None if a noise model of the path does not keep states
+                Bell diagonal (T1T2NoiseModel) or the path uses features that are not modelled: restart
+                per link, spare links (multiplexing), coalesced correction messages, table forwarding
+                of classical messages or switches with several processing units. Then the path has to be simulated.
+        '''
+        nodes = path['nodes']
+        links = [comm['links'][0].split('-')[0] for comm in path['comms']]
+        if any([self.get_config('links',link,'qchannel_noise_model') == 'T1T2NoiseModel' for link in links]) or \
+            any([self.get_config('nodes',node,'mem_noise_model') == 'T1T2NoiseModel' or 
+                 self.get_config('nodes',node,'gate_noise_model') == 'T1T2NoiseModel' for node in nodes]):
+            print(f"Request {path['request']}: noise models are not Bell diagonal, path will be simulated")
+            return(None)
+        if self.get_config('restart_policy','restart_policy') == 'per_link':
+            print(f"Request {path['request']}: analytic model assumes end to end restart, path will be simulated")
+            return(None)
+        #Features with an effect on latency or fidelity that the analytic model ignores
+        features = []
+        if int(self.get_config('requests',path['request'],'multiplexing')) > 1:
+            features.append('spare links (multiplexing)')
+        if self.get_config('correction_messages','correction_messages') == 'coalesced':
+            features.append('coalesced correction messages')
+        if self.get_config('classical_forwarding','classical_forwarding') == 'table':
+            features.append('table classical forwarding')
+        if any([self.get_config('nodes',node,'processing_units',default=1) > 1 for node in nodes[1:-1]]):
+            features.append('processing units')
+        if len(features) > 0:
+            print(f"Request {path['request']}: analytic model does not model {', '.join(features)}, path will be simulated")
+            return(None)
+
+        def node_noise(node, kind):
+            #kind: 'mem' or 'gate'
+            noise_model = self.get_config('nodes',node,f"{kind}_noise_model")
+            if noise_model == 'DephaseNoiseModel':
+                return(('dephase', float(self.get_config('nodes',node,f"dephase_{kind}_rate"))))
+            elif noise_model == 'DepolarNoiseModel':
+                return(('depolar', float(self.get_config('nodes',node,f"depolar_{kind}_rate"))))
+            return(None)
+
+        def duration(node, property, default):
+            return(self.get_config('nodes',node,property,default=default))
+
+        model = {'links': [], 'success': 1}
+        for nodepos, link in enumerate(links):
+            props = self.get_config('links',link)
+            channel = []
+            if props.get('qchannel_noise_model') == 'FibreDepolarizeModel':
+                channel.append(('depolar_prob', 1 - (1 - float(props['p_depol_init'])) * 
+                                np.power(10, - props['distance']**2 * float(props['p_depol_length']) / 10)))
+            elif props.get('qchannel_noise_model') == 'DephaseNoiseModel':
+                channel.append(('dephase', float(props['dephase_qchannel_rate'])))
+            elif props.get('qchannel_noise_model') == 'DepolarNoiseModel':
+                channel.append(('depolar', float(props['depolar_qchannel_rate'])))
+            elif props.get('qchannel_noise_model') == 'FibreDepolGaussModel':
+                #Depolarization happens when a gaussian dispersion time is above the decoherence time
+                dgd = 0.6*np.sqrt(float(props['distance'])/50)
+                channel.append(('depolar_prob', 1 - NormalDist(dgd, dgd).cdf(1.6) if dgd > 0 else 0))
+            if props.get('qchannel_loss_model') == 'FibreLossModel':
+                model['success'] *= link_success_probability(float(props['p_loss_init']), float(props['p_loss_length']), 
+                                                             float(props['distance']))
+            model['links'].append({
+                'source_fidelity': float(props['source_fidelity_sq']),
+                'channel': channel,
+                'delay': 1e9 * float(props['distance']) / float(props['photon_speed_fibre']),
+                'memory': [node_noise(nodes[nodepos],'mem'), node_noise(nodes[nodepos+1],'mem')]})
+
+        #Attempt without losses, and failed attempts that last as the timer of RouteProtocol
+        model['delay'] = generation_lower_bound(self, nodes, links)
+        model['timeout'] = generation_delay(self, nodes, links) + 100
+        model['swaps'] = []
+        for node in nodes[1:-1]:
+            gate_duration = duration(node,'gate_duration',0)
+            model['swaps'].append((node_noise(node,'gate'), duration(node,'measurements_duration',gate_duration) + 
+                                   duration(node,'gate_duration_CX',gate_duration) + gate_duration))
+        gate_duration = duration(nodes[-1],'gate_duration',0)
+        model['correction'] = (node_noise(nodes[-1],'gate'), 
+                               duration(nodes[-1],'gate_duration_X',gate_duration) + duration(nodes[-1],'gate_duration_Z',gate_duration)) \
+            if self.get_config('correction_mode','correction_mode') == 'physical' else (None, 0)
+        model['end_memory'] = [node_noise(nodes[0],'mem'), node_noise(nodes[-1],'mem')]
+        model['distil'] = []
+        for node in [nodes[0], nodes[-1]]:
+            gate_duration = duration(node,'gate_duration',0)
+            model['distil'].append((node_noise(node,'gate'), duration(node,'gate_duration_rotations',gate_duration) + 
+                                    duration(node,'gate_duration_CX',gate_duration)))
+        #Purification messages are sent through a channel from origin to destination
+        total_distance = sum([float(self.get_config('links',link,'distance')) for link in links])
+        average_photon_speed = sum([float(self.get_config('links',link,'photon_speed_fibre')) * float(self.get_config('links',link,'distance')) 
+                                    for link in links]) / total_distance
+        model['distil_delay'] = 1e9 * total_distance / average_photon_speed
+        return(model)
+
+    def _stop_rule(self, request_props, fidel_rounds):
+        '''
+        Creates the sequential test used to stop path estimation as soon as the decision is known
+        '''
+        return(SequentialTest(request_props['minfidelity'], request_props['maxtime'], fidel_rounds,
+                              error_rate=float(self._config.get('path_fidel_error_rate',0.05)),
+                              min_rounds=int(self._config.get('path_fidel_min_rounds',30))))
+
+    def _estimate_path_sharded(self, path, request_props, purif_rounds, fidel_rounds, workers):
+        '''
+        Simulates the rounds of a path estimation split among worker processes. Each worker simulates
+        its share of rounds in its own network with only the path elements and its own random seed.
+        If global parameter path_fidel_test is sequential, rounds are simulated in batches of 
+        path_fidel_min_rounds and the stop rule is checked with the results of each batch.
+        Input:
+            - path: dictionary describing the path
+            - request_props: dictionary with the request parameters
+            - purif_rounds: purification rounds being simulated
+            - fidel_rounds: maximum number of rounds to simulate
+            - workers: number of worker processes
+        Output:
+            - dataframe with fidelity and time of each simulated round
+        '''
+        if self._config.get('path_fidel_test','fixed') == 'sequential':
+            stop_rule = self._stop_rule(request_props, fidel_rounds)
+            batch_size = max(int(self._config.get('path_fidel_min_rounds',30)), workers)
+        else:
+            stop_rule = None
+            batch_size = fidel_rounds
+
+        results = []
+        simulated = 0
+        pool = self._worker_pool()
+        while simulated < fidel_rounds:
+            batch_rounds = min(batch_size, fidel_rounds - simulated)
+            shards = [batch_rounds // workers + (1 if worker < batch_rounds % workers else 0) for worker in range(workers)]
+            tasks = [(self._config, self._memory_assignment, path, purif_rounds, shard_rounds, ns.get_random_state().randint(2**31))
+                     for shard_rounds in shards if shard_rounds > 0]
+            batch_results = pool.map(_estimate_path_worker, tasks)
+            results.extend(batch_results)
+            simulated += batch_rounds
+
+            if stop_rule is not None:
+                for result in batch_results:
+                    for fidelity, time in zip(result['Fidelity'], result['time']):
+                        stop_rule.add(fidelity, time)
+                if stop_rule.decided():
+                    break
+        return(pd.concat(results, ignore_index=True))
+
+    def _handle_message(self,msg,network=None):
         input_port = msg.meta['rx_port_name']
         forward_port = input_port.replace('ccon_L_','ccon_R_')
         port_elements = input_port.split('_')
-        node = self.network.get_node(port_elements[2])
+        network = self.network if network is None else network
+        node = network.get_node(port_elements[2])
         node.ports[forward_port].tx_output(msg)
         return
 
@@ -691,18 +1696,12 @@ class NetworkManager():
         _INSTR_RxC = IGate("RxC_gate", ops.create_rotation_op(np.pi / 2, (1, 0, 0), conjugate=True))
 
         #get gate durations from configuration
-        gate_duration = self.get_config('nodes',nodename,'gate_duration') \
-            if self.get_config('nodes',nodename,'gate_duration') != 'NOT_FOUND' else 0
-        gate_duration_X = self.get_config('nodes',nodename,'gate_duration_X') \
-            if self.get_config('nodes',nodename,'gate_duration_X') != 'NOT_FOUND' else gate_duration
-        gate_duration_Z = self.get_config('nodes',nodename,'gate_duration_Z') \
-            if self.get_config('nodes',nodename,'gate_duration_Z') != 'NOT_FOUND' else gate_duration
-        gate_duration_CX = self.get_config('nodes',nodename,'gate_duration_CX') \
-            if self.get_config('nodes',nodename,'gate_duration_CX') != 'NOT_FOUND' else gate_duration
-        gate_duration_rotations = self.get_config('nodes',nodename,'gate_duration_rotations') \
-            if self.get_config('nodes',nodename,'gate_duration_rotations') != 'NOT_FOUND' else gate_duration
-        measurements_duration = self.get_config('nodes',nodename,'measurements_duration') \
-            if self.get_config('nodes',nodename,'measurements_duration') != 'NOT_FOUND' else gate_duration
+        gate_duration = self.get_config('nodes',nodename,'gate_duration')
+        gate_duration_X = self.get_config('nodes',nodename,'gate_duration_X',default=gate_duration)
+        gate_duration_Z = self.get_config('nodes',nodename,'gate_duration_Z',default=gate_duration)
+        gate_duration_CX = self.get_config('nodes',nodename,'gate_duration_CX',default=gate_duration)
+        gate_duration_rotations = self.get_config('nodes',nodename,'gate_duration_rotations',default=gate_duration)
+        measurements_duration = self.get_config('nodes',nodename,'measurements_duration',default=gate_duration)
 
         #get gate noise model
         if self.get_config('nodes',nodename,'gate_noise_model') == 'DephaseNoiseModel':
@@ -860,3 +1859,71 @@ class ClassicalConnection(Connection):
                               forward_input=[("A", "send")],
                               forward_output=[("B", "recv")])
         
+
+def _admit_request_worker(task):
+    '''
+    Evaluates the admission of a request in a worker process, on a network with only the path elements.
+    Input:
+        - task: tuple with configuration, memory assignment, links state and link fidelities of the calling
+            manager, request name, request parameters, candidate paths and random seed
+    Output:
+        - dictionary with the request status, the accepted path (None if rejected) and path cache counters
+    '''
+    config, memory_assignment, available_links, link_fidelities, request_name, request_props, candidates, seed = task
+    ns.sim_reset()
+    ns.set_random_state(seed=seed)
+    manager = NetworkManager(config, detached=True)
+    manager._memory_assignment = memory_assignment
+    manager._available_links = available_links
+    #Routing graph as in the calling manager, so that paths and links are resolved in the same way
+    manager._link_fidelities = link_fidelities
+    manager._build_graph()
+    manager._admit_request(request_name, request_props, candidates)
+    result = {
+        'status': manager._requests_status[-1],
+        'path': manager._paths[-1] if len(manager._paths) > 0 else None}
+    result.update(manager._worker_cache())
+    return(result)
+
+def _estimate_path_worker(task):
+    '''
+    Simulates rounds of a path estimation in a worker process, on a network with only the path elements.
+    Input:
+        - task: tuple with configuration and memory assignment of the calling manager, path,
+            purification rounds, number of rounds and random seed
+    Output:
+        - dataframe with fidelity and time of each round
+    '''
+    config, memory_assignment, path, purif_rounds, num_runs, seed = task
+    ns.sim_reset()
+    ns.set_random_state(seed=seed)
+    manager = NetworkManager(config, detached=True)
+    manager._memory_assignment = memory_assignment
+    protocol = PathFidelityProtocol(manager, path, num_runs, network=manager.build_path_network(path))
+    protocol.set_purif_rounds(purif_rounds)
+    dc = dc_setup(protocol)
+    protocol.start()
+    ns.sim_run()
+    protocol.stop()
+    return(dc.dataframe[['Fidelity','time']])
+
+def _estimate_level_worker(task):
+    '''
+    Simulates a path with a number of purification rounds in a worker process, on a network with only
+    the path elements.
+    Input:
+        - task: tuple with configuration and memory assignment of the calling manager, path,
+            request parameters, purification rounds, number of rounds and random seed
+    Output:
+        - dictionary with the estimation and path cache counters
+    '''
+    config, memory_assignment, path, request_props, purif_rounds, fidel_rounds, seed = task
+    ns.sim_reset()
+    ns.set_random_state(seed=seed)
+    manager = NetworkManager(config, detached=True)
+    manager._memory_assignment = memory_assignment
+    protocol = PathFidelityProtocol(manager, path, fidel_rounds, network=manager.build_path_network(path))
+    protocol.set_purif_rounds(purif_rounds)
+    result = {'estimation': manager._estimate_path(protocol, path, request_props, purif_rounds, fidel_rounds)}
+    result.update(manager._worker_cache())
+    return(result)
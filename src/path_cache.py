@@ -0,0 +1,77 @@
+import dbm
+import hashlib
+import shelve
+
+'''
+Cache of path fidelity estimations. Results are stored by path signature, so that paths with
+the same parameters are not simulated again, in the same simulation (other requests or
+evolution steps) or in a later one (persistent backend).
+'''
+
+#In process storage, shared by all network managers
+_memory_store = {}
+
+def parameters_hash(parameters):
+    '''
+    Calculates a hash of a dictionary of parameters, independent of the order of keys
+    Input:
+        - parameters: dictionary
+    Output:
+        - string with hexadecimal hash
+    '''
+    return(hashlib.sha1(repr(sorted((str(key), str(value)) for key, value in parameters.items())).encode()).hexdigest())
+
+class PathResultCache():
+    '''
+    Stores estimation results (mean and standard deviation of fidelity and time, number of samples)
+    by path signature. Counts hits and misses.
+    Parameters:
+        - backend: 'memory' (results kept while the program is running) or 'persistent'
+            (results stored in a file)
+        - file: file used by persistent backend
+        - deferred: if True, results are not stored but kept in attribute pending, so that they
+            can be stored by another process
+    '''
+
+    def __init__(self, backend='memory', file='./output/path_cache', deferred=False):
+        if backend not in ['memory','persistent']:
+            raise ValueError(f"Unsupported path cache backend {backend}")
+        self._backend = backend
+        self._file = file
+        self._deferred = deferred
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, signature):
+        '''
+        Returns stored result for the signature or None if not found
+        '''
+        if self._backend == 'memory':
+            result = _memory_store.get(signature)
+        else:
+            #Read only, so that worker processes can query the file at the same time.
+            # If it does not exist yet nothing has been stored
+            try:
+                with shelve.open(self._file, flag='r') as store:
+                    result = store.get(signature)
+            except dbm.error:
+                result = None
+
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return(None if result is None else dict(result))
+
+    def put(self, signature, result):
+        '''
+        Stores result for the signature
+        '''
+        if self._deferred:
+            self.pending[signature] = dict(result)
+        elif self._backend == 'memory':
+            _memory_store[signature] = dict(result)
+        else:
+            with shelve.open(self._file) as store:
+                store[signature] = dict(result)
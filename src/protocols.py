@@ -20,9 +20,227 @@ __all__ = [
     "SwapCorrectProgram",
     "CorrectProtocol",
     'DistilProtocol',
-    "RouteProtocol"
+    "RouteProtocol",
+    "CompiledPath",
+    "LinkInstance",
+    "generation_delay",
+    "generation_lower_bound",
+    "forward_message",
+    "bell_corrections",
+    "correction_pairs"
 ]
 
+def generation_delay(networkmanager, nodes, links):
+    '''
+    Conservative time needed to generate an end to end pair in a path when no qubit is lost, used as
+    lost qubit timer: transmission through all the links, emission in the slowest source, Bell 
+    measurement in the slowest switch and corrections in the destination. It is not a lower bound, 
+    since transmissions in different links overlap (see generation_lower_bound)
+    Input:
+        - networkmanager: instance of the network manager
+        - nodes: list of node names of the path
+        - links: list of link names of the path
+    Output:
+        - delay in nanoseconds
+    '''
+    total_delay = 0
+    max_source_delay = 0
+    for link_name in links:
+        #Add time corresponding to transmission
+        distance = float(networkmanager.get_config('links',link_name,'distance'))
+        photon_speed = float(networkmanager.get_config('links',link_name,'photon_speed_fibre'))
+        total_delay += 1e9 * distance / photon_speed
+        #Add time corresponding to qsource emission
+        emission_delay = float(networkmanager.get_config('links',link_name,'source_delay'))
+        if emission_delay > max_source_delay:
+            max_source_delay = emission_delay
+    total_delay += max_source_delay
+
+    #We should add time corresponging to Bell measurements in switches and X/Z in end node
+    max_swap_time = 0
+    correction_time = 0
+    for node in nodes[1:]:
+        if networkmanager.get_config('nodes',node,'type') == 'switch':
+            gate_duration = networkmanager.get_config('nodes',node,'gate_duration')
+            gate_duration_CX = networkmanager.get_config('nodes',node,'gate_duration_CX',default=gate_duration)
+            measurements_duration = networkmanager.get_config('nodes',node,'measurements_duration',default=gate_duration)
+            if gate_duration + gate_duration_CX + measurements_duration > max_swap_time:
+                max_swap_time = gate_duration + gate_duration_CX + measurements_duration
+        elif networkmanager.get_config('correction_mode','correction_mode') == 'physical':
+            gate_duration = networkmanager.get_config('nodes',node,'gate_duration')
+            #Worse case: X and Z corrections to apply
+            correction_time = 2 * gate_duration
+            
+    return(total_delay + max_swap_time + correction_time)
+
+def _classical_delay(networkmanager, link):
+    '''
+    Mean delay (nanoseconds) of a classical message through a link, as in the classical connections of paths
+    '''
+    if networkmanager.get_config('links',link,'classical_delay_model') == 'GaussianDelayModel':
+        return(float(networkmanager.get_config('links',link,'gaussian_delay_mean')))
+    return(1e9 * float(networkmanager.get_config('links',link,'distance')) / 
+           float(networkmanager.get_config('links',link,'photon_speed_fibre')))
+
+def generation_lower_bound(networkmanager, nodes, links):
+    '''
+    Lower bound of the time needed to generate an end to end pair in a path when no qubit is lost.
+    Sources of all links are triggered at the same time, so transmissions overlap: each switch swaps 
+    when the qubits of its two links have arrived (all links with per_link restart) and its result 
+    travels through the classical path to the destination. The pair is ready with the last result
+    and the arrival of the qubits in both ends. Queues in switches and corrections in the destination,
+    which are not always needed, are not included
+    Input:
+        - networkmanager: instance of the network manager
+        - nodes: list of node names of the path
+        - links: list of link names of the path
+    Output:
+        - delay in nanoseconds
+    '''
+    #Arrival time of the qubits of each link in its left and right node
+    arrivals = []
+    for nodepos, link in enumerate(links):
+        emission = float(networkmanager.get_config('links',link,'source_delay'))
+        transmission = 1e9 * float(networkmanager.get_config('links',link,'distance')) / \
+            float(networkmanager.get_config('links',link,'photon_speed_fibre'))
+        end1 = networkmanager.get_config('links',link,'end1')
+        end2 = networkmanager.get_config('links',link,'end2')
+        #Sources are placed in the switch end, or in end2 if both ends are switches
+        source = end1 if networkmanager.get_config('nodes',end1,'type') == 'switch' else end2
+        arrivals.append([emission if nodes[nodepos] == source else emission + transmission,
+                         emission if nodes[nodepos+1] == source else emission + transmission])
+    all_links_ready = max([max(arrival) for arrival in arrivals])
+    per_link = networkmanager.get_config('restart_policy','restart_policy') == 'per_link'
+
+    ready = max(arrivals[0][0], arrivals[-1][1])
+    for nodepos in range(1, len(nodes)-1):
+        node = nodes[nodepos]
+        gate_duration = networkmanager.get_config('nodes',node,'gate_duration')
+        swap_time = gate_duration + networkmanager.get_config('nodes',node,'gate_duration_CX',default=gate_duration) + \
+            networkmanager.get_config('nodes',node,'measurements_duration',default=gate_duration)
+        swap_start = all_links_ready if per_link else max(arrivals[nodepos-1][1], arrivals[nodepos][0])
+        classical_path = sum([_classical_delay(networkmanager, link) for link in links[nodepos:]])
+        ready = max(ready, swap_start + swap_time + classical_path)
+    return(ready)
+
+def forward_message(msg, port):
+    '''
+    Input handler of the classical ports of intermediate nodes of a path. Forwards the message
+    to the next hop through the output port resolved when the path was created
+    Input:
+        - msg: received message
+        - port: port of the node connected to the next hop
+    '''
+    port.tx_output(msg)
+
+def bell_corrections(m, epr_state):
+    '''
+    Corrections needed in the end node due to the result of a Bell measurement in a switch
+    Input:
+        - m: Bell index measured
+        - epr_state: EPR generated by sources (PHI_PLUS or PSI_PLUS)
+    Output:
+        - number of X and Z corrections (0 or 1)
+    '''
+    if epr_state == 'PHI_PLUS':
+        x_corr = 1 if m == ks.BellIndex.B01 or m == ks.BellIndex.B11 else 0
+        z_corr = 1 if m == ks.BellIndex.B10 or m == ks.BellIndex.B11 else 0
+    else:
+        x_corr = 1 if m == ks.BellIndex.B10 or m == ks.BellIndex.B00 else 0
+        z_corr = 1 if m == ks.BellIndex.B10 or m == ks.BellIndex.B11 else 0
+    return(x_corr, z_corr)
+
+def correction_pairs(items):
+    '''
+    Splits the items of a coalesced corrections message into corrections of each pair. Messages sent
+    at the same time through a port can be merged into one message, with the items of all of them
+    Input:
+        - items: list of items of the message, X and Z corrections of each pair
+    Output:
+        - list of tuples (X corrections, Z corrections)
+    '''
+    if len(items) % 2 != 0:
+        raise ValueError(f"Coalesced corrections message must have X and Z corrections for each pair, received {items}")
+    return(list(zip(items[0::2], items[1::2])))
+
+class LinkInstance():
+    '''
+    Instance of a link of a path with the components it uses resolved
+    Attributes:
+        - qsource: quantum source that generates the pairs of the instance
+        - source, source_pos: node of the source and its memory position
+        - node, mempos: node that receives the qubit through the quantum channel and its memory position
+        - source_port, port: input ports of the memory positions in source and node
+        - delay: time (nanoseconds) after trigger when the qubit must have arrived
+        - spares: list with the LinkInstance of the spare instances (multiplexing)
+    '''
+    __slots__ = ('qsource','source','source_pos','node','mempos','source_port','port','delay','spares')
+
+    def __init__(self, qsource, source, source_pos, node, mempos, delay, spares):
+        self.qsource = qsource
+        self.source = source
+        self.source_pos = source_pos
+        self.node = node
+        self.mempos = mempos
+        self.source_port = source.qmemory.ports[f"qin{source_pos}"]
+        self.port = node.qmemory.ports[f"qin{mempos}"]
+        self.delay = delay
+        self.spares = spares
+
+class CompiledPath():
+    '''
+    Path of a request with its components resolved in the network where it is simulated, so that
+    protocols do not parse link names nor look up components in each generation attempt
+    Parameters:
+        - networkmanager: instance of the network manager that stores the network
+        - path: calculated path for servicing the request
+        - network: network where the path is simulated
+    Attributes:
+        - links: dictionary with, for each instance index of the links (1 or 2), the list with
+            the LinkInstance of each hop. Index 2 is compiled when purification is needed
+    '''
+    __slots__ = ('_networkmanager','_path','_network','links')
+
+    def __init__(self, networkmanager, path, network):
+        self._networkmanager = networkmanager
+        self._path = path
+        self._network = network
+        self.links = {}
+        self.compile_links(1)
+
+    def compile_links(self, index):
+        '''
+        Resolves the instances of the links with the given index in all hops of the path
+        '''
+        self.links[index] = []
+        for hop, comm in enumerate(self._path['comms']):
+            link_instance = comm['links'][index-1]
+            spares = [self._compile_instance(hop, spare) for spare in comm.get('spares',{}).get(link_instance,[])]
+            self.links[index].append(self._compile_instance(hop, link_instance, spares))
+
+    def _compile_instance(self, hop, link_instance, spares=None):
+        '''
+        Resolves the components of a link instance
+        Input:
+            - hop: position of the link in the path
+            - link_instance: link name and index ('link-index')
+            - spares: list with the LinkInstance of its spare instances
+        Output:
+            - LinkInstance
+        '''
+        comm = self._path['comms'][hop]
+        link, serial = link_instance.split('-')
+        node = self._path['nodes'][hop+1] if comm['source'] == self._path['nodes'][hop] else self._path['nodes'][hop]
+        delay = 1e9 * float(self._networkmanager.get_config('links',link,'distance')) / \
+            float(self._networkmanager.get_config('links',link,'photon_speed_fibre'))
+        delay += float(self._networkmanager.get_config('links',link,'source_delay'))
+        source = self._network.get_node(comm['source'])
+        #Margin to discard false timeout positives, as in end to end timer
+        return(LinkInstance(source.subcomponents[f"qsource_{source.name}_{link}_{serial}"],
+                            source, self._networkmanager.get_mem_position(comm['source'],link,serial),
+                            self._network.get_node(node), self._networkmanager.get_mem_position(node,link,serial),
+                            delay + 100, spares if spares is not None else []))
+
 class RouteProtocol(LocalProtocol):
     '''
     Class that implements the protocol responsible for generating an EPR between source
@@ -35,20 +253,24 @@ class RouteProtocol(LocalProtocol):
         - phase: 'routing' or 'application'
         - purif_rounds: number of needed purification rounds
         - name: name of the protocol
+        - network: network where the path is simulated. If None (default), the network of the network manager
+    When a qubit is lost, with restart_policy end_to_end (default) all the links of the path are generated again.
+    With per_link, each link is generated again until its qubit arrives, and swaps start when all links are ready
     '''
 
-    def __init__(self, networkmanager, path, start_expression, phase = 'routing', purif_rounds= 0, name=None):
+    def __init__(self, networkmanager, path, start_expression, phase = 'routing', purif_rounds= 0, name=None, network=None):
         self._path = path
         self._networkmanager = networkmanager
+        self._network = network if network is not None else networkmanager.network
         self.start_expression = start_expression
         self._purif_rounds = purif_rounds
         name = name if name else f"RouteProtocol_{path['request']}"
-        super().__init__(nodes=networkmanager.network.nodes, name=name)
+        super().__init__(nodes=self._network.nodes, name=name)
         first_link = self._path['comms'][0]['links'][0]
         last_link = self._path['comms'][-1]['links'][0]
         self._mem_posA_1 = self._networkmanager.get_mem_position(self._path['nodes'][0],first_link.split('-')[0],first_link.split('-')[1])
         self._mem_posB_1 = self._networkmanager.get_mem_position(self._path['nodes'][-1],last_link.split('-')[0],last_link.split('-')[1])
-        self._portleft_1 = self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory.ports[f"qin{self._mem_posA_1}"]
+        self._portleft_1 = self._network.get_node(self._path['nodes'][0]).qmemory.ports[f"qin{self._mem_posA_1}"]
 
         # add purification signals
         #start purification signal
@@ -60,6 +282,23 @@ class RouteProtocol(LocalProtocol):
         #add correct protocol restart signal. Needed when purification is used and one quit is lost
         self._restart_signal = 'RESTART_CORRECT_PROTOCOL'
         self.add_signal(self._restart_signal)
+        #Protocols for second instance of links are created when purification is needed
+        self._second_link_ready = False
+        #With per link restart, swaps wait for the signal of all links of their instance ready
+        self._restart_policy = networkmanager.get_config('restart_policy','restart_policy')
+        #With coalesced messages, each switch sends the corrections of all switches at its left
+        self._coalesced = networkmanager.get_config('correction_messages','correction_messages') == 'coalesced'
+        for index in [1,2]:
+            self.add_signal(f"LINKS_READY_{index}")
+        self._evtype_link_timer = EventType("Timer","Link qubit is lost")
+        #Qubit lost when qchannel model has losses (end to end restart)
+        self._evtype_timer = EventType("Timer","Qubit is lost")
+        #Components of the path and event expressions are resolved once and reused in every round
+        self._compiled = CompiledPath(networkmanager, path, self._network)
+        self._evexpr_timer = EventExpression(source=self, event_type=self._evtype_timer)
+        self._evexpr_link_timer = EventExpression(source=self, event_type=self._evtype_link_timer)
+        self._evexprs = {}
+        self._correct = {}
 
         # preparation of entanglement swaping from second to the last-1
         for nodepos in range(1,len(path['nodes'])-1):
@@ -68,65 +307,44 @@ class RouteProtocol(LocalProtocol):
             link_right = path['comms'][nodepos]['links'][0]
             mem_pos_left = networkmanager.get_mem_position(node,link_left.split('-')[0],link_left.split('-')[1])
             mem_pos_right = networkmanager.get_mem_position(node,link_right.split('-')[0],link_right.split('-')[1])
-            subprotocol = SwapProtocol(node=networkmanager.network.get_node(node), mem_left=mem_pos_left, mem_right=mem_pos_right, name=f"SwapProtocol_{node}_{path['request']}_1", request = path['request'])
+            subprotocol = SwapProtocol(node=self._network.get_node(node), mem_left=mem_pos_left, mem_right=mem_pos_right, name=f"SwapProtocol_{node}_{path['request']}_1", request = path['request'],
+                                       ready_expression=self._links_ready_expression(1), coalesced=self._coalesced, first_switch=nodepos==1,
+                                       epr_state=networkmanager.get_config('epr_pair','epr_pair'))
             self.add_subprotocol(subprotocol)
 
         # preparation of correct protocol in final node
         epr_state =  self._networkmanager.get_config('epr_pair','epr_pair')
         mempos= networkmanager.get_mem_position(path['nodes'][-1],last_link.split('-')[0],last_link.split('-')[1])
         restart_expr = self.await_signal(self,self._restart_signal)
-        subprotocol = CorrectProtocol(networkmanager.network.get_node(path['nodes'][-1]), mempos, len(path['nodes']), f"CorrectProtocol_{path['request']}_1", path['request'],restart_expr, epr_state)
+        subprotocol = CorrectProtocol(self._network.get_node(path['nodes'][-1]), mempos, len(path['nodes']), f"CorrectProtocol_{path['request']}_1", path['request'],restart_expr, epr_state, coalesced=self._coalesced,
+                                      pauli_frame=networkmanager.get_config('correction_mode','correction_mode') == 'pauli_frame')
         self.add_subprotocol(subprotocol)
+        self._correct[1] = subprotocol
 
         if purif_rounds > 0:
             #If protocol is being instanced with purification from the beggining we need to add second link protocols
             self._init_second_link_protocols('distil')
 
         # calculate total distance and delay, in order to set timer to detect lost qubit
-        self._total_delay = 0
-        max_source_delay = 0
-        for comm in path['comms']:
-            link_name = comm['links'][0].split('-')[0]
-            #Add time corresponding to transmission
-            distance = float(networkmanager.get_config('links',link_name,'distance'))
-            photon_speed = float(networkmanager.get_config('links',link_name,'photon_speed_fibre'))
-            self._total_delay += 1e9 * distance / photon_speed
-            #Add time corresponding to qsource emission
-            emission_delay = float(networkmanager.get_config('links',link_name,'source_delay')) \
-                if networkmanager.get_config('links',link_name,'source_delay') != 'NOT_FOUND' else 0
-            if emission_delay > max_source_delay:
-                max_source_delay = emission_delay
-        self._total_delay += max_source_delay
+        self._total_delay = generation_delay(networkmanager, path['nodes'], 
+                                             [comm['links'][0].split('-')[0] for comm in path['comms']])
         
         #We need to add some nanoseconds to timer, to discard false timeout positives
         # when tomeout and correct transmission matches. If distances are short we 
         # can receive a lost qubit signal when it is not correct
         self._total_delay += 100
-        
-        #We should add time corresponging to Bell measurements in switches and X/Z in end node
-        max_swap_time = 0
-        correction_time = 0
-        for node in path['nodes'][1:]:
-            if networkmanager.get_config('nodes',node,'type') == 'switch':
-                gate_duration = networkmanager.get_config('nodes',node,'gate_duration') \
-                    if networkmanager.get_config('nodes',node,'gate_duration') != 'NOT_FOUND' else 0
-                gate_duration_CX = networkmanager.get_config('nodes',node,'gate_duration_CX') \
-                    if networkmanager.get_config('nodes',node,'gate_duration_CX') != 'NOT_FOUND' else gate_duration
-                measurements_duration = networkmanager.get_config('nodes',node,'measurements_duration') \
-                    if networkmanager.get_config('nodes',node,'measurements_duration') != 'NOT_FOUND' else gate_duration
-                if gate_duration + gate_duration_CX + measurements_duration > max_swap_time:
-                    max_swap_time = gate_duration + gate_duration_CX + measurements_duration
-            else:
-                num_switches = len(path['nodes']) - 2
-                gate_duration = networkmanager.get_config('nodes',node,'gate_duration') \
-                    if networkmanager.get_config('nodes',node,'gate_duration') != 'NOT_FOUND' else 0
-                #Worse case: X and Z corrections to apply
-                correction_time = 2 * gate_duration
-                
-        self._total_delay += max_swap_time + correction_time 
  
         #When several requests are processed, we should also add time related to Bell measurements for those requests
         if phase == 'application':
+            #Correction duration in destination and Bell measurement duration in last switch of the path
+            gate_duration = networkmanager.get_config('nodes',path['nodes'][-1],'gate_duration')
+            gate_duration_CX = 0
+            measurements_duration = 0
+            for node in path['nodes'][1:-1]:
+                if networkmanager.get_config('nodes',node,'type') == 'switch':
+                    switch_gate_duration = networkmanager.get_config('nodes',node,'gate_duration')
+                    gate_duration_CX = networkmanager.get_config('nodes',node,'gate_duration_CX',default=switch_gate_duration)
+                    measurements_duration = networkmanager.get_config('nodes',node,'measurements_duration',default=switch_gate_duration)
             #Add 3% as margin for possible delays
             self._total_delay += (len(networkmanager.get_paths()) -1) * (gate_duration + gate_duration_CX + measurements_duration) *1.03
 
@@ -138,25 +356,129 @@ class RouteProtocol(LocalProtocol):
         '''
         if index not in [[1],[2],[1,2]]:
             raise ValueError('Unsupported trigger generation')
-        for link in self._path['comms']:
-            trigger_node = self._networkmanager.network.get_node(link['source'])
+        for hop in range(len(self._path['comms'])):
             for i in index:
-                trigger_link = link['links'][i-1].split('-')[0]
-                trigger_link_index = link['links'][i-1].split('-')[1]
-                trigger_node.subcomponents[f"qsource_{trigger_node.name}_{trigger_link}_{trigger_link_index}"].trigger()
+                self._compiled.links[i][hop].qsource.trigger()
+
+    def _links_ready_expression(self, index):
+        '''
+        Event expression that swaps of an instance of the links wait for. None if swaps are executed
+        as soon as qubits arrive (end to end restart)
+        '''
+        return(self.await_signal(self, f"LINKS_READY_{index}") if self._restart_policy == 'per_link' else None)
+
+    def _generated_expression(self, indexes):
+        '''
+        Event expression that an end to end generation attempt waits for: qubits of the instances in the
+        origin and corrections in the destination, or the lost qubit timer. Built once for each set of instances
+        Input:
+            - indexes: instances of the links generated (see signal_sources)
+        '''
+        key = ('generated', tuple(indexes))
+        if key not in self._evexprs:
+            evexpr_protocol = None
+            for index in indexes:
+                evexpr_index = self.await_port_input(self._portleft_1 if index == 1 else self._portleft_2) & \
+                    self.await_signal(self._correct[index], Signals.SUCCESS)
+                evexpr_protocol = evexpr_index if evexpr_protocol is None else evexpr_protocol & evexpr_index
+            self._evexprs[key] = self._evexpr_timer | evexpr_protocol
+        return(self._evexprs[key])
+
+    def _keep_first_pair(self, instance):
+        '''
+        Checks if the pair of an instance of a link has arrived. If its qubit is lost but the one of 
+        a spare instance (multiplexing) has arrived, the pair of the spare instance is moved to the 
+        memory positions of the assigned instance
+        Input:
+            - instance: LinkInstance assigned to the hop
+        Output:
+            - True if the link is ready
+        '''
+        if not instance.node.qmemory.get_position_empty(instance.mempos):
+            return(True)
+        for spare in instance.spares:
+            if not spare.node.qmemory.get_position_empty(spare.mempos):
+                #Qubits are sent through memory ports, so that protocols waiting for them are notified
+                qubits = spare.source.qmemory.pop(positions=[spare.source_pos])
+                instance.source_port.tx_input(Message(qubits))
+                qubits = spare.node.qmemory.pop(positions=[spare.mempos])
+                instance.port.tx_input(Message(qubits))
+                return(True)
+        return(False)
+
+    def _generate_per_link(self, indexes):
+        '''
+        Generates the end to end pairs of the instances of the links, retrying each link independently
+        until its qubit arrives. With multiplexing, the spare instances of a link are triggered with 
+        the assigned one and the first pair that arrives is kept. 
+        Swaps are started when all links are ready and corrections are awaited.
+        Must be called with yield from
+        Input:
+            - indexes: instances of the links to generate (see signal_sources)
+        '''
+        pending = tuple((hop, index) for index in indexes for hop in range(len(self._path['comms'])))
+        while len(pending) > 0:
+            max_delay = 0
+            for hop, index in pending:
+                instance = self._compiled.links[index][hop]
+                for trigger_instance in [instance] + instance.spares:
+                    #Qubit of a previous attempt is discarded, so that arrival can be checked in memory
+                    if not trigger_instance.node.qmemory.get_position_empty(trigger_instance.mempos):
+                        trigger_instance.node.qmemory.pop(positions=[trigger_instance.mempos])
+                    trigger_instance.qsource.trigger()
+                    max_delay = max(max_delay, trigger_instance.delay)
+
+            #Wait for the assigned instances, spares are checked when the timer is over
+            key = ('links', pending)
+            if key not in self._evexprs:
+                evexpr_links = None
+                for hop, index in pending:
+                    evexpr_port = self.await_port_input(self._compiled.links[index][hop].port)
+                    evexpr_links = evexpr_port if evexpr_links is None else evexpr_links & evexpr_port
+                self._evexprs[key] = self._evexpr_link_timer | evexpr_links
+
+            timer_event = self._schedule_after(max_delay, self._evtype_link_timer)
+            evexpr = yield self._evexprs[key]
+            if evexpr.second_term.value:
+                timer_event.unschedule()
+                pending = ()
+            else:
+                #Only links whose qubits have not arrived are generated again
+                pending = tuple((hop, index) for hop, index in pending 
+                                if not self._keep_first_pair(self._compiled.links[index][hop]))
+
+        #Qubits cannot be lost anymore. Swap and wait for corrections
+        for index in indexes:
+            self.send_signal(f"LINKS_READY_{index}")
+        key = ('corrections', tuple(indexes))
+        if key not in self._evexprs:
+            evexpr_corrections = None
+            for index in indexes:
+                evexpr_correct = self.await_signal(self._correct[index], Signals.SUCCESS)
+                evexpr_corrections = evexpr_correct if evexpr_corrections is None else evexpr_corrections & evexpr_correct
+            self._evexprs[key] = evexpr_corrections
+        #Without switches, corrections are not needed and destination has already signaled its qubit
+        if len(self._path['nodes']) > 2:
+            yield self._evexprs[key]
+
+    def _restart_corrections(self):
+        '''
+        Restarts correction protocols when a qubit is lost, discarding corrections of the failed attempt
+        '''
+        self.send_signal(self._restart_signal)
+        if self._coalesced:
+            for subprotocol in self.subprotocols.values():
+                if isinstance(subprotocol, SwapProtocol): subprotocol.reset_corrections()
 
     def set_purif_rounds(self, purif_rounds):
         self._purif_rounds = purif_rounds
-        if self._purif_rounds == 1: # Set memories for the second link
+        if self._purif_rounds > 0 and not self._second_link_ready: # Set memories for the second link
             self._init_second_link_protocols('distil')
             #Update delay time with purification operations in order to detect lost qubit
             node_name = self._path['nodes'][-1]
-            gate_duration_rotations = self._networkmanager.get_config('nodes',node_name,'gate_duration_rotations') \
-                if self._networkmanager.get_config('nodes',node_name,'gate_duration_rotations') != 'NOT_FOUND' else 0
-            gate_duration_CX = self._networkmanager.get_config('nodes',node_name,'gate_duration_CX') \
-                    if self._networkmanager.get_config('nodes',node_name,'gate_duration_CX') != 'NOT_FOUND' else 0        
-            measurements_duration = self._networkmanager.get_config('nodes',node_name,'measurements_duration') \
-                    if self._networkmanager.get_config('nodes',node_name,'measurements_duration') != 'NOT_FOUND' else 0        
+            gate_duration_rotations = self._networkmanager.get_config('nodes',node_name,'gate_duration_rotations',default=0)
+            gate_duration_CX = self._networkmanager.get_config('nodes',node_name,'gate_duration_CX',default=0)
+            measurements_duration = self._networkmanager.get_config('nodes',node_name,'measurements_duration',default=0)
             self._total_delay += 2 * gate_duration_rotations + gate_duration_CX + measurements_duration
             
 
@@ -166,11 +488,13 @@ class RouteProtocol(LocalProtocol):
         creates protocols for this second instance of the link
         Receives purification protocol to use. Right now only distil
         '''        
+        self._second_link_ready = True
+        self._compiled.compile_links(2)
         first_link = self._path['comms'][0]['links'][1]
         last_link = self._path['comms'][-1]['links'][1]
         self._mem_posA_2 = self._networkmanager.get_mem_position(self._path['nodes'][0],first_link.split('-')[0],first_link.split('-')[1])
         self._mem_posB_2 = self._networkmanager.get_mem_position(self._path['nodes'][-1],last_link.split('-')[0],last_link.split('-')[1])
-        self._portleft_2 = self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory.ports[f"qin{self._mem_posA_2}"]
+        self._portleft_2 = self._network.get_node(self._path['nodes'][0]).qmemory.ports[f"qin{self._mem_posA_2}"]
 
         #add SwapProtocol in second instance of link
         for nodepos in range(1,len(self._path['nodes'])-1):
@@ -179,22 +503,26 @@ class RouteProtocol(LocalProtocol):
             link_right = self._path['comms'][nodepos]['links'][1]
             mem_pos_left = self._networkmanager.get_mem_position(node,link_left.split('-')[0],link_left.split('-')[1])
             mem_pos_right = self._networkmanager.get_mem_position(node,link_right.split('-')[0],link_right.split('-')[1])
-            subprotocol = SwapProtocol(node=self._networkmanager.network.get_node(node), mem_left=mem_pos_left, mem_right=mem_pos_right, name=f"SwapProtocol_{node}_{self._path['request']}_2", request = self._path['request'])
+            subprotocol = SwapProtocol(node=self._network.get_node(node), mem_left=mem_pos_left, mem_right=mem_pos_right, name=f"SwapProtocol_{node}_{self._path['request']}_2", request = self._path['request'],
+                                       ready_expression=self._links_ready_expression(2), coalesced=self._coalesced, first_switch=nodepos==1,
+                                       epr_state=self._networkmanager.get_config('epr_pair','epr_pair'))
             self.add_subprotocol(subprotocol)
 
         #add Correction protocol for second instance of link
         epr_state = epr_state =  self._networkmanager.get_config('epr_pair','epr_pair')
         mempos = self._networkmanager.get_mem_position(self._path['nodes'][-1],last_link.split('-')[0],last_link.split('-')[1])
         restart_expr = self.await_signal(self,self._restart_signal)
-        subprotocol = CorrectProtocol(self._networkmanager.network.get_node(self._path['nodes'][-1]), mempos, len(self._path['nodes']), f"CorrectProtocol_{self._path['request']}_2", self._path['request'],restart_expr, epr_state)
+        subprotocol = CorrectProtocol(self._network.get_node(self._path['nodes'][-1]), mempos, len(self._path['nodes']), f"CorrectProtocol_{self._path['request']}_2", self._path['request'],restart_expr, epr_state, coalesced=self._coalesced,
+                                      pauli_frame=self._networkmanager.get_config('correction_mode','correction_mode') == 'pauli_frame')
         self.add_subprotocol(subprotocol)
+        self._correct[2] = subprotocol
 
         #add purification protocol
         if purif_proto not in ['distil']:
             raise ValueError(f"{purif_proto} is a not implemented purification protocol")
        
-        nodeA = self._networkmanager.network.get_node(self._path['nodes'][0])
-        nodeB = self._networkmanager.network.get_node(self._path['nodes'][-1])
+        nodeA = self._network.get_node(self._path['nodes'][0])
+        nodeB = self._network.get_node(self._path['nodes'][-1])
  
         #Distil will wait for START_PURIFICATION signal
         #start_expression = self.await_signal(self, Signals.WAITING)
@@ -204,13 +532,12 @@ class RouteProtocol(LocalProtocol):
             'A',self._mem_posA_1,self._mem_posA_2,start_expression, msg_header='distil', name=f"DistilProtocol_{nodeA.name}_{self._path['request']}"))
             self.add_subprotocol(DistilProtocol(nodeB, nodeB.ports[f"ccon_distil_{nodeB.name}_{self._path['request']}"],
             'B',self._mem_posB_1,self._mem_posB_2,start_expression, msg_header='distil',name=f"DistilProtocol_{nodeB.name}_{self._path['request']}"))
+        #Both ends finish purification
+        self._evexpr_distil = self.await_signal(self.subprotocols[f"DistilProtocol_{nodeA.name}_{self._path['request']}"], self._purif_result_signal) & \
+            self.await_signal(self.subprotocols[f"DistilProtocol_{nodeB.name}_{self._path['request']}"], self._purif_result_signal)
 
     def run(self):
         self.start_subprotocols()
-        #Qubit lost when qchannel model has losses
-        evtypetimer = EventType("Timer","Qubit is lost")
-        #set event type in order to detect qubit losses
-        evexpr_timer = EventExpression(source=self, event_type=evtypetimer)
 
         #for i in range(self._num_runs):
         while True:
@@ -220,18 +547,19 @@ class RouteProtocol(LocalProtocol):
             round_done = False
             start_time = sim_time()
             while not round_done: #need to repeat in case qubit is lost
-                if self._purif_rounds == 0:
+                if self._purif_rounds == 0 and self._restart_policy == 'per_link':
+                    yield from self._generate_per_link([1])
+                    round_done = True
+
+                elif self._purif_rounds == 0:
                     #trigger all sources in the path
                     self.signal_sources(index=[1])
 
-                    timer_event = self._schedule_after(self._total_delay, evtypetimer)
+                    timer_event = self._schedule_after(self._total_delay, self._evtype_timer)
 
-                    evexpr_protocol = (self.await_port_input(self._portleft_1)) & \
-                        (self.await_signal(self.subprotocols[f"CorrectProtocol_{self._path['request']}_1"], Signals.SUCCESS))
                     #if timer is triggered, qubit has been lost in a link. Else entanglement
                     # swapping has succeeded
-
-                    evexpr = yield evexpr_timer | evexpr_protocol
+                    evexpr = yield self._generated_expression([1])
                     
                     if evexpr.second_term.value: #swapping ok
                         timer_event.unschedule()
@@ -240,7 +568,7 @@ class RouteProtocol(LocalProtocol):
                         #qubit is lost, must restart
                         #ic(f"{self.name} Lost qubit in Route protocol")
                         #restart correction protocol
-                        self.send_signal(self._restart_signal)
+                        self._restart_corrections()
                         #repeat round
                         continue
 
@@ -249,40 +577,42 @@ class RouteProtocol(LocalProtocol):
                     while not purification_done:
                         pur_round = 0
                         while (pur_round <= self._purif_rounds):# and (qubit_lost == False):
-                            if pur_round == 0: #First round
+                            if self._restart_policy == 'per_link':
+                                #Links are generated again until ready, qubits cannot be lost
+                                yield from self._generate_per_link([1,2] if pur_round == 0 else [2])
+                                links_ready = True
+
+                            elif pur_round == 0: #First round
                                 #trigger all sources in the path
                                 self.signal_sources(index=[1,2])
 
-                                evexpr_protocol = (self.await_port_input(self._portleft_1) & \
-                                    self.await_signal(self.subprotocols[f"CorrectProtocol_{self._path['request']}_1"], Signals.SUCCESS) &\
-                                    self.await_port_input(self._portleft_2) & \
-                                    self.await_signal(self.subprotocols[f"CorrectProtocol_{self._path['request']}_2"], Signals.SUCCESS))
+                                evexpr_protocol = self._generated_expression([1,2])
 
-                                timer_event = self._schedule_after(self._total_delay, evtypetimer)
+                                timer_event = self._schedule_after(self._total_delay, self._evtype_timer)
 
                             else: #we keep the qubit in the first link and trigger EPRs in the second
                                 #trigger all sources in the path
                                 self.signal_sources(index=[2])
 
                                 #Wait for qubits in both links and corrections in both
-                                evexpr_protocol = (self.await_port_input(self._portleft_2) & \
-                                    self.await_signal(self.subprotocols[f"CorrectProtocol_{self._path['request']}_2"], Signals.SUCCESS))
+                                evexpr_protocol = self._generated_expression([2])
 
-                                timer_event = self._schedule_after(self._total_delay, evtypetimer)
+                                timer_event = self._schedule_after(self._total_delay, self._evtype_timer)
 
-                            #Wait for qubits in both links and corrections in both or timer is over
-                            evexpr_proto = yield evexpr_timer | evexpr_protocol
+                            if self._restart_policy != 'per_link':
+                                #Wait for qubits in both links and corrections in both or timer is over
+                                evexpr_proto = yield evexpr_protocol
+                                links_ready = evexpr_proto.second_term.value
+                                if links_ready: #swapping ok
+                                    #unchedule timer
+                                    timer_event.unschedule()
 
-                            if evexpr_proto.second_term.value: #swapping ok
-                                #unchedule timer
-                                timer_event.unschedule()
-                                
+                            if links_ready:
                                 #trigger purification
                                 self.send_signal(self._start_purif_signal, 0)
     
                                 #wait for both ends to finish purification
-                                expr_distil = yield (self.await_signal(self.subprotocols[f"DistilProtocol_{self._path['nodes'][0]}_{self._path['request']}"], self._purif_result_signal) &
-                                    self.await_signal(self.subprotocols[f"DistilProtocol_{self._path['nodes'][-1]}_{self._path['request']}"], self._purif_result_signal))
+                                expr_distil = yield self._evexpr_distil
 
                                 source_protocol1 = expr_distil.second_term.atomic_source
                                 ready_signal1 = source_protocol1.get_signal_by_event(
@@ -304,7 +634,7 @@ class RouteProtocol(LocalProtocol):
                                 #qubit is lost, must restart round
                                 #ic(f"{self.name} Lost qubit")
                                 #restart correction protocol
-                                self.send_signal(self._restart_signal)
+                                self._restart_corrections()
 
                                 #restart purification from beggining
                                 purification_done = False
@@ -330,11 +660,20 @@ class SwapProtocol(NodeProtocol):
         Node this protocol runs on.
     name : str
         Name of this protocol.
+    coalesced : bool
+        If True, the switch adds its corrections to the ones received from the switch at its left
+        and sends a single message to the right, instead of its Bell measurement result
+    first_switch : bool
+        If the switch is the first one of the path (no corrections are received from the left)
+    epr_state : str
+        EPR generated by sources, needed to calculate corrections when coalesced
 
     """
 
-    def __init__(self, node, mem_left, mem_right, name, request):
+    def __init__(self, node, mem_left, mem_right, name, request, ready_expression=None, coalesced=False, first_switch=True, epr_state=None):
         super().__init__(node, name)
+        #If defined, swap waits for it instead of the qubits arrival
+        self._ready_expression = ready_expression
 
         # get index of link
         div_pos = name.rfind('_')
@@ -348,45 +687,83 @@ class SwapProtocol(NodeProtocol):
         self._program = QuantumProgram(num_qubits=2)
         q1, q2 = self._program.get_qubit_indices(num_qubits=2)
         self._program.apply(INSTR_MEASURE_BELL, [q1, q2], output_key="m", inplace=False)
-        
 
-    def run(self):
-        #Get instruction duration for timer. Minimum is 100
-        max_duration = 100
-        for inst in self.node.qmemory.get_physical_instructions():
-            if inst.duration > max_duration:
-                max_duration = inst.duration
-        timer_duration = max_duration*0.1 if max_duration > 1000 else 100
+        self._coalesced = coalesced
+        self._first_switch = first_switch
+        self._epr_state = epr_state
+        #Pending corrections of this switch and received from the left
+        self._own_corrections = []
+        self._left_corrections = []
+        if coalesced and not first_switch:
+            #Messages from the left are not forwarded, they are added to the corrections of this switch
+            self.node.ports[f"ccon_L_{self.node.name}_{request}_{self._index}"].bind_input_handler(self._receive_corrections)
+
+    def reset_corrections(self):
+        '''
+        Discards pending corrections. Used when generation is restarted
+        '''
+        self._own_corrections = []
+        self._left_corrections = []
+
+    def _receive_corrections(self, msg):
+        '''
+        Input handler of the classical port from the left when corrections are coalesced
+        '''
+        self._left_corrections += correction_pairs(msg.items)
+        self._send_corrections()
 
+    def _send_corrections(self):
+        '''
+        Sends to the right the corrections of this switch and the switches at its left, for every pair for
+        which both are available
+        '''
+        while len(self._own_corrections) > 0 and (self._first_switch or len(self._left_corrections) > 0):
+            x_corr, z_corr = self._own_corrections.pop(0)
+            if not self._first_switch:
+                left_x_corr, left_z_corr = self._left_corrections.pop(0)
+                x_corr, z_corr = (x_corr + left_x_corr) % 2, (z_corr + left_z_corr) % 2
+            self.node.ports[f"ccon_R_{self.node.name}_{self._request}_{self._index}"].tx_output(Message([x_corr, z_corr]))
+
+    def run(self):
+        #Expressions awaited in every operation are built once
+        evexpr_qubits = self.await_port_input(self._qmem_input_port_l) & self.await_port_input(self._qmem_input_port_r)
+        evexpr_turn = EventExpression(source=self.node, event_type=self.node.swap_turn(self.name))
+        port_corrections = self.node.ports[f"ccon_R_{self.node.name}_{self._request}_{self._index}"]
         while True:
                     
-            yield (self.await_port_input(self._qmem_input_port_l) &
-                   self.await_port_input(self._qmem_input_port_r))
+            if self._ready_expression is None:
+                yield evexpr_qubits
+            else:
+                #Route protocol signals when links in both sides are ready
+                yield self._ready_expression
 
-            #Add to node queue
-            self.node.add_request(self.name)
+            #Add to node queue. Switch orders qprocessor operations with its scheduling policy
+            self.node.add_request(self.name, self._request)
     
             #More than two requests can arrive at the same time to qprocessor
-            not_serviced = True
-            while not_serviced:
-                
-                if self.name == self.node.get_request('first'): #First in queue, can be serviced   
-
-                    #Check for future removal. We manage qprocessor with FIFO queue
-                    # Perform Bell measurement
-                    #if self.node.qmemory.busy:
-                    #    yield self.await_program(self.node.qmemory)
-
-                    yield self.node.qmemory.execute_program(self._program, qubit_mapping=[self._mem_right, self._mem_left])
-                    #Serviced, remove from queue
-                    self.node.remove_request('first')
-                    not_serviced = False
-                else: #Must wait for other to complete
-                    yield self.await_timer(duration=timer_duration) #Nothing to do, just wait
+            if self.node.get_lane(self.name) is None:
+                #Must wait for others to complete. Switch will signal when this request is serviced
+                yield evexpr_turn
+
+            # Perform Bell measurement
+            lane = self.node.get_lane(self.name)
+            if lane is self.node.qmemory:
+                yield lane.execute_program(self._program, qubit_mapping=[self._mem_right, self._mem_left])
+            else:
+                #Qubits are moved from node memory to the processing unit. Transfer is ideal (no time nor noise)
+                qubits = self.node.qmemory.pop([self._mem_right, self._mem_left], skip_noise=False)
+                lane.put(qubits, [0, 1])
+                yield lane.execute_program(self._program, qubit_mapping=[0, 1])
+            #Serviced, remove from queue
+            self.node.remove_request(self.name)
 
             m, = self._program.output["m"]
-            # Send result to right node on end
-            self.node.ports[f"ccon_R_{self.node.name}_{self._request}_{self._index}"].tx_output(Message(m))
+            if self._coalesced:
+                self._own_corrections.append(bell_corrections(m, self._epr_state))
+                self._send_corrections()
+            else:
+                # Send result to right node on end
+                port_corrections.tx_output(Message(m))
             
 class SwapCorrectProgram(QuantumProgram):
     """Quantum processor program that applies all swap corrections."""
@@ -415,12 +792,21 @@ class CorrectProtocol(NodeProtocol):
         Node this protocol runs on.
     num_nodes : int
         Number of nodes in the repeater chain network.
+    coalesced : bool
+        If True, a single message with the X and Z corrections of all switches is received
+    pauli_frame : bool
+        If True, corrections are not applied with a quantum program but recorded in the node,
+        and applied when the qubit is evaluated
 
     """
-    def __init__(self, node, mempos, num_nodes, name, request,restart_expression,epr_state):
+    def __init__(self, node, mempos, num_nodes, name, request,restart_expression,epr_state,coalesced=False,pauli_frame=False):
         super().__init__(node, name)
         self._mempos = mempos
         self.num_nodes = num_nodes
+        self._coalesced = coalesced
+        self._pauli_frame = pauli_frame
+        #Number of messages with corrections to wait for
+        self._expected_messages = min(1, num_nodes - 2) if coalesced else num_nodes - 2
         self._request = request
         self._epr_state = epr_state
 
@@ -443,16 +829,18 @@ class CorrectProtocol(NodeProtocol):
     def run(self):
         from network import EndNode
         qubit_ready = False
+        port_corrections = self.node.ports[f"ccon_L_{self.node.name}_{self._request}_{self._index}"]
+        #Wait for:
+        #      - a classical signal to arrive (correction) or
+        #      - a qubit to be stored in memory or
+        #      - or a request from main protocol to restart
+        evexpr_input = (self.await_port_input(port_corrections) | \
+            self.await_port_input(self.node.qmemory.ports[f"qin{self._mempos}"]))|\
+            self._restart_expression
         
         while True:
             message = None
-            #Wait for:
-            #      - a classical signal to arrive (correction) or
-            #      - a qubit to be stored in memory or
-            #      - or a request from main protocol to restart
-            expr = yield (self.await_port_input(self.node.ports[f"ccon_L_{self.node.name}_{self._request}_{self._index}"]) | \
-                self.await_port_input(self.node.qmemory.ports[f"qin{self._mempos}"]))|\
-                self._restart_expression
+            expr = yield evexpr_input
 
             if expr.first_term.value:
                 for received_event in expr.triggered_events:
@@ -461,27 +849,32 @@ class CorrectProtocol(NodeProtocol):
                         qubit_ready = True
                     elif isinstance(received_event.source.component,EndNode) == True:
                         #Message is a classical corresponding to corrections
-                        message = self.node.ports[f"ccon_L_{self.node.name}_{self._request}_{self._index}"].rx_input()
+                        message = port_corrections.rx_input()
             
                 if message is not None: 
                     #Port can receive more than one classical message at the same time
-                    for m in message.items:
-                        if self._epr_state == 'PHI_PLUS':
-                            if m == ks.BellIndex.B01 or m == ks.BellIndex.B11:
-                                self._x_corr += 1
-                            if m == ks.BellIndex.B10 or m == ks.BellIndex.B11:
-                                self._z_corr += 1
-                        else:
-                            if m == ks.BellIndex.B10 or m == ks.BellIndex.B00:
-                                self._x_corr += 1
-                            if m == ks.BellIndex.B10 or m == ks.BellIndex.B11:
-                                self._z_corr += 1
-
+                    if self._coalesced:
+                        #Message has the corrections of all switches. Only one pair is corrected at a time
+                        pairs = correction_pairs(message.items)
+                        if len(pairs) != 1:
+                            raise ValueError(f"{self.name}: corrections of {len(pairs)} pairs received at the same time")
+                        self._x_corr += pairs[0][0]
+                        self._z_corr += pairs[0][1]
                         self._counter += 1
+                    else:
+                        for m in message.items:
+                            x_corr, z_corr = bell_corrections(m, self._epr_state)
+                            self._x_corr += x_corr
+                            self._z_corr += z_corr
+
+                            self._counter += 1
                 
                 #When all switches corrections have arrived and also we have a qubit in memory            
-                if self._counter == self.num_nodes - 2 and qubit_ready:
-                    if self._x_corr or self._z_corr:
+                if self._counter == self._expected_messages and qubit_ready:
+                    if self._pauli_frame:
+                        #Corrections of a new pair
+                        self.node.add_pauli_frame(self._mempos, self._x_corr, self._z_corr, reset=True)
+                    elif self._x_corr or self._z_corr:
                         self._program.set_corrections(self._x_corr, self._z_corr)
                         if self.node.qmemory.busy:
                             yield self.await_program(self.node.qmemory)
@@ -617,6 +1010,9 @@ class DistilProtocol(NodeProtocol):
     def _node_do_DEJMPS(self):
         # Perform DEJMPS distillation protocol locally on one node
         pos1, pos2 = self._qmem_positions
+        #Pending corrections (Pauli frame) must be applied before the program
+        self.node.apply_pauli_frame(pos1)
+        self.node.apply_pauli_frame(pos2)
         if self.node.qmemory.busy:
             yield self.await_program(self.node.qmemory)
         # We perform local DEJMPS
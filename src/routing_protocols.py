@@ -7,6 +7,11 @@ from netsquid.util.simtools import sim_time
 from netsquid.qubits import qubitapi as qapi
 from pydynaa import EventExpression, EventType
 from protocols import RouteProtocol
+from statistics import NormalDist
+import numpy as np
+
+#Fidelity recorded for a lost qubit. Different from 0 to avoid later log of 0
+LOST_QUBIT_FIDELITY = 1e-99
 
 class LinkFidelityProtocol(LocalProtocol):
     '''
@@ -37,8 +42,7 @@ class LinkFidelityProtocol(LocalProtocol):
         #transmission delay
         self._delay += 1e9 * float(networkmanager.get_config('links',link,'distance'))/float(networkmanager.get_config('links',link,'photon_speed_fibre'))
         #qsource delay
-        emission_delay = float(networkmanager.get_config('links',link,'source_delay')) \
-                if networkmanager.get_config('links',link,'source_delay') != 'NOT_FOUND' else 0
+        emission_delay = float(networkmanager.get_config('links',link,'source_delay'))
         self._delay += emission_delay
         # We need to ad a little delay so that no false timeouts appear
         self._delay += 100
@@ -56,11 +60,13 @@ class LinkFidelityProtocol(LocalProtocol):
         #Get type of EPR to use
         epr_state = ks.b00 if self._networkmanager.get_config('epr_pair','epr_pair') == 'PHI_PLUS' else ks.b01
 
+        evexpr_link = evexpr_timer | (self.await_port_input(self._portleft) & self.await_port_input(self._portright))
+
         for i in range(self._num_runs):
             #Create timer in order to detect lost qubit
             timer_event = self._schedule_after(self._delay, evtypetimer)
             #Wait for qubits to arrive at both ends or detect a lost qubit
-            evexpr = yield evexpr_timer | (self.await_port_input(self._portleft) & self.await_port_input(self._portright))
+            evexpr = yield evexpr_link
             
             if evexpr.second_term.value: #there are qubits in both ends
                 #Unschedule lost qubit timer
@@ -71,34 +77,44 @@ class LinkFidelityProtocol(LocalProtocol):
                 self.fidelities.append(ns.qubits.fidelity([qubit_a, qubit_b], epr_state, squared=True))
             else:
                 #qubit is lost, we set a fidelity of 0
-                #We set a value different from 0 to avoid later log of 0
-                self.fidelities.append(1e-99)
+                self.fidelities.append(LOST_QUBIT_FIDELITY)
             
             #trigger new fidelity measurement
             trig_origin.subcomponents[f"qsource_{trig_origin.name}_{self._link}_0"].trigger()
 
 class PathFidelityProtocol(LocalProtocol):
 
-    def __init__(self, networkmanager, path, num_runs, purif_rounds= 0, name=None):
+    def __init__(self, networkmanager, path, num_runs, purif_rounds= 0, name=None, stop_rule=None, network=None):
         self._purif_rounds = purif_rounds
         self._num_runs = num_runs
         self._path = path
         self._networkmanager = networkmanager
+        self._stop_rule = stop_rule
+        #Network where path is simulated: complete network or a network with only the path elements
+        self._network = network if network is not None else networkmanager.network
 
         name = name if name else f"PathFidelityEstimator_{path['request']}"
-        super().__init__(nodes=networkmanager.network.nodes, name=name)
+        super().__init__(nodes=self._network.nodes, name=name)
 
         self._ent_request = 'START_ENTANGLEMENT'
         self.add_signal(self._ent_request)
         
         ent_start_expression = self.await_signal(self, self._ent_request)
-        self.add_subprotocol(RouteProtocol(networkmanager,path,ent_start_expression,0))
+        self.add_subprotocol(RouteProtocol(networkmanager,path,ent_start_expression,0,network=self._network))
 
     def set_purif_rounds(self, purif_rounds):
         self._purif_rounds = purif_rounds
         subproto = self.subprotocols[f"RouteProtocol_{self._path['request']}"]
         subproto.set_purif_rounds(purif_rounds)
 
+    def set_stop_rule(self, stop_rule):
+        '''
+        Sets the rule that can end the estimation before num_runs rounds. 
+        Must be an object with an add(fidelity, time) method returning True when no more rounds are needed.
+        Will be used the next time the protocol is started
+        '''
+        self._stop_rule = stop_rule
+
     def run(self):
         self.start_subprotocols()
 
@@ -111,6 +127,11 @@ class PathFidelityProtocol(LocalProtocol):
         mem_posA_1 = self._networkmanager.get_mem_position(self._path['nodes'][0],first_link.split('-')[0],first_link.split('-')[1])
         mem_posB_1 = self._networkmanager.get_mem_position(self._path['nodes'][-1],last_link.split('-')[0],last_link.split('-')[1])
 
+        #Nodes and expressions used in every round are resolved once
+        nodeA = self._network.get_node(self._path['nodes'][0])
+        nodeB = self._network.get_node(self._path['nodes'][-1])
+        evexpr_route = self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
+
         for i in range(self._num_runs):
             start_time = sim_time()
 
@@ -118,11 +139,13 @@ class PathFidelityProtocol(LocalProtocol):
             self.send_signal(self._ent_request)
 
             #Wait for  entanglement to be generated on both ends
-            yield self.await_signal(self.subprotocols[f"RouteProtocol_{self._path['request']}"],Signals.SUCCESS)
+            yield evexpr_route
 
             #Measure fidelity and send metrics to datacollector
-            qa, = self._networkmanager.network.get_node(self._path['nodes'][0]).qmemory.pop(positions=[mem_posA_1])
-            qb, = self._networkmanager.network.get_node(self._path['nodes'][-1]).qmemory.pop(positions=[mem_posB_1])
+            nodeA.apply_pauli_frame(mem_posA_1)
+            nodeB.apply_pauli_frame(mem_posB_1)
+            qa, = nodeA.qmemory.pop(positions=[mem_posA_1])
+            qb, = nodeB.qmemory.pop(positions=[mem_posB_1])
             fid = qapi.fidelity([qa, qb], epr_state, squared=True)
             result = {
                 'posA': mem_posA_1,
@@ -132,4 +155,65 @@ class PathFidelityProtocol(LocalProtocol):
             }
             #send result to datacollector
             self.send_signal(Signals.SUCCESS, result)
+
+            #Stop if the result of the estimation is already known
+            if self._stop_rule is not None and self._stop_rule.add(fid, result['time']):
+                break
+
+class SequentialTest():
+    '''
+    Stopping rule for path fidelity estimation based on confidence bounds.
+    After each simulated round, confidence intervals for the mean fidelity and mean time are
+    calculated. Estimation can stop when the decision is known:
+        - reject: time is above maxtime
+        - accept: time is below maxtime and fidelity above minfidelity
+        - purify: time is below maxtime and fidelity below minfidelity
+    The error rate is divided among all the possible checks (Bonferroni), so the probability
+    of a wrong early decision is below error_rate.
+    Parameters:
+        - minfidelity: minimum fidelity of the request
+        - maxtime: maximum time of the request
+        - num_runs: maximum number of rounds that will be simulated
+        - error_rate: probability of a wrong decision
+        - min_rounds: minimum number of rounds before stopping
+    '''
+
+    def __init__(self, minfidelity, maxtime, num_runs, error_rate=0.05, min_rounds=30):
+        self._minfidelity = minfidelity
+        self._maxtime = maxtime
+        self._min_rounds = min_rounds
+        num_checks = max(num_runs - min_rounds + 1, 1)
+        self._z = NormalDist().inv_cdf(1 - error_rate / (2 * num_checks))
+        self._fidelities = []
+        self._times = []
+
+    def add(self, fidelity, time):
+        '''
+        Adds result of a round. Returns True if the decision is known
+        '''
+        self._fidelities.append(fidelity)
+        self._times.append(time)
+        return(self.decided())
+
+    def decided(self):
+        '''
+        Returns True if the decision is known with the configured error rate
+        '''
+        num_rounds = len(self._fidelities)
+        if num_rounds < max(self._min_rounds, 2):
+            return(False)
+        
+        fid_mean = np.mean(self._fidelities)
+        fid_margin = self._z * np.std(self._fidelities, ddof=1) / np.sqrt(num_rounds)
+        time_mean = np.mean(self._times)
+        time_margin = self._z * np.std(self._times, ddof=1) / np.sqrt(num_rounds)
+
+        if time_mean - time_margin > self._maxtime:
+            #Rejected
+            return(True)
+        if time_mean + time_margin <= self._maxtime and \
+            (fid_mean - fid_margin >= self._minfidelity or fid_mean + fid_margin < self._minfidelity):
+            #Accepted or purification needed
+            return(True)
+        return(False)
             
@@ -0,0 +1,111 @@
+import heapq
+from abc import ABC, abstractmethod
+from collections import deque
+
+'''
+Scheduling policies of the swap operations waiting for the quantum processor of a switch.
+Operations are identified by the name of the requestor protocol and belong to a request, whose
+configuration parameters (priority, maxtime, weight) are used by the policy.
+'''
+
+#Available policies (node property swap_scheduler)
+SWAP_SCHEDULERS = ['fifo','priority','edf','wfq']
+
+class FifoScheduler():
+    '''
+    Operations are serviced in arrival order
+    '''
+    def __init__(self, requests):
+        self._requests = requests
+        self._queue = deque()
+
+    def __len__(self):
+        return(len(self._queue))
+
+    def push(self, operation, request, arrival):
+        '''
+        Adds an operation to the queue
+        Input:
+            - operation: name of the requestor protocol
+            - request: name of the request the operation belongs to
+            - arrival: simulation time of arrival (nanoseconds)
+        '''
+        self._queue.append(operation)
+
+    def pop(self):
+        '''
+        Removes and returns the next operation to service
+        '''
+        return(self._queue.popleft())
+
+class _HeapScheduler(FifoScheduler, ABC):
+    '''
+    Operations are serviced by increasing key. Operations with the same key in arrival order.
+    Subclasses define the key of the policy
+    '''
+    def __init__(self, requests):
+        super().__init__(requests)
+        self._queue = []
+        self._arrivals = 0
+
+    @abstractmethod
+    def _key(self, request, arrival):
+        '''
+        Returns the key of an operation of the request arrived at the given time
+        '''
+
+    def push(self, operation, request, arrival):
+        heapq.heappush(self._queue, (self._key(request, arrival), self._arrivals, operation))
+        self._arrivals += 1
+
+    def pop(self):
+        return(heapq.heappop(self._queue)[2])
+
+class PriorityScheduler(_HeapScheduler):
+    '''
+    Operations of requests with higher priority are serviced first
+    '''
+    def _key(self, request, arrival):
+        return(-self._requests.get(request, {}).get('priority', 0))
+
+class EdfScheduler(_HeapScheduler):
+    '''
+    Earliest deadline first. Deadline of an operation is its arrival time plus the maxtime of the request
+    '''
+    def _key(self, request, arrival):
+        return(arrival + self._requests.get(request, {}).get('maxtime', float('inf')))
+
+class WfqScheduler(_HeapScheduler):
+    '''
+    Weighted fair queueing among requests. Every swap is considered a unit of service, so that
+    each request gets a share of the processor proportional to its weight
+    '''
+    def __init__(self, requests):
+        super().__init__(requests)
+        self._virtual_time = 0
+        self._last_finish = {}
+
+    def _key(self, request, arrival):
+        finish = max(self._virtual_time, self._last_finish.get(request, 0)) + \
+            1 / float(self._requests.get(request, {}).get('weight', 1))
+        self._last_finish[request] = finish
+        return(finish)
+
+    def pop(self):
+        finish, arrival, operation = heapq.heappop(self._queue)
+        self._virtual_time = finish
+        return(operation)
+
+def create_scheduler(policy, requests):
+    '''
+    Creates the scheduler of a switch
+    Input:
+        - policy: scheduling policy (fifo|priority|edf|wfq)
+        - requests: dictionary with the configuration parameters of each request
+    Output:
+        - instance of the scheduler
+    '''
+    schedulers = {'fifo': FifoScheduler, 'priority': PriorityScheduler, 'edf': EdfScheduler, 'wfq': WfqScheduler}
+    if policy not in schedulers:
+        raise ValueError(f"Unsupported swap scheduler {policy}")
+    return(schedulers[policy](requests))
@@ -7,6 +7,15 @@ from netsquid.util.datacollector import DataCollector
 from netsquid.protocols import Signals
 import pydynaa
 from matplotlib import pyplot as plt
+import networkx as nx
+import hashlib
+import multiprocessing
+
+#Above this number of nodes topology is rendered with sfdp instead of fdp
+RENDER_FAST_LAYOUT_NODES = 100
+
+#Topology renders being executed in background, by topology hash
+_render_workers = {}
 
 
 def generate_report(report_info, simulation_data, simul_environ):
@@ -264,6 +273,92 @@ def generate_report(report_info, simulation_data, simul_environ):
             except:
                 pass
 
+def topology_hash(graph):
+    '''
+    Calculates a hash identifying the topology of the network graph: nodes, their
+    style attributes and edges. Link costs are not included.
+    Input:
+        - graph: networkx graph
+    Output:
+        - string with the hexadecimal hash
+    '''
+    nodes = sorted((str(node), str(sorted(props.items()))) for node, props in graph.nodes(data=True))
+    edges = sorted(tuple(sorted([str(node1), str(node2)])) for node1, node2 in graph.edges())
+    return(hashlib.sha1(repr((nodes, edges)).encode()).hexdigest())
+
+def _draw_topology(dot, image_file, prog, topology):
+    '''
+    Draws graph in dot format into image file and stores the topology hash next to it.
+    Executed in a worker process when rendering in background
+    '''
+    import pygraphviz as pgv
+    pgv.AGraph(string=dot).draw(image_file, prog=prog)
+    with open(image_file + '.hash', 'w') as hash_file:
+        hash_file.write(topology)
+
+def _draw_topology_worker(dot, image_file, prog, topology, sender):
+    '''
+    Entry point of background renders. Sends the error of a failed render to the main process,
+    that raises it when the render is waited for
+    '''
+    try:
+        _draw_topology(dot, image_file, prog, topology)
+        sender.send(None)
+    except Exception as error:
+        sender.send(f"{type(error).__name__}: {error}")
+    finally:
+        sender.close()
+
+def render_topology(graph, image_file='./output/graf.png', background=True):
+    '''
+    Renders network topology to an image file.
+    Rendering is skipped if the image file already holds a render of the same topology or if
+    a render of the same topology is in progress. For large topologies (more than 
+    RENDER_FAST_LAYOUT_NODES nodes) the faster sfdp layout engine is used instead of fdp.
+    Input:
+        - graph: networkx graph
+        - image_file: destination file
+        - background: if True, render is done in a worker process. Use wait_topology_render
+            to wait for it to finish
+    '''
+    topology = topology_hash(graph)
+    if topology in _render_workers:
+        return
+    try:
+        with open(image_file + '.hash','r') as hash_file:
+            if hash_file.read() == topology and os.path.exists(image_file):
+                return
+    except OSError:
+        pass
+
+    prog = 'fdp' if graph.number_of_nodes() <= RENDER_FAST_LAYOUT_NODES else 'sfdp'
+    dot = nx.nx_agraph.to_agraph(graph).to_string()
+    if background:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.Process(target=_draw_topology_worker, args=(dot, image_file, prog, topology, sender), daemon=True)
+        worker.start()
+        sender.close()
+        _render_workers[topology] = (worker, receiver, image_file)
+    else:
+        _draw_topology(dot, image_file, prog, topology)
+
+def wait_topology_render():
+    '''
+    Waits for topology renders being executed in background.
+    Raises ValueError if a render failed
+    '''
+    for topology in list(_render_workers.keys()):
+        worker, receiver, image_file = _render_workers.pop(topology)
+        worker.join()
+        try:
+            error = receiver.recv()
+        except EOFError:
+            #Worker ended without reporting
+            error = f"render process exited with code {worker.exitcode}"
+        receiver.close()
+        if error is not None:
+            raise ValueError(f"Topology render to {image_file} failed: {error}")
+
 def dc_setup(protocol):
         '''
         Creates a data collector in order to measure fidelity of E2E entanglement
@@ -299,6 +394,53 @@ def validate_conf(config):
                     or 'epr_pair' not in config.keys() or 'simulation_duration' not in config.keys(): 
             raise ValueError('Invalid configuration file, check global parameters')
 
+        #Check optional global parameters
+        if 'render_topology' in config.keys() and config['render_topology'] not in ['background','foreground','none']:
+            raise ValueError('Invalid configuration file, render_topology can only be background, foreground or none')
+        if 'path_fidel_test' in config.keys() and config['path_fidel_test'] not in ['fixed','sequential']:
+            raise ValueError('Invalid configuration file, path_fidel_test can only be fixed or sequential')
+        if 'purification_planner' in config.keys() and config['purification_planner'] not in ['none','analytic']:
+            raise ValueError('Invalid configuration file, purification_planner can only be none or analytic')
+        if 'path_subnetwork' in config.keys() and not isinstance(config['path_subnetwork'],bool):
+            raise ValueError('Invalid configuration file, path_subnetwork must be a boolean')
+        if 'path_engine' in config.keys() and config['path_engine'] not in ['netsquid','analytic']:
+            raise ValueError('Invalid configuration file, path_engine can only be netsquid or analytic')
+        if 'restart_policy' in config.keys() and config['restart_policy'] not in ['end_to_end','per_link']:
+            raise ValueError('Invalid configuration file, restart_policy can only be end_to_end or per_link')
+        if 'multiplexing' in config.keys() and \
+            (not isinstance(config['multiplexing'],int) or config['multiplexing'] < 1):
+            raise ValueError('Invalid configuration file, multiplexing must be a positive integer')
+        if config.get('multiplexing',1) > 1 and config.get('restart_policy','end_to_end') != 'per_link':
+            raise ValueError('Invalid configuration file, multiplexing needs restart_policy per_link')
+        if 'classical_forwarding' in config.keys() and config['classical_forwarding'] not in ['per_hop','table']:
+            raise ValueError('Invalid configuration file, classical_forwarding can only be per_hop or table')
+        if 'correction_messages' in config.keys() and config['correction_messages'] not in ['per_switch','coalesced']:
+            raise ValueError('Invalid configuration file, correction_messages can only be per_switch or coalesced')
+        if 'correction_mode' in config.keys() and config['correction_mode'] not in ['physical','pauli_frame']:
+            raise ValueError('Invalid configuration file, correction_mode can only be physical or pauli_frame')
+        if 'admission' in config.keys() and config['admission'] not in ['greedy','batch']:
+            raise ValueError('Invalid configuration file, admission can only be greedy or batch')
+        if 'admission_workers' in config.keys() and \
+            (not isinstance(config['admission_workers'],int) or config['admission_workers'] < 1):
+            raise ValueError('Invalid configuration file, admission_workers must be a positive integer')
+        if 'path_fidel_workers' in config.keys() and \
+            (not isinstance(config['path_fidel_workers'],int) or config['path_fidel_workers'] < 1):
+            raise ValueError('Invalid configuration file, path_fidel_workers must be a positive integer')
+        if 'purification_speculation' in config.keys() and \
+            (not isinstance(config['purification_speculation'],int) or config['purification_speculation'] < 0):
+            raise ValueError('Invalid configuration file, purification_speculation must be a non negative integer')
+        if 'routing_candidates' in config.keys() and \
+            (not isinstance(config['routing_candidates'],int) or config['routing_candidates'] < 1):
+            raise ValueError('Invalid configuration file, routing_candidates must be a positive integer')
+        if 'path_cache' in config.keys() and config['path_cache'] not in ['none','memory','persistent']:
+            raise ValueError('Invalid configuration file, path_cache can only be none, memory or persistent')
+        if 'path_fidel_error_rate' in config.keys() and \
+            (not isinstance(config['path_fidel_error_rate'],float) or config['path_fidel_error_rate'] <= 0 or config['path_fidel_error_rate'] >= 1):
+            raise ValueError('Invalid configuration file, path_fidel_error_rate must be between 0 and 1')
+        if 'path_fidel_min_rounds' in config.keys() and \
+            (not isinstance(config['path_fidel_min_rounds'],int) or config['path_fidel_min_rounds'] < 2):
+            raise ValueError('Invalid configuration file, path_fidel_min_rounds must be an integer greater than 1')
+
         #Check link sintax
         links = config['links']
             
@@ -489,7 +631,9 @@ def validate_conf(config):
                                't2_mem_time':'float',
                                'teleport_queue_size':'integer',
                                'teleport_queue_technology':'string',
-                               'teleport_strategy':'string'}
+                               'teleport_strategy':'string',
+                               'swap_scheduler':'string',
+                               'processing_units':'integer'}
         
         for node in config['nodes']:
             node_props = list(node.values())[0]
@@ -591,6 +735,14 @@ def validate_conf(config):
                 and node_props['teleport_strategy'] not in allowed_teleport_strategies:
                 raise ValueError(f"node {node_name}: Unsupported teleportation strategy")
 
+            #Check allowed values of swap scheduling policy
+            if 'swap_scheduler' in node_props.keys() \
+                and node_props['swap_scheduler'] not in ['fifo','priority','edf','wfq']:
+                raise ValueError(f"node {node_name}: Unsupported swap scheduler")
+            if 'processing_units' in node_props.keys() and \
+                (node_props['type'] != 'switch' or node_props['processing_units'] < 1):
+                raise ValueError(f"node {node_name}: processing_units must be at least 1 and can only be defined in switches")
+
             #Check that in switch nodes we have > 2*num_links
             if node_props['type'] == 'endNode' and 'num_memories' in node_props.keys() and \
                 node_props['num_memories'] != 4:
@@ -622,7 +774,11 @@ def validate_conf(config):
             'application': 'string',
             'teleport': 'list',
             'qber_states': 'list',
-            'demand_rate': 'float'}
+            'demand_rate': 'float',
+            'utility': 'float',
+            'priority': 'integer',
+            'multiplexing': 'integer',
+            'weight': 'float'}
         
         #Check if a node is in more than one request
         #No need to do so, if this happens, the second request will indicate that no resources are available
@@ -671,6 +827,16 @@ def validate_conf(config):
                             raise ValueError(f"request {request_name} {prop} must be of {available_props[prop]} type but is {type(prop)}")
                 else:
                     raise ValueError(f"request {request_name}: incorrect type for {prop}, it is {type(prop)}")
+
+            if 'multiplexing' in request_props.keys():
+                if request_props['multiplexing'] < 1:
+                    raise ValueError(f"request {request_name}: multiplexing must be at least 1")
+                if request_props['multiplexing'] > 1 and config.get('restart_policy','end_to_end') != 'per_link':
+                    raise ValueError(f"request {request_name}: multiplexing needs restart_policy per_link")
+
+            #Weight is used as divisor by weighted fair queueing
+            if 'weight' in request_props.keys() and float(request_props['weight']) <= 0:
+                raise ValueError(f"request {request_name}: weight must be greater than 0")
             
             #Check for definition of mandatory properties
             mandatory = ['origin','destination','minfidelity','maxtime','application']
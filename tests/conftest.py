@@ -0,0 +1,5 @@
+import os
+import sys
+
+#Modules in src are imported by name, as when programs are run from that directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
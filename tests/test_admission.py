@@ -0,0 +1,37 @@
+from admission import plan_admission, _greedy_plan, _exact_plan
+
+def test_capacity_limit():
+    #Both requests need the only instance of link l1, the second one can use l2 instead
+    options = [[{'l1': 1}], [{'l1': 1}, {'l2': 1, 'l3': 1}]]
+    plan = plan_admission(options, [1, 1], {'l1': 1, 'l2': 1, 'l3': 1})
+    assert plan == [0, 1]
+
+def test_request_rejected_without_capacity():
+    #Purification needs two instances, only one is available
+    options = [[{'l1': 1}], [{'l1': 2}]]
+    assert plan_admission(options, [1, 1], {'l1': 2}) == [0, None]
+    assert plan_admission(options, [1, 1], {'l1': 3}) == [0, 0]
+
+def test_priority_order():
+    #Only one request fits, the one with higher utility is admitted
+    options = [[{'l1': 1}], [{'l1': 1}]]
+    assert plan_admission(options, [1, 2], {'l1': 1}) == [None, 0]
+    #Same utility: configuration order
+    assert plan_admission(options, [1, 1], {'l1': 1}) == [0, None]
+
+def test_fewer_instances_for_same_utility():
+    options = [[{'l1': 2, 'l2': 2}, {'l3': 1}]]
+    assert plan_admission(options, [1], {'l1': 2, 'l2': 2, 'l3': 1}) == [1]
+
+def test_greedy_priority_and_capacity():
+    options = [[{'l1': 1}], [{'l1': 1}], [{'l1': 1}, {'l2': 1}]]
+    assert _greedy_plan(options, [1, 3, 2], {'l1': 1, 'l2': 1}) == [None, 0, 1]
+    assert _exact_plan(options, [1, 3, 2], {'l1': 1, 'l2': 1}) == [None, 0, 1]
+
+def test_capacity_not_modified():
+    capacity = {'l1': 1}
+    plan_admission([[{'l1': 1}]], [1], capacity)
+    assert capacity == {'l1': 1}
+
+def test_requests_without_candidates():
+    assert plan_admission([[], [{'l1': 1}]], [5, 1], {'l1': 1}) == [None, 0]
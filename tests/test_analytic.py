@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from analytic import werner_state, source_state, swap_states, swapped_fidelity, dejmps_step, _distil, apply_noise
+
+FIDELITIES = [0.6, 0.75, 0.9, 0.99, 1]
+
+def werner_parameter(fidelity):
+    return((4*fidelity - 1)/3)
+
+@pytest.mark.parametrize('fidelity', FIDELITIES)
+def test_source_state_is_werner(fidelity):
+    #EPR with probability F, maximally mixed state otherwise: Werner parameter F
+    state = source_state(fidelity)
+    assert np.isclose(state.sum(), 1)
+    assert np.allclose(state, werner_state((1 + 3*fidelity)/4))
+    assert np.isclose(werner_parameter(state[0]), fidelity)
+
+@pytest.mark.parametrize('fidelity1', FIDELITIES)
+@pytest.mark.parametrize('fidelity2', FIDELITIES)
+def test_swap_of_werner_states(fidelity1, fidelity2):
+    #Werner parameters are multiplied: F = F1 F2 + (1 - F1)(1 - F2)/3
+    state = swap_states(werner_state(fidelity1), werner_state(fidelity2))
+    expected = fidelity1*fidelity2 + (1 - fidelity1)*(1 - fidelity2)/3
+    assert np.allclose(state, werner_state(expected))
+    assert np.isclose(state[0], swapped_fidelity([fidelity1, fidelity2]))
+
+def test_swap_composes_pauli_errors():
+    #X and Z errors compose into Y
+    assert np.allclose(swap_states(np.array([0, 1, 0, 0]), np.array([0, 0, 0, 1])), [0, 0, 1, 0])
+
+@pytest.mark.parametrize('fidelity', FIDELITIES)
+def test_distil_of_werner_states(fidelity):
+    #DEJMPS of two Werner pairs: success F^2 + 2F(1-F)/3 + 5((1-F)/3)^2, fidelity (F^2 + ((1-F)/3)^2) / success
+    model = {'distil': [(None, 0), (None, 0)]}
+    state, success = _distil(werner_state(fidelity), werner_state(fidelity), model)
+    expected_success = fidelity**2 + 2*fidelity*(1 - fidelity)/3 + 5*((1 - fidelity)/3)**2
+    assert np.isclose(success, expected_success)
+    assert np.isclose(state[0], (fidelity**2 + ((1 - fidelity)/3)**2) / expected_success)
+    assert np.isclose(state.sum(), 1)
+    expected_state, expected_success = dejmps_step(werner_state(fidelity), werner_state(fidelity))
+    assert np.allclose(state, expected_state) and np.isclose(success, expected_success)
+
+def test_distil_with_gate_noise():
+    #Depolarizing each pair in both end nodes with probability p multiplies its Werner parameter by (1-p)^2
+    fidelity, prob = 0.9, 0.1
+    model = {'distil': [(('depolar_prob', prob), 0), (('depolar_prob', prob), 0)]}
+    noisy = (1 + 3*werner_parameter(fidelity)*(1 - prob)**2)/4
+    state, success = _distil(werner_state(fidelity), werner_state(fidelity), model)
+    expected_state, expected_success = dejmps_step(werner_state(noisy), werner_state(noisy))
+    assert np.allclose(state, expected_state)
+    assert np.isclose(success, expected_success)
+
+def test_noise_of_one_qubit():
+    state = np.array([0.7, 0.1, 0.05, 0.15])
+    assert np.allclose(apply_noise(state, ('depolar_prob', 1)), [0.25] * 4)
+    #Dephasing with probability p applies Z (I <-> Z, X <-> Y) with probability p. Rate in Hz, duration in ns
+    prob = 1 - np.exp(-1)
+    assert np.allclose(apply_noise(state, ('dephase', 1e3), 1e6), (1 - prob)*state + prob*state[[3, 2, 1, 0]])
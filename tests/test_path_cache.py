@@ -0,0 +1,71 @@
+import os
+import pytest
+import path_cache
+from path_cache import PathResultCache, parameters_hash
+
+LINK = {'end1': 'node1', 'end2': 'switch1', 'distance': 10, 'source_fidelity_sq': 0.99}
+NODE = {'type': 'switch', 'gate_duration': 100}
+RESULT = {'mean_fidelity': 0.9, 'std_fidelity': 0.01, 'mean_time': 1000, 'std_time': 50, 'samples': 100}
+
+def signature(link, node, purif_rounds=0):
+    #Built as NetworkManager._path_signature does: hashes of element parameters and estimation options
+    return(parameters_hash({'path': [parameters_hash(link), True, parameters_hash(node), purif_rounds, 'PHI_PLUS', 100]}))
+
+@pytest.fixture(autouse=True)
+def empty_memory_store(monkeypatch):
+    monkeypatch.setattr(path_cache, '_memory_store', {})
+
+def test_parameters_hash_independent_of_key_order():
+    assert parameters_hash({'a': 1, 'b': 2}) == parameters_hash({'b': 2, 'a': 1})
+    assert parameters_hash({'a': 1, 'b': 2}) != parameters_hash({'a': 1, 'b': 3})
+
+def test_signature_changes_with_parameters():
+    assert signature(LINK, NODE) == signature(dict(LINK), dict(NODE))
+    assert signature(LINK, NODE) != signature(dict(LINK, distance=20), NODE)
+    assert signature(LINK, NODE) != signature(LINK, dict(NODE, gate_duration=200))
+    assert signature(LINK, NODE) != signature(LINK, NODE, purif_rounds=1)
+
+@pytest.mark.parametrize('backend', ['memory', 'persistent'])
+def test_round_trip(tmp_path, backend):
+    cache = PathResultCache(backend, str(tmp_path / 'path_cache'))
+    cache.put(signature(LINK, NODE), RESULT)
+
+    assert cache.get(signature(LINK, NODE)) == RESULT
+    assert cache.get(signature(dict(LINK, distance=20), NODE)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_persistent_results_shared_between_caches(tmp_path):
+    file = str(tmp_path / 'path_cache')
+    PathResultCache('persistent', file).put(signature(LINK, NODE), RESULT)
+
+    cache = PathResultCache('persistent', file)
+    assert cache.get(signature(LINK, NODE)) == RESULT
+    assert cache.hits == 1
+
+def test_persistent_lookup_without_file_is_miss(tmp_path):
+    cache = PathResultCache('persistent', str(tmp_path / 'path_cache'))
+    assert cache.get(signature(LINK, NODE)) is None
+    assert cache.misses == 1
+    #Lookups are read only, they do not create the file
+    assert os.listdir(tmp_path) == []
+
+@pytest.mark.parametrize('backend', ['memory', 'persistent'])
+def test_deferred_write_back(tmp_path, backend):
+    file = str(tmp_path / 'path_cache')
+    worker = PathResultCache(backend, file, deferred=True)
+    worker.put(signature(LINK, NODE), RESULT)
+
+    #Deferred results are only kept in pending
+    assert worker.pending == {signature(LINK, NODE): RESULT}
+    assert worker.get(signature(LINK, NODE)) is None
+
+    #Results are stored by the manager that receives them, as in NetworkManager._merge_worker_cache
+    manager = PathResultCache(backend, file)
+    for key, result in worker.pending.items():
+        manager.put(key, result)
+    assert manager.get(signature(LINK, NODE)) == RESULT
+    assert PathResultCache(backend, file).get(signature(LINK, NODE)) == RESULT
+
+def test_unsupported_backend():
+    with pytest.raises(ValueError):
+        PathResultCache('redis')
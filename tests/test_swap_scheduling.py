@@ -0,0 +1,62 @@
+import pytest
+from swap_scheduling import create_scheduler, _HeapScheduler, SWAP_SCHEDULERS
+
+REQUESTS = {'request1': {'priority': 1, 'maxtime': 5000, 'weight': 2},
+            'request2': {'priority': 2, 'maxtime': 1000, 'weight': 1},
+            'request3': {}}
+
+def service_order(policy, arrivals):
+    '''
+    Pushes operations (name, request, arrival) and pops them all
+    '''
+    scheduler = create_scheduler(policy, REQUESTS)
+    for operation, request, arrival in arrivals:
+        scheduler.push(operation, request, arrival)
+    assert len(scheduler) == len(arrivals)
+    return([scheduler.pop() for operation in arrivals])
+
+ARRIVALS = [('op1', 'request1', 0), ('op2', 'request2', 10), ('op3', 'request3', 20), ('op4', 'request1', 30)]
+
+def test_fifo():
+    assert service_order('fifo', ARRIVALS) == ['op1', 'op2', 'op3', 'op4']
+
+def test_priority():
+    #Higher priority first, default priority 0, arrival order for the same priority
+    assert service_order('priority', ARRIVALS) == ['op2', 'op1', 'op4', 'op3']
+
+def test_edf():
+    #Deadlines: op1 5000, op2 1010, op3 no deadline, op4 5030
+    assert service_order('edf', ARRIVALS) == ['op2', 'op1', 'op4', 'op3']
+
+def test_edf_same_deadline_in_arrival_order():
+    arrivals = [('op1', 'request2', 100), ('op2', 'request2', 100)]
+    assert service_order('edf', arrivals) == ['op1', 'op2']
+
+def test_wfq_share_proportional_to_weight():
+    #request1 (weight 2) gets two swaps for each swap of request2 (weight 1)
+    arrivals = []
+    for position in range(4):
+        arrivals += [(f"a{position}", 'request1', 0), (f"b{position}", 'request2', 0)]
+    order = service_order('wfq', arrivals)
+    assert order[:6] == ['a0', 'b0', 'a1', 'a2', 'b1', 'a3']
+
+def test_wfq_late_request_starts_at_virtual_time():
+    scheduler = create_scheduler('wfq', REQUESTS)
+    for position in range(3):
+        scheduler.push(f"b{position}", 'request2', 0)
+    assert scheduler.pop() == 'b0'
+    assert scheduler.pop() == 'b1'
+    #A request arriving now does not get the service it did not ask for in the past
+    scheduler.push('c0', 'request3', 0)
+    scheduler.push('c1', 'request3', 0)
+    assert [scheduler.pop() for position in range(3)] == ['b2', 'c0', 'c1']
+
+def test_heap_scheduler_is_abstract():
+    with pytest.raises(TypeError):
+        _HeapScheduler(REQUESTS)
+
+def test_all_policies_available():
+    for policy in SWAP_SCHEDULERS:
+        assert len(create_scheduler(policy, REQUESTS)) == 0
+    with pytest.raises(ValueError):
+        create_scheduler('lifo', REQUESTS)